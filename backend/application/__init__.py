@@ -1,33 +1,36 @@
+"""
+E-commerce backend.
+
+Importing the package creates no connection and reads no settings; build an
+application with create_app(), passing settings that override the
+environment, e.g. create_app({"MONGO_DATABASE": "e-commerce-test"}).
+"""
+from typing import Any, Dict, Optional
+
 from flask import Flask
 from flask_cors import CORS
-from pymongo import MongoClient
-from dotenv import load_dotenv
-from os import environ
-
-import sys
-import os
 
-sys.path.append(os.getcwd())
+from application.config import load_config
+from application.extensions import EXTENSION, Extensions, db, metrics, mongo, slow_queries
 
-load_dotenv()
 
-app = Flask(__name__)
-CORS(app)
+def create_app(config: Optional[Dict[str, Any]] = None) -> Flask:
+    """
+    Build the Flask application with its own extensions.
 
-app.config["SECRET_KEY"] = environ.get("SECRET_KEY")
-app.config["MONGO_URI"] = environ.get("MONGO_URI")
-app.config["MAIL_SERVER"] = environ.get("MAIL_SERVER")
-app.config["MAIL_PORT"] = environ.get("MAIL_PORT")
-app.config["MAIL_USERNAME"] = environ.get("MAIL_USERNAME")
-app.config["MAIL_PASSWORD"] = environ.get("MAIL_PASSWORD")
-app.config["MAIL_USE_TLS"] = True
-app.config["MAIL_USE_SSL"] = False
+    Extensions are bound lazily: MongoDB is contacted on the first query and
+    SMTP when the first email is delivered, so creating an app is cheap.
+    """
+    app = Flask(__name__)
+    app.config.update(load_config())
+    if config:
+        app.config.update(config)
 
-client = MongoClient(app.config["MONGO_URI"], connect=False)
-db = client["e-commerce"]
-products = db["products"]
+    CORS(app, resources={r"/*": {"origins": "*", "methods": ["POST", "GET", "OPTIONS"]}}, expose_headers=["X-Next-Cursor", "ETag"])
 
-CORS(app, resources={r"/*": {"origins": "*", "methods": ["POST", "GET", "OPTIONS"]}})
+    app.extensions[EXTENSION] = Extensions(app)
 
+    from application.routes import api
+    app.register_blueprint(api)
 
-from application.routes import *
+    return app
@@ -0,0 +1,62 @@
+"""
+Application configuration read from the environment (and a .env file)
+"""
+from os import environ
+from typing import Any, Dict
+
+from dotenv import load_dotenv
+
+
+def load_config() -> Dict[str, Any]:
+    """Settings from the environment, with defaults; create_app() applies overrides on top"""
+    load_dotenv()
+    return {
+        "SECRET_KEY": environ.get("SECRET_KEY"),
+        "MONGO_URI": environ.get("MONGO_URI"),
+        "MONGO_DATABASE": environ.get("MONGO_DATABASE", "e-commerce"),
+        "MAIL_SERVER": environ.get("MAIL_SERVER"),
+        "MAIL_PORT": environ.get("MAIL_PORT"),
+        "MAIL_USERNAME": environ.get("MAIL_USERNAME"),
+        "MAIL_PASSWORD": environ.get("MAIL_PASSWORD"),
+        "MAIL_USE_TLS": True,
+        "MAIL_USE_SSL": False,
+        "MAIL_QUEUE_EMBEDDED": environ.get("MAIL_QUEUE_EMBEDDED", "true").lower() == "true",
+        "MAIL_QUEUE_WORKERS": int(environ.get("MAIL_QUEUE_WORKERS", 2)),
+        "MAIL_QUEUE_MAX_ATTEMPTS": int(environ.get("MAIL_QUEUE_MAX_ATTEMPTS", 5)),
+        "MAIL_QUEUE_BACKOFF": float(environ.get("MAIL_QUEUE_BACKOFF", 30)),
+        "MAIL_QUEUE_MAX_BACKOFF": float(environ.get("MAIL_QUEUE_MAX_BACKOFF", 3600)),
+        "MAIL_QUEUE_LEASE": float(environ.get("MAIL_QUEUE_LEASE", 120)),
+        "MAIL_QUEUE_POLL_INTERVAL": float(environ.get("MAIL_QUEUE_POLL_INTERVAL", 1)),
+        "CONFIRMATION_TOKEN_TTL_HOURS": float(environ.get("CONFIRMATION_TOKEN_TTL_HOURS", 24)),
+        "UNCONFIRMED_ACCOUNT_TTL_HOURS": float(environ.get("UNCONFIRMED_ACCOUNT_TTL_HOURS", 72)),
+        "CONFIRMATION_RESEND_INTERVAL_MINUTES": float(environ.get("CONFIRMATION_RESEND_INTERVAL_MINUTES", 5)),
+        "PASSWORD_HASH_METHOD": environ.get("PASSWORD_HASH_METHOD", "scrypt:32768:8:1"),
+        "PASSWORD_HASH_WORKERS": int(environ.get("PASSWORD_HASH_WORKERS", 2)),
+        "PASSWORD_HASH_QUEUE_LIMIT": int(environ.get("PASSWORD_HASH_QUEUE_LIMIT", 8)),
+        "PASSWORD_HASH_TIMEOUT": float(environ.get("PASSWORD_HASH_TIMEOUT", 10)),
+        "CATALOG_CACHE_TTL": int(environ.get("CATALOG_CACHE_TTL", 60)),
+        "CATALOG_CACHE_MAX_BYTES": int(environ.get("CATALOG_CACHE_MAX_BYTES", 32 * 1024 * 1024)),
+        "EXPORT_BATCH_SIZE": int(environ.get("EXPORT_BATCH_SIZE", 1000)),
+        "BULK_BATCH_SIZE": int(environ.get("BULK_BATCH_SIZE", 1000)),
+        "CATALOG_VERSION_TTL": float(environ.get("CATALOG_VERSION_TTL", 2)),
+        "USER_CACHE_TTL": float(environ.get("USER_CACHE_TTL", 30)),
+        "USER_CACHE_MAX_ENTRIES": int(environ.get("USER_CACHE_MAX_ENTRIES", 10000)),
+        "WRITE_BEHIND_INTERVAL_MS": float(environ.get("WRITE_BEHIND_INTERVAL_MS", 500)),
+        "WRITE_BEHIND_MAX_ENTRIES": int(environ.get("WRITE_BEHIND_MAX_ENTRIES", 1000)),
+        "MONGO_MAX_POOL_SIZE": int(environ.get("MONGO_MAX_POOL_SIZE", 100)),
+        "MONGO_MIN_POOL_SIZE": int(environ.get("MONGO_MIN_POOL_SIZE", 0)),
+        "MONGO_WAIT_QUEUE_TIMEOUT_MS": int(environ.get("MONGO_WAIT_QUEUE_TIMEOUT_MS", 5000)),
+        "MONGO_SERVER_SELECTION_TIMEOUT_MS": int(environ.get("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5000)),
+        "MONGO_COMPRESSORS": environ.get("MONGO_COMPRESSORS", ""),
+        "METRICS_ENABLED": environ.get("METRICS_ENABLED", "true").lower() == "true",
+        # Set by gunicorn.conf.py for web workers only; unset, a process reports its own metrics
+        "METRICS_DIR": environ.get("METRICS_DIR") or None,
+        "METRICS_FLUSH_INTERVAL": float(environ.get("METRICS_FLUSH_INTERVAL", 10)),
+        "SLOW_QUERY_MS": float(environ.get("SLOW_QUERY_MS", 100)),
+        "SLOW_QUERY_EXPLAIN_INTERVAL": float(environ.get("SLOW_QUERY_EXPLAIN_INTERVAL", 10)),
+        "SLOW_QUERY_MAX_SHAPES": int(environ.get("SLOW_QUERY_MAX_SHAPES", 500)),
+        "INVENTORY_RESERVATION_TTL": float(environ.get("INVENTORY_RESERVATION_TTL", 600)),
+        "INVENTORY_RETENTION_HOURS": float(environ.get("INVENTORY_RETENTION_HOURS", 24)),
+        "INVENTORY_SWEEP_INTERVAL": float(environ.get("INVENTORY_SWEEP_INTERVAL", 5)),
+        "INVENTORY_MAX_ITEMS": int(environ.get("INVENTORY_MAX_ITEMS", 50)),
+    }
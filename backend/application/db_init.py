@@ -1,46 +1,107 @@
 """
-Database initialization and index creation for MongoDB
+Database checks and data migrations for MongoDB; indexes are declared in
+application/migrations.py
 """
+import datetime
+from itertools import combinations
+
 from application import db
+from application.utils.product_query import (
+    SUPPORTED_SORTS,
+    build_product_query,
+    merge_filters,
+)
+from application.utils.pagination import keyset_filter
+from application.utils.confirmation import hash_token, unconfirmed_expiry
+from application.utils.profiler import index_scans, plan_stages
+
+# Sample values used to exercise every listing filter when checking query plans
+SAMPLE_FILTERS = {
+    "category": "electronics",
+    "on_sale": "true",
+    "min_price": "10",
+    "max_price": "100",
+    "min_rating": "4",
+}
+
+
+def migrate_confirmation_tokens():
+    """
+    Move tokens still stored on users into confirmation_tokens, hashed, and
+    schedule purging of unconfirmed accounts. Safe to run repeatedly.
+    """
+    now = datetime.datetime.utcnow()
+    moved = 0
+    for user in db.users.find({"confirmation_token": {"$exists": True}}):
+        update = {"$unset": {"confirmation_token": "", "confirmation_expires": ""}}
+        if not user.get("confirmed", False):
+            expires_at = user.get("confirmation_expires") or now
+            db.confirmation_tokens.update_one(
+                {"_id": hash_token(user["confirmation_token"])},
+                {"$setOnInsert": {
+                    "user_id": user["_id"],
+                    "nonce": None,
+                    "created_at": now,
+                    "expires_at": expires_at,
+                }},
+                upsert=True
+            )
+            update["$set"] = {"unconfirmed_expires_at": unconfirmed_expiry(user.get("created_at") or now)}
+        db.users.update_one({"_id": user["_id"]}, update)
+        moved += 1
+
+    print(f"✓ Migrated {moved} confirmation token(s)")
+    return moved
+
 
+def unbounded_scan(scan):
+    """Whether an IXSCAN walks every key of its leading index field"""
+    leading = next(iter(scan["keyPattern"]))
+    return all(bound in ("[MinKey, MaxKey]", "[MaxKey, MinKey]") for bound in scan["indexBounds"][leading])
 
-def create_indexes():
-    """Create database indexes for performance optimization"""
-    
-    # Users collection indexes
-    db.users.create_index("email", unique=True)
-    db.users.create_index("cpf", unique=True)
-    db.users.create_index("confirmation_token")
-    db.users.create_index("created_at")
-    db.users.create_index([
-        ("email", 1),
-        ("confirmed", 1)
-    ])
-    
-    # Products collection indexes
-    db.products.create_index("title", unique=True)
-    db.products.create_index("category")
-    db.products.create_index("price")
-    db.products.create_index("on_sale")
-    db.products.create_index("rating")
-    db.products.create_index("created_at")
-    db.products.create_index([
-        ("category", 1),
-        ("price", 1)
-    ])
-    db.products.create_index([
-        ("on_sale", 1),
-        ("sale_price", 1)
-    ])
-    
-    # Text search index for products
-    db.products.create_index([
-        ("title", "text"),
-        ("description", "text"),
-        ("category", "text")
-    ])
-    
-    print("Database indexes created successfully!")
+
+def verify_query_plans():
+    """
+    Explain every supported listing filter/sort combination, first page and
+    cursor page, and return the ones planned with a COLLSCAN, an in-memory
+    SORT or, for filtered listings, an index scan unbounded on its leading key.
+    Combinations build_product_query() rejects are skipped.
+    """
+    failures = []
+    sorts = [None] + SUPPORTED_SORTS
+    for size in range(len(SAMPLE_FILTERS) + 1):
+        for names in combinations(SAMPLE_FILTERS, size):
+            for sort in sorts:
+                args = {name: SAMPLE_FILTERS[name] for name in names}
+                if sort:
+                    args["sort"] = sort
+                try:
+                    plan = build_product_query(args)
+                except ValueError:
+                    continue
+                resume = keyset_filter(plan["sort"], [0 for _ in plan["sort"]])
+
+                for query in (plan["filter"], merge_filters(plan["filter"], resume)):
+                    explain = (
+                        db.products.find(query, plan["projection"])
+                        .sort(plan["sort"])
+                        .hint(plan["hint"])
+                        .limit(11)
+                        .explain()
+                    )
+                    winning = explain["queryPlanner"]["winningPlan"]
+                    bad = set(plan_stages(winning)) & {"COLLSCAN", "SORT"}
+                    if plan["filter"] and any(unbounded_scan(scan) for scan in index_scans(winning)):
+                        bad.add("unbounded IXSCAN")
+                    if bad:
+                        failures.append({"args": args, "stages": sorted(bad)})
+
+    if failures:
+        for failure in failures:
+            print(f"✗ {failure['args']} planned with {', '.join(failure['stages'])}")
+    else:
+        print("✓ All product listing queries are index-backed")
+    return failures
 
 
 def check_database_connection():
@@ -54,9 +115,3 @@ def check_database_connection():
         print(f"✗ Database connection failed: {str(e)}")
         return False
 
-
-if __name__ == "__main__":
-    if check_database_connection():
-        create_indexes()
-    else:
-        print("Cannot create indexes - database connection failed")
\ No newline at end of file
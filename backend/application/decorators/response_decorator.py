@@ -0,0 +1,108 @@
+from functools import wraps
+from flask import current_app, request, make_response
+from application.extensions import extension
+import gzip
+import hashlib
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip is always available
+    brotli = None
+
+
+# Compressed bodies of the current app keyed by (etag, encoding), see Extensions
+compressed_cache = extension("compressed_cache")
+
+
+def _supported_encodings():
+    return ["br", "gzip"] if brotli is not None else ["gzip"]
+
+
+def _compress(data, encoding):
+    if encoding == "br":
+        return brotli.compress(data, quality=5)
+    return gzip.compress(data, compresslevel=6)
+
+
+def _tag_matches(base_tag):
+    """Whether If-None-Match holds base_tag in any of its content-coded variants"""
+    if not request.if_none_match:
+        return False
+    if request.if_none_match.star_tag:
+        return True
+    candidates = [base_tag] + [f"{base_tag}-{encoding}" for encoding in _supported_encodings()]
+    return any(request.if_none_match.contains(tag) for tag in candidates)
+
+
+def _not_modified(tag):
+    response = make_response("", 304)
+    response.set_etag(tag)
+    response.vary.add("Accept-Encoding")
+    return response
+
+
+def conditional_response(version=None, min_size=1024):
+    """
+    Decorator adding strong ETags, If-None-Match handling and compression to GET routes.
+
+    When ``version`` is given it must be a callable returning a token that changes
+    whenever the underlying data does; the ETag is then derived from it and the
+    request URL, so matching conditional requests get a 304 without running the
+    view at all. Otherwise, or when ``version`` fails, the ETag is a hash of
+    the response body.
+
+    Bodies of at least ``min_size`` bytes are brotli or gzip encoded when the
+    client accepts it; the encoding is appended to the ETag as each content
+    coding is a distinct representation.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            if request.method not in ("GET", "HEAD"):
+                return f(*args, **kwargs)
+
+            base_tag = None
+            if version is not None:
+                try:
+                    current = version()
+                except Exception as e:
+                    # Tag the body instead; the view reports the outage itself
+                    current_app.logger.warning(f"Could not read the response version: {e}")
+                    current = None
+                if current is not None:
+                    token = f"{current}:{request.full_path}"
+                    base_tag = hashlib.sha1(token.encode()).hexdigest()
+                    if _tag_matches(base_tag):
+                        return _not_modified(base_tag)
+
+            response = make_response(f(*args, **kwargs))
+            if response.status_code != 200 or response.direct_passthrough:
+                return response
+
+            data = response.get_data()
+            if base_tag is None:
+                base_tag = hashlib.sha1(data).hexdigest()
+                if _tag_matches(base_tag):
+                    return _not_modified(base_tag)
+
+            response.vary.add("Accept-Encoding")
+            encoding = None
+            if len(data) >= min_size and "Content-Encoding" not in response.headers:
+                encoding = request.accept_encodings.best_match(_supported_encodings())
+
+            if encoding:
+                compressed = compressed_cache.get((base_tag, encoding))
+                if compressed is None:
+                    compressed = _compress(data, encoding)
+                    compressed_cache.set((base_tag, encoding), compressed)
+                response.set_data(compressed)
+                response.headers["Content-Encoding"] = encoding
+                response.set_etag(f"{base_tag}-{encoding}")
+            else:
+                response.set_etag(base_tag)
+
+            return response
+
+        return decorated
+
+    return decorator
@@ -1,6 +1,7 @@
 from functools import wraps
-from flask import request, jsonify
-from application import app, db
+from flask import current_app, request
+from application.utils.user_cache import load_user
+from application.utils.serialization import json_response
 from bson import ObjectId
 import jwt
 import datetime
@@ -11,41 +12,43 @@ def token_required(f):
     def decorated(*args, **kwargs):
         auth_header = request.headers.get("Authorization")
         if not auth_header:
-            return jsonify({"message": "Authorization header missing", "status": 401}), 401
+            return json_response({"message": "Authorization header missing", "status": 401}), 401
         
         if not auth_header.startswith("Bearer "):
-            return jsonify({"message": "Invalid authorization header format", "status": 401}), 401
+            return json_response({"message": "Invalid authorization header format", "status": 401}), 401
 
         try:
             token = auth_header.split(" ")[1]
             if not token:
-                return jsonify({"message": "Token missing from header", "status": 401}), 401
+                return json_response({"message": "Token missing from header", "status": 401}), 401
         except IndexError:
-            return jsonify({"message": "Invalid authorization header format", "status": 401}), 401
+            return json_response({"message": "Invalid authorization header format", "status": 401}), 401
 
         try:
             decoded = jwt.decode(
                 token, 
-                app.config["SECRET_KEY"], 
+                current_app.config["SECRET_KEY"], 
                 algorithms=["HS256"]
             )
             
             # Verify token hasn't expired (additional check)
             if decoded.get("exp") and datetime.datetime.fromtimestamp(decoded["exp"]) < datetime.datetime.utcnow():
-                return jsonify({"message": "Token has expired", "status": 401}), 401
+                return json_response({"message": "Token has expired", "status": 401}), 401
             
             # Verify user still exists and is confirmed
             user_id = ObjectId(decoded["user_id"])
-            user = db.users.find_one({"_id": user_id})
+            user = load_user(user_id)
             
             if not user:
-                return jsonify({"message": "User not found", "status": 401}), 401
+                return json_response({"message": "User not found", "status": 401}), 401
             
             if not user.get("confirmed", False):
-                return jsonify({"message": "User account not confirmed", "status": 401}), 401
+                return json_response({"message": "User account not confirmed", "status": 401}), 401
             
-            # Add user information to request object
+            # Add user information to request object; handlers should reuse
+            # request.user_doc rather than fetching the user again
             request.user_id = user_id
+            request.user_doc = user
             request.user = {
                 "id": str(user["_id"]),
                 "name": user["name"],
@@ -54,15 +57,15 @@ def token_required(f):
             }
             
         except jwt.ExpiredSignatureError:
-            return jsonify({"message": "Token has expired", "status": 401}), 401
+            return json_response({"message": "Token has expired", "status": 401}), 401
         except jwt.InvalidTokenError:
-            return jsonify({"message": "Invalid token", "status": 401}), 401
+            return json_response({"message": "Invalid token", "status": 401}), 401
         except jwt.DecodeError:
-            return jsonify({"message": "Token decode error", "status": 401}), 401
+            return json_response({"message": "Token decode error", "status": 401}), 401
         except Exception as e:
             # Log the error for debugging (don't expose to client)
-            app.logger.error(f"Token validation error: {str(e)}")
-            return jsonify({"message": "Token validation failed", "status": 401}), 401
+            current_app.logger.error(f"Token validation error: {str(e)}")
+            return json_response({"message": "Token validation failed", "status": 401}), 401
 
         return f(*args, **kwargs)
 
@@ -75,6 +78,6 @@ def admin_required(f):
     @token_required
     def decorated(*args, **kwargs):
         if not request.user.get("admin", False):
-            return jsonify({"message": "Admin privileges required", "status": 403}), 403
+            return json_response({"message": "Admin privileges required", "status": 403}), 403
         return f(*args, **kwargs)
     return decorated
@@ -0,0 +1,121 @@
+"""
+Extension objects of an application.
+
+create_app() builds a fresh Extensions for every app and stores it in
+app.extensions["e-commerce"], so two apps (two tests, say) never share a
+MongoDB client, caches or background threads. Importing the package opens no
+connection and reads no settings.
+
+The module-level names (db, mongo, metrics...) are proxies to the extensions
+of the current app: use them inside an app or request context. Background
+threads of an extension push their app's context themselves. An app that is
+done with, like one per test, is released with Extensions.close().
+"""
+import os
+import weakref
+from operator import attrgetter
+from typing import Any
+
+from flask import current_app
+from werkzeug.local import LocalProxy
+
+EXTENSION = "e-commerce"
+
+
+class Extensions:
+    """Every stateful object of one app, configured from its app.config"""
+
+    def __init__(self, app):
+        # Imported here: these modules import the proxies defined below
+        from application.utils.cache import TTLCache
+        from application.utils.catalog import CatalogCache
+        from application.utils.inventory import Inventory
+        from application.utils.mail_queue import MailQueue
+        from application.utils.metrics import CommandMetrics, MetricsRegistry
+        from application.utils.mongo import DatabaseProxy, MongoConnection
+        from application.utils.passwords import PasswordHasher
+        from application.utils.profiler import SlowQueryLog
+        from application.utils.user_cache import invalidate_users
+        from application.utils.write_behind import WriteBehindBuffer
+
+        config = app.config
+        self.mongo = MongoConnection()
+        self.db = DatabaseProxy(self.mongo)
+        self.metrics = MetricsRegistry()
+        self.slow_queries = SlowQueryLog(self.mongo)
+        self.metrics.init_app(app)
+        self.slow_queries.init_app(app)
+        listeners = []
+        if config["METRICS_ENABLED"]:
+            listeners.append(CommandMetrics(self.metrics))
+        if self.slow_queries.enabled:
+            listeners.append(self.slow_queries)
+        self.mongo.init_app(app, listeners)
+
+        self.mail_queue = MailQueue()
+        self.mail_queue.init_app(app)
+        self.password_hasher = PasswordHasher(
+            method=config["PASSWORD_HASH_METHOD"],
+            workers=config["PASSWORD_HASH_WORKERS"],
+            queue_limit=config["PASSWORD_HASH_QUEUE_LIMIT"],
+            timeout=config["PASSWORD_HASH_TIMEOUT"],
+        )
+        # Login bookkeeping on users (last_login); cached users are dropped
+        # once written so token_required never serves an older last_login
+        self.user_writes = WriteBehindBuffer(
+            "users",
+            interval_ms=config["WRITE_BEHIND_INTERVAL_MS"],
+            max_entries=config["WRITE_BEHIND_MAX_ENTRIES"],
+            on_flush=invalidate_users,
+        )
+        self.user_writes.init_app(app)
+        # Entries are per worker: a write made by another worker becomes
+        # visible once the entry expires, so the TTL bounds how stale a user can be
+        self.user_cache = TTLCache(max_entries=config["USER_CACHE_MAX_ENTRIES"], ttl=config["USER_CACHE_TTL"])
+        self.catalog = CatalogCache(app)
+        # Compressed bodies keyed by (etag, encoding) so repeated hits skip compression
+        self.compressed_cache = TTLCache(max_entries=1024, ttl=300, max_bytes=16 * 1024 * 1024)
+        self.inventory = Inventory()
+        self.inventory.init_app(app)
+
+    def close(self) -> None:
+        """Stop background threads, write what is buffered and close the MongoDB client"""
+        self.inventory.close()
+        self.mail_queue.close()
+        self.user_writes.close()
+        self.slow_queries.close()
+        self.metrics.close()
+        self.password_hasher.shutdown()
+        self.mongo.close()
+
+
+def register_at_fork(method) -> None:
+    """
+    Call a bound method in forked children without keeping its object alive;
+    fork handlers cannot be unregistered, so a closed app would otherwise stay
+    in memory for the life of the process.
+    """
+    ref = weakref.WeakMethod(method)
+
+    def after_in_child():
+        bound = ref()
+        if bound is not None:
+            bound()
+
+    os.register_at_fork(after_in_child=after_in_child)
+
+
+def current_extensions() -> Extensions:
+    return current_app.extensions[EXTENSION]
+
+
+def extension(path: str) -> Any:
+    """Proxy to an extension object of the current app, by attribute path (catalog.listing_cache)"""
+    get = attrgetter(path)
+    return LocalProxy(lambda: get(current_extensions()))
+
+
+mongo = extension("mongo")
+db = extension("db")
+metrics = extension("metrics")
+slow_queries = extension("slow_queries")
@@ -0,0 +1,304 @@
+"""
+Declarative indexes and versioned data migrations, safe to run at every deploy.
+
+INDEXES declares the indexes every collection should have. plan_indexes()
+diffs them against list_indexes(), and apply_index_plan() builds what is
+missing in a single createIndexes per collection. New indexes are built hidden
+(MongoDB 4.4+): the planner ignores them until reveal_indexes() makes them
+visible, so a build never changes query plans halfway and a cutover can be
+undone with a collMod. Indexes listed in RETIRED are dropped only once the
+replacements are visible and the caller has checked the new plans. Other
+undeclared indexes are reported, never dropped.
+
+MIGRATIONS are one-shot data changes applied in order, each recorded in
+schema_migrations. A lock document there keeps concurrent deploys from
+migrating at the same time.
+"""
+import datetime
+import os
+import socket
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+from pymongo.errors import DuplicateKeyError
+
+from application import db
+from application.db_init import migrate_confirmation_tokens
+from application.utils.product_query import SORT_INDEXES
+
+# Options compared between declared and existing indexes
+INDEX_OPTIONS = ("unique", "sparse", "expireAfterSeconds", "partialFilterExpression")
+
+
+def _listing_indexes() -> List[Dict[str, Any]]:
+    """Product listing indexes, one per SORT_INDEXES entry"""
+    keys = {tuple(key) for by_filter in SORT_INDEXES.values() for key in by_filter.values()}
+    keys.discard((("_id", 1),))
+    return [{"key": list(key)} for key in sorted(keys)]
+
+
+INDEXES = {
+    "users": [
+        {"key": [("email", 1)], "unique": True},
+        {"key": [("cpf", 1)], "unique": True},
+        # Unconfirmed accounts are purged once unconfirmed_expires_at passes
+        {"key": [("unconfirmed_expires_at", 1)], "expireAfterSeconds": 0, "sparse": True},
+        {"key": [("created_at", 1)]},
+    ],
+    "products": [
+        {"key": [("title", 1)], "unique": True},
+        *_listing_indexes(),
+        # Incremental export walks products by (updated_at, _id)
+        {"key": [("updated_at", 1), ("_id", 1)]},
+        {"key": [("title", "text"), ("description", "text"), ("category", "text")]},
+    ],
+    "confirmation_tokens": [
+        {"key": [("expires_at", 1)], "expireAfterSeconds": 0},
+        {"key": [("user_id", 1)]},
+    ],
+    "reservations": [
+        # Expiry sweep over held reservations
+        {"key": [("status", 1), ("expires_at", 1)]},
+        # Reservations still being settled, a handful at any time
+        {"key": [("updated_at", 1)], "partialFilterExpression": {"settled": False}},
+        # Expired, cancelled and failed reservations; committed ones are kept
+        {"key": [("purge_at", 1)], "expireAfterSeconds": 0, "sparse": True},
+    ],
+    "email_outbox": [
+        {"key": [("status", 1), ("next_attempt_at", 1)]},
+        # Delivered messages are kept for a week
+        {"key": [("sent_at", 1)], "expireAfterSeconds": 7 * 24 * 3600},
+    ],
+}
+
+# Indexes superseded by declared ones, dropped after the cutover
+RETIRED = {
+    "users": [
+        "confirmation_token_1",
+        # The unique email index serves every email lookup
+        "email_1_confirmed_1",
+    ],
+    "products": [
+        # Replaced by the (field, _id) listing indexes
+        "category_1",
+        "price_1",
+        "on_sale_1",
+        "rating_1",
+        "created_at_1",
+        "category_1_price_1",
+        "on_sale_1_sale_price_1",
+    ],
+}
+
+# (version, description, function); append only, never renumber
+MIGRATIONS = [
+    (1, "Move confirmation tokens out of users", migrate_confirmation_tokens),
+]
+
+LOCK_ID = "lock"
+LOCK_TTL = datetime.timedelta(minutes=30)
+
+
+def index_name(spec: Dict[str, Any]) -> str:
+    """Name MongoDB gives an index with this key unless one is set explicitly"""
+    return spec.get("name") or "_".join(f"{field}_{direction}" for field, direction in spec["key"])
+
+
+def _supports_hidden() -> bool:
+    return tuple(db.client.server_info()["versionArray"][:2]) >= (4, 4)
+
+
+def plan_indexes() -> Dict[str, Dict[str, list]]:
+    """
+    Difference between INDEXES and the indexes in the database, per collection:
+
+    - create: declared indexes that do not exist
+    - modify: existing indexes whose TTL differs, fixed in place with collMod
+    - reveal: declared indexes that exist but are hidden
+    - conflicts: existing indexes whose key or options differ otherwise; they
+      need a drop and rebuild, done only with allow_rebuild
+    - retire: RETIRED indexes still present
+    - undeclared: any other index, reported only
+    """
+    plan = {}
+    for collection in sorted(set(INDEXES) | set(RETIRED)):
+        existing = {index["name"]: index for index in db[collection].list_indexes()}
+        entry = {"create": [], "modify": [], "reveal": [], "conflicts": [], "retire": [], "undeclared": []}
+        declared = set()
+
+        for spec in INDEXES.get(collection, []):
+            name = index_name(spec)
+            declared.add(name)
+            current = existing.get(name)
+            if current is None:
+                entry["create"].append(spec)
+                continue
+
+            is_text = any(direction == "text" for _, direction in spec["key"])
+            same_key = is_text or list(current["key"].items()) == list(spec["key"])
+            differences = {
+                option for option in INDEX_OPTIONS
+                if current.get(option) != spec.get(option)
+                # unique: False is how older servers report a plain index
+                and not (option in ("unique", "sparse") and not current.get(option) and not spec.get(option))
+            }
+            # collMod can change a TTL but not add or remove one
+            in_place = {"expireAfterSeconds"} if "expireAfterSeconds" in spec and "expireAfterSeconds" in current else set()
+            if not same_key or differences - in_place:
+                entry["conflicts"].append({"name": name, "declared": spec, "existing": dict(current)})
+            elif differences:
+                entry["modify"].append(spec)
+            if current.get("hidden"):
+                entry["reveal"].append(name)
+
+        retired = set(RETIRED.get(collection, []))
+        for name in existing:
+            if name in retired:
+                entry["retire"].append(name)
+            elif name not in declared and name != "_id_":
+                entry["undeclared"].append(name)
+        plan[collection] = entry
+    return plan
+
+
+def _index_document(spec: Dict[str, Any], hidden: bool) -> Dict[str, Any]:
+    document = {"key": dict(spec["key"]), "name": index_name(spec)}
+    for option in INDEX_OPTIONS:
+        if option in spec:
+            document[option] = spec[option]
+    if hidden:
+        document["hidden"] = True
+    return document
+
+
+def apply_index_plan(plan: Dict[str, Dict[str, list]], hidden: bool = True, allow_rebuild: bool = False) -> List[str]:
+    """
+    Build missing indexes (hidden when the server supports it), apply TTL
+    changes and, with allow_rebuild, drop and rebuild conflicting indexes.
+    Returns the names of indexes left hidden, as "collection.name".
+    """
+    hidden = hidden and _supports_hidden()
+    pending_reveal = []
+    for collection, entry in plan.items():
+        specs = list(entry["create"])
+        if allow_rebuild:
+            for conflict in entry["conflicts"]:
+                print(f"↻ Rebuilding {collection}.{conflict['name']}")
+                db[collection].drop_index(conflict["name"])
+                specs.append(conflict["declared"])
+
+        if specs:
+            started = time.perf_counter()
+            db.command("createIndexes", collection, indexes=[_index_document(spec, hidden) for spec in specs])
+            names = [index_name(spec) for spec in specs]
+            print(f"✓ Built {collection}: {', '.join(names)} in {time.perf_counter() - started:.1f} s"
+                  f"{' (hidden)' if hidden else ''}")
+            if hidden:
+                pending_reveal.extend(f"{collection}.{name}" for name in names)
+
+        for spec in entry["modify"]:
+            db.command("collMod", collection, index={
+                "name": index_name(spec), "expireAfterSeconds": spec["expireAfterSeconds"],
+            })
+            print(f"✓ Updated TTL of {collection}.{index_name(spec)}")
+
+        pending_reveal.extend(f"{collection}.{name}" for name in entry["reveal"])
+    return pending_reveal
+
+
+def reveal_indexes(names: List[str], hidden: bool = False) -> None:
+    """Make "collection.name" indexes visible to the planner (or hide them again)"""
+    for qualified in names:
+        collection, name = qualified.split(".", 1)
+        db.command("collMod", collection, index={"name": name, "hidden": hidden})
+        print(f"✓ {'Hid' if hidden else 'Revealed'} {qualified}")
+
+
+def drop_retired_indexes(plan: Dict[str, Dict[str, list]]) -> List[str]:
+    dropped = []
+    for collection, entry in plan.items():
+        for name in entry["retire"]:
+            db[collection].drop_index(name)
+            dropped.append(f"{collection}.{name}")
+            print(f"✓ Dropped retired index {collection}.{name}")
+    return dropped
+
+
+def index_usage(min_age: datetime.timedelta = datetime.timedelta(days=7)) -> List[Dict[str, Any]]:
+    """
+    Operations served by each index since its counters started ($indexStats).
+
+    Counters restart with the server, so an index is only reported unused
+    when its counters are older than min_age. Unique and TTL indexes are
+    never reported: they are kept for what they enforce, not for reads.
+    """
+    now = datetime.datetime.utcnow()
+    report = []
+    for collection in sorted(INDEXES):
+        specs = {index_name(spec): spec for spec in INDEXES[collection]}
+        usage: Dict[str, Dict[str, Any]] = {}
+        # One row per host on replica sets and sharded clusters
+        for row in db[collection].aggregate([{"$indexStats": {}}]):
+            entry = usage.setdefault(row["name"], {"ops": 0, "since": row["accesses"]["since"]})
+            entry["ops"] += row["accesses"]["ops"]
+            entry["since"] = min(entry["since"], row["accesses"]["since"])
+        for name, entry in sorted(usage.items()):
+            spec = specs.get(name, {})
+            enforces = spec.get("unique") or "expireAfterSeconds" in spec or name == "_id_"
+            report.append({
+                "collection": collection,
+                "name": name,
+                "ops": entry["ops"],
+                "since": entry["since"],
+                "declared": name in specs,
+                "unused": not enforces and entry["ops"] == 0 and now - entry["since"] >= min_age,
+            })
+    return report
+
+
+@contextmanager
+def migration_lock(ttl: datetime.timedelta = LOCK_TTL):
+    """Hold the schema_migrations lock; raises RuntimeError while another deploy holds it"""
+    owner = f"{socket.gethostname()}:{os.getpid()}"
+    now = datetime.datetime.utcnow()
+    try:
+        db.schema_migrations.find_one_and_update(
+            {"_id": LOCK_ID, "$or": [{"expires_at": {"$lt": now}}, {"owner": owner}]},
+            {"$set": {"owner": owner, "acquired_at": now, "expires_at": now + ttl}},
+            upsert=True,
+        )
+    except DuplicateKeyError:
+        holder = db.schema_migrations.find_one({"_id": LOCK_ID}) or {}
+        raise RuntimeError(f"Migrations are locked by {holder.get('owner')} until {holder.get('expires_at')}")
+    try:
+        yield
+    finally:
+        db.schema_migrations.delete_one({"_id": LOCK_ID, "owner": owner})
+
+
+def applied_migrations() -> Dict[int, Dict[str, Any]]:
+    return {
+        document["_id"]: document
+        for document in db.schema_migrations.find({"_id": {"$type": "int"}})
+    }
+
+
+def run_migrations(target: Optional[int] = None) -> List[int]:
+    """Apply pending MIGRATIONS in order, up to target; returns the versions applied"""
+    applied = applied_migrations()
+    done = []
+    for version, description, migrate in MIGRATIONS:
+        if version in applied or (target is not None and version > target):
+            continue
+        started = time.perf_counter()
+        migrate()
+        db.schema_migrations.insert_one({
+            "_id": version,
+            "description": description,
+            "applied_at": datetime.datetime.utcnow(),
+            "duration_s": round(time.perf_counter() - started, 3),
+        })
+        print(f"✓ Migration {version}: {description}")
+        done.append(version)
+    return done
@@ -1,50 +1,244 @@
 import datetime
+import json
 import jwt
-from application import app, db
-from bson import json_util
-from flask import request, jsonify
-from werkzeug.security import generate_password_hash, check_password_hash
-from application.decorators.token_decorator import token_required
+from application import db, metrics, mongo, slow_queries
+from bson import ObjectId
+from flask import Blueprint, current_app, request
+from pymongo.errors import BulkWriteError, DuplicateKeyError, OperationFailure
+from application.decorators.token_decorator import token_required, admin_required
+from application.decorators.response_decorator import conditional_response
 from application.utils.utils import (
     clean_cpf,
-    generate_confirmation_token,
+    duplicate_key_fields,
     send_confirmation_email,
 )
+from application.utils.confirmation import (
+    claim_resend,
+    confirm_user,
+    consume_confirmation_token,
+    issue_confirmation_token,
+    unconfirmed_expiry,
+)
+from application.utils.mail_queue import mail_queue
+from application.utils.passwords import HashingBusy, password_hasher
+from application.utils.serialization import dumps, iter_ndjson, json_response
+from application.utils.pagination import decode_cursor, encode_cursor, keyset_filter, paginate
+from application.utils.catalog import (
+    catalog_cache_stats,
+    catalog_version,
+    invalidate_catalog,
+    listing_cache,
+    search_cache,
+)
+from application.utils.user_cache import invalidate_user, user_cache
+from application.utils.write_behind import user_writes
+from application.utils.inventory import (
+    OutOfStock,
+    ReservationClosed,
+    ReservationNotFound,
+    inventory,
+    serialize_reservation,
+)
+from application.utils.facets import get_facets, record_products
+from application.utils.product_query import (
+    MAX_SEARCH_LENGTH,
+    SEARCH_SORT,
+    build_product_query,
+    build_search_pipeline,
+    merge_filters,
+    shows_stock,
+)
 from application.validators import (
+    PRODUCT_SCHEMA,
     validate_user_data,
     validate_product_data,
-    validate_email,
-    validate_phone,
+    validate_profile_data,
+    validate_reservation_data,
     sanitize_string,
 )
 
+api = Blueprint("api", __name__)
+
+
+def prepare_product(data):
+    """Sanitize validated product input into the document stored in db.products"""
+    now = datetime.datetime.utcnow()
+    return {
+        "title": sanitize_string(data["title"]),
+        "price": float(data["price"]),
+        "sale_price": float(data.get("sale_price", data["price"])),
+        "on_sale": bool(data.get("on_sale", False)),
+        "description": sanitize_string(data["description"]),
+        "image": sanitize_string(data.get("image", "")),
+        "category": sanitize_string(data["category"]),
+        "quantity": int(data["quantity"]),
+        "rating": float(data.get("rating", 0)),
+        "reviews": int(data.get("reviews", 0)),
+        "created_at": now,
+        "updated_at": now
+    }
+
+
+def iter_bulk_rows():
+    """
+    Yield (row, data, error) for each product in a bulk import body.
+
+    JSON arrays are parsed at once; NDJSON bodies are read line by line from
+    the request stream so large feeds are never held in memory as text.
+    """
+    if request.mimetype in ("application/x-ndjson", "application/jsonlines"):
+        row = 0
+        for line in request.stream:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield row, json.loads(line), None
+            except ValueError:
+                yield row, None, "Invalid JSON"
+            row += 1
+        return
+
+    data = request.get_json()
+    if not isinstance(data, list):
+        raise ValueError("Expected a JSON array or an NDJSON body")
+    for row, item in enumerate(data):
+        yield row, item, None
+
+
+def insert_product_batch(batch, results):
+    """
+    Insert prepared (row, document) pairs in one unordered insert_many.
+
+    Duplicate titles are rejected by the unique index instead of being looked
+    up first; every row gets an entry in results. Returns the inserted documents.
+    """
+    documents = [document for _, document in batch]
+    failed = {}
+    try:
+        db.products.insert_many(documents, ordered=False)
+    except BulkWriteError as e:
+        for error in e.details.get("writeErrors", []):
+            if error.get("code") == 11000 and not duplicate_key_fields(error) - {"title"}:
+                failed[error["index"]] = "Product with this title already exists"
+            else:
+                failed[error["index"]] = "Error creating product"
+
+    inserted = []
+    for index, (row, document) in enumerate(batch):
+        if index in failed:
+            results.append({"row": row, "errors": [failed[index]]})
+        else:
+            results.append({"row": row, "product_id": document["_id"]})
+            inserted.append(document)
+
+    record_products(inserted)
+    return inserted
+
+
+def paginate_products(query, plan, size, offset=0):
+    """
+    One listing page through the index chosen by build_product_query().
+
+    A hint naming a missing index fails the query, so until setup_db.py has
+    built the listing indexes the page is read without the hint instead.
+    """
+    def find(hint):
+        cursor = db.products.find(query, plan["projection"])
+        if hint is not None:
+            cursor = cursor.hint(hint)
+        return cursor.skip(offset) if offset else cursor
+
+    try:
+        return paginate(find(plan["hint"]), plan["sort"], size)
+    except OperationFailure as e:
+        if "hint" not in str(e):
+            raise
+        current_app.logger.warning(f"Listing index {plan['hint']} is missing; run setup_db.py")
+        return paginate(find(None), plan["sort"], size)
+
+
+def listing_version():
+    """
+    Catalog version tagging a listing. Stock moves with every reservation
+    without a catalog write, so listings showing it are tagged by their body.
+    """
+    if shows_stock(request.args):
+        return None
+    return catalog_version()
+
 
-@app.route("/api")
+@api.route("/api")
 def index():
-    return jsonify({"message": "Welcome to the API!", "status": 200}), 200
+    return json_response({"message": "Welcome to the API!", "status": 200}), 200
 
 
-@app.route("/api/products", methods=["GET", "POST"])
+@api.route("/api/products", methods=["GET", "POST"])
+@conditional_response(version=listing_version)
 def products():
     if request.method == "GET":
         try:
-            size = min(int(request.args.get("size", 10)), 50)  # Limit max size
+            size = max(min(int(request.args.get("size", 10)), 50), 1)  # Limit max size
+            cursor = request.args.get("cursor")
             page = max(int(request.args.get("page", 1)), 1)    # Ensure page >= 1
-            
-            offset = (page - 1) * size
-            
-            products = db.products.find().skip(offset).limit(size)
-            return json_util.dumps(products)
-        except ValueError:
-            return jsonify({"message": "Invalid pagination parameters", "status": 400}), 400
+            plan = build_product_query(request.args)
+            sort = plan["sort"]
+            cacheable = not shows_stock(request.args)
+
+            # Equivalent queries share an entry whatever the parameter order
+            cache_key = (
+                size,
+                page if cursor is None else None,
+                cursor,
+                repr(sorted(plan["filter"].items())),
+                tuple(sort),
+                tuple(plan["projection"]),
+            )
+            cached = listing_cache.get(cache_key) if cacheable else None
+            if cached is not None:
+                body, headers = cached
+                return body, 200, headers
+
+            if cursor is None:
+                # Legacy page/size clients keep receiving a bare list; the cursor
+                # for the following page is exposed in a header instead
+                offset = (page - 1) * size
+
+                products, next_cursor = paginate_products(plan["filter"], plan, size, offset)
+                body = dumps(products)
+                headers = {"Content-Type": "application/json"}
+                if next_cursor:
+                    headers["X-Next-Cursor"] = next_cursor
+            else:
+                query = plan["filter"]
+                if cursor:
+                    query = merge_filters(query, keyset_filter(sort, decode_cursor(cursor, sort)))
+
+                products, next_cursor = paginate_products(query, plan, size)
+                body = dumps({
+                    "products": products,
+                    "next_cursor": next_cursor,
+                    "status": 200
+                })
+                headers = {"Content-Type": "application/json"}
+
+            if cacheable:
+                listing_cache.set(cache_key, (body, headers))
+            return body, 200, headers
+        except ValueError as e:
+            return json_response({
+                "message": "Invalid query parameters",
+                "error": str(e),
+                "status": 400
+            }), 400
         except Exception as e:
-            return jsonify({"message": "Error fetching products", "status": 500}), 500
+            return json_response({"message": "Error fetching products", "status": 500}), 500
 
     elif request.method == "POST":
         try:
             data = request.get_json()
             if not data:
-                return jsonify({"message": "No data provided", "status": 400}), 400
+                return json_response({"message": "No data provided", "status": 400}), 400
             
             # Map 'name' to 'title' for backward compatibility
             if "name" in data:
@@ -53,69 +247,285 @@ def products():
             # Validate product data
             validation_result = validate_product_data(data)
             if not validation_result["valid"]:
-                return jsonify({
+                return json_response({
                     "message": "Validation errors",
                     "errors": validation_result["errors"],
                     "status": 400
                 }), 400
             
-            # Check if product with same title exists
-            existing_product = db.products.find_one({"title": data["title"]})
-            if existing_product:
-                return jsonify({
+            # Sanitize and prepare product data
+            product_data = prepare_product(data)
+            
+            # The unique title index rejects duplicates in the same round trip
+            try:
+                result = db.products.insert_one(product_data)
+            except DuplicateKeyError as e:
+                if duplicate_key_fields(e) - {"title"}:
+                    raise
+                return json_response({
                     "message": "Product with this title already exists",
                     "status": 400
                 }), 400
-            
-            # Sanitize and prepare product data
-            product_data = {
-                "title": sanitize_string(data["title"]),
-                "price": float(data["price"]),
-                "sale_price": float(data.get("sale_price", data["price"])),
-                "on_sale": bool(data.get("on_sale", False)),
-                "description": sanitize_string(data["description"]),
-                "image": sanitize_string(data.get("image", "")),
-                "category": sanitize_string(data["category"]),
-                "quantity": int(data["quantity"]),
-                "rating": float(data.get("rating", 0)),
-                "reviews": int(data.get("reviews", 0)),
-                "created_at": datetime.datetime.utcnow(),
-                "updated_at": datetime.datetime.utcnow()
-            }
-            
-            result = db.products.insert_one(product_data)
-            return jsonify({
+            # The product is stored: report it created even if bookkeeping fails
+            try:
+                record_products([product_data])
+            except Exception as e:
+                current_app.logger.error(f"Could not update facet counts for product {result.inserted_id}: {e}")
+            try:
+                invalidate_catalog()
+            except Exception as e:
+                current_app.logger.error(f"Could not invalidate the catalog after creating a product: {e}")
+            return json_response({
                 "message": "Product successfully created!",
-                "product_id": str(result.inserted_id),
+                "product_id": result.inserted_id,
                 "status": 201
             }), 201
             
-        except ValueError as e:
-            return jsonify({
+        except (ValueError, TypeError) as e:
+            return json_response({
                 "message": "Invalid data format",
                 "error": str(e),
                 "status": 400
             }), 400
         except Exception as e:
-            return jsonify({
+            return json_response({
                 "message": "Error creating product",
                 "status": 500
             }), 500
 
-    return jsonify({"message": "Invalid request method", "status": 405}), 405
+    return json_response({"message": "Invalid request method", "status": 405}), 405
+
+
+@api.route("/api/products/bulk", methods=["POST"])
+@admin_required
+def bulk_import_products():
+    batch_size = current_app.config["BULK_BATCH_SIZE"]
+    results = []
+    pending = []
+    inserted = 0
+
+    def flush(pending):
+        # Validate the whole batch in one call, then insert the valid rows
+        batch = []
+        validations = PRODUCT_SCHEMA.validate_many(data for _, data in pending)
+        for (row, data), validation_result in zip(pending, validations):
+            if not validation_result["valid"]:
+                results.append({"row": row, "errors": validation_result["errors"]})
+                continue
+            try:
+                batch.append((row, prepare_product(data)))
+            except (ValueError, TypeError) as e:
+                results.append({"row": row, "errors": [f"Invalid data format: {e}"]})
+        return len(insert_product_batch(batch, results)) if batch else 0
+
+    try:
+        for row, data, error in iter_bulk_rows():
+            if error is None and not isinstance(data, dict):
+                error = "Expected a JSON object"
+            if error is not None:
+                results.append({"row": row, "errors": [error]})
+                continue
+
+            # Map 'name' to 'title' for backward compatibility
+            if "name" in data:
+                data["title"] = data.pop("name")
+
+            pending.append((row, data))
+            if len(pending) >= batch_size:
+                inserted += flush(pending)
+                pending = []
+
+        if pending:
+            inserted += flush(pending)
+
+        results.sort(key=lambda result: result["row"])
+        return json_response({
+            "message": f"{inserted} of {len(results)} products imported",
+            "inserted": inserted,
+            "failed": len(results) - inserted,
+            "results": results,
+            "status": 200
+        }), 200
+
+    # Rows of earlier batches may already be stored; report them either way
+    except ValueError as e:
+        results.sort(key=lambda result: result["row"])
+        return json_response({
+            "message": "Invalid data format",
+            "error": str(e),
+            "inserted": inserted,
+            "results": results,
+            "status": 400
+        }), 400
+    except Exception as e:
+        results.sort(key=lambda result: result["row"])
+        return json_response({
+            "message": "Error importing products",
+            "inserted": inserted,
+            "results": results,
+            "status": 500
+        }), 500
+    finally:
+        if inserted:
+            try:
+                invalidate_catalog()
+            except Exception as e:
+                current_app.logger.error(f"Could not invalidate the catalog after a bulk import: {e}")
+
+
+@api.route("/api/products/search", methods=["GET"])
+@conditional_response(version=listing_version)
+def search_products():
+    try:
+        terms = " ".join(request.args.get("q", "").split())
+        if not terms:
+            return json_response({"message": "Search query is required", "status": 400}), 400
+        if len(terms) > MAX_SEARCH_LENGTH:
+            return json_response({
+                "message": f"Search query must be less than {MAX_SEARCH_LENGTH} characters",
+                "status": 400
+            }), 400
+
+        size = max(min(int(request.args.get("size", 10)), 50), 1)  # Limit max size
+        cursor = request.args.get("cursor")
+
+        cache_key = (
+            terms.lower(),
+            tuple(sorted((k, v) for k, v in request.args.items() if k != "q"))
+        )
+        cacheable = not shows_stock(request.args)
+        cached = search_cache.get(cache_key) if cacheable else None
+        if cached is not None:
+            return cached, 200, {"Content-Type": "application/json"}
+
+        after = decode_cursor(cursor, SEARCH_SORT) if cursor else None
+        products = list(db.products.aggregate(
+            build_search_pipeline(terms, request.args, size, after)
+        ))
+
+        next_cursor = None
+        if len(products) > size:
+            products = products[:size]
+            next_cursor = encode_cursor(products[-1], SEARCH_SORT)
+
+        body = dumps({
+            "products": products,
+            "next_cursor": next_cursor,
+            "status": 200
+        })
+        if cacheable:
+            search_cache.set(cache_key, body)
+        return body, 200, {"Content-Type": "application/json"}
+    except ValueError as e:
+        return json_response({
+            "message": "Invalid query parameters",
+            "error": str(e),
+            "status": 400
+        }), 400
+    except Exception as e:
+        return json_response({"message": "Error searching products", "status": 500}), 500
+
+
+@api.route("/api/products/facets", methods=["GET"])
+@conditional_response(version=catalog_version)
+def product_facets():
+    try:
+        return json_response({"facets": get_facets(request.args), "status": 200}), 200
+    except ValueError as e:
+        return json_response({
+            "message": "Invalid query parameters",
+            "error": str(e),
+            "status": 400
+        }), 400
+    except Exception as e:
+        return json_response({"message": "Error fetching facets", "status": 500}), 500
+
+
+@api.route("/api/products/cache", methods=["GET"])
+@admin_required
+def products_cache_stats():
+    return json_response({"caches": catalog_cache_stats(), "status": 200}), 200
+
+
+@api.route("/api/products/export", methods=["GET"])
+@admin_required
+def export_products():
+    try:
+        query = {}
+        since = request.args.get("updated_since")
+        if since:
+            since = datetime.datetime.fromisoformat(since.replace("Z", "+00:00"))
+            if since.tzinfo is not None:
+                since = since.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+            query["updated_at"] = {"$gte": since}
+
+        # One server-side cursor for the whole export; incremental exports are
+        # ordered by updated_at so consumers can checkpoint on the last line
+        cursor = db.products.find(query, {"holds": 0}, batch_size=current_app.config["EXPORT_BATCH_SIZE"])
+        if since:
+            cursor = cursor.sort([("updated_at", 1), ("_id", 1)])
+
+        return current_app.response_class(
+            iter_ndjson(cursor),
+            mimetype="application/x-ndjson",
+            headers={"Content-Disposition": "attachment; filename=products.ndjson"}
+        )
+    except ValueError as e:
+        return json_response({
+            "message": "Invalid updated_since, expected an ISO 8601 date",
+            "error": str(e),
+            "status": 400
+        }), 400
+    except Exception as e:
+        return json_response({"message": "Error exporting products", "status": 500}), 500
+
+
+@api.route("/api/users/cache", methods=["GET"])
+@admin_required
+def users_cache_stats():
+    return json_response({
+        "caches": {"users": user_cache.stats()},
+        "write_behind": {"users": user_writes.stats()},
+        "status": 200,
+    }), 200
+
+
+@api.route("/api/inventory/stats", methods=["GET"])
+@admin_required
+def inventory_stats():
+    return json_response({"inventory": inventory.stats(), "status": 200}), 200
+
+
+@api.route("/api/metrics", methods=["GET"])
+def metrics_endpoint():
+    return metrics.render(), 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+
+
+@api.route("/api/database/pool", methods=["GET"])
+@admin_required
+def database_pool_stats():
+    return json_response({"database": mongo.pool_stats(), "status": 200}), 200
+
 
+@api.route("/api/database/slow-queries", methods=["GET"])
+@admin_required
+def slow_query_report():
+    if not slow_queries.enabled:
+        return json_response({"message": "Slow-query log is disabled", "status": 404}), 404
+    return json_response({"slow_queries": slow_queries.report(), "status": 200}), 200
 
-@app.route("/api/register", methods=["POST"])
+
+@api.route("/api/register", methods=["POST"])
 def register():
     try:
         data = request.get_json()
         if not data:
-            return jsonify({"message": "No data provided", "status": 400}), 400
+            return json_response({"message": "No data provided", "status": 400}), 400
         
         # Validate user data
         validation_result = validate_user_data(data)
         if not validation_result["valid"]:
-            return jsonify({
+            return json_response({
                 "message": "Validation errors",
                 "errors": validation_result["errors"],
                 "status": 400
@@ -125,101 +535,139 @@ def register():
         email = sanitize_string(data["email"]).lower()
         cpf = clean_cpf(data["cpf"])
         
-        # Check for existing users
-        existing_user = db.users.find_one({"$or": [{"email": email}, {"cpf": cpf}]})
-        if existing_user:
-            return jsonify({
-                "message": "Email or CPF already exists",
-                "status": 409
-            }), 409
-        
-        # Generate confirmation token
-        token = generate_confirmation_token()
-        
         # Prepare user data
+        now = datetime.datetime.utcnow()
         user_data = {
             "name": sanitize_string(data["name"]),
             "email": email,
-            "password": generate_password_hash(data["password"]),
+            "password": password_hasher.hash(data["password"]),
             "cpf": cpf,
             "birth_date": data["birth_date"],
             "phone": sanitize_string(data["phone"]),
             "admin": bool(data.get("admin", False)),
             "confirmed": False,
-            "confirmation_token": token,
-            "confirmation_expires": datetime.datetime.utcnow() + datetime.timedelta(hours=24),
-            "created_at": datetime.datetime.utcnow(),
-            "updated_at": datetime.datetime.utcnow()
+            "created_at": now,
+            "updated_at": now,
+            "confirmation_sent_at": now,
+            # Purged by a TTL index unless confirmed before then
+            "unconfirmed_expires_at": unconfirmed_expiry(now)
         }
         
-        # Insert user
-        result = db.users.insert_one(user_data)
+        # Insert user; the unique email and cpf indexes reject existing users
+        try:
+            result = db.users.insert_one(user_data)
+        except DuplicateKeyError as e:
+            if duplicate_key_fields(e) - {"email", "cpf"}:
+                raise
+            return json_response({
+                "message": "Email or CPF already exists",
+                "status": 409
+            }), 409
         
-        # Send confirmation email
-        send_confirmation_email(email, token)
+        # Queue confirmation email; delivery status can be polled
+        token = issue_confirmation_token(result.inserted_id)
+        email_id = send_confirmation_email(email, token)
         
-        return jsonify({
+        return json_response({
             "message": "User successfully created! Please check your email to confirm your account.",
-            "user_id": str(result.inserted_id),
+            "user_id": result.inserted_id,
+            "email_id": email_id,
             "status": 201
         }), 201
         
+    except HashingBusy:
+        return json_response({
+            "message": "Server busy, please retry shortly",
+            "status": 503
+        }), 503, {"Retry-After": "1"}
     except Exception as e:
-        return jsonify({
+        return json_response({
             "message": "Error creating user",
             "status": 500
         }), 500
 
 
-@app.route("/api/confirm/<token>", methods=["GET"])
+@api.route("/api/emails/<email_id>", methods=["GET"])
+def email_status(email_id):
+    try:
+        if not ObjectId.is_valid(email_id):
+            return json_response({"message": "Invalid email id", "status": 400}), 400
+
+        message = mail_queue.status(ObjectId(email_id))
+        if not message:
+            return json_response({"message": "Email not found", "status": 404}), 404
+
+        return json_response({"email": message, "status": 200}), 200
+
+    except Exception as e:
+        return json_response({"message": "Error retrieving email status", "status": 500}), 500
+
+
+@api.route("/api/confirm/<token>", methods=["GET"])
 def confirm_email(token):
     try:
         if not token:
-            return jsonify({"message": "Token is required", "status": 400}), 400
+            return json_response({"message": "Token is required", "status": 400}), 400
         
-        user = db.users.find_one({"confirmation_token": token})
+        record = consume_confirmation_token(token)
+        if not record:
+            return json_response({"message": "Invalid confirmation token", "status": 400}), 400
+        
+        if record.get("expired"):
+            return json_response({"message": "Confirmation token expired", "status": 400}), 400
+        
+        # Update user as confirmed; the token is already gone
+        user = confirm_user(record["user_id"])
         if not user:
-            return jsonify({"message": "Invalid confirmation token", "status": 400}), 400
+            return json_response({"message": "Invalid confirmation token", "status": 400}), 400
+        
+        invalidate_user(user["_id"])
         
         if user.get("confirmed", False):
-            return jsonify({"message": "User already confirmed", "status": 200}), 200
-        
-        if datetime.datetime.utcnow() > user.get("confirmation_expires", datetime.datetime.min):
-            return jsonify({"message": "Confirmation token expired", "status": 400}), 400
-        
-        # Update user as confirmed and remove token
-        db.users.update_one(
-            {"_id": user["_id"]},
-            {
-                "$set": {
-                    "confirmed": True,
-                    "updated_at": datetime.datetime.utcnow()
-                },
-                "$unset": {
-                    "confirmation_token": "",
-                    "confirmation_expires": ""
-                }
-            }
-        )
+            return json_response({"message": "User already confirmed", "status": 200}), 200
+        
+        return json_response({"message": "User successfully confirmed!", "status": 200}), 200
+        
+    except Exception as e:
+        return json_response({"message": "Error confirming user", "status": 500}), 500
+
+
+@api.route("/api/confirm/resend", methods=["POST"])
+def resend_confirmation():
+    try:
+        data = request.get_json()
+        if not data or not data.get("email"):
+            return json_response({"message": "Email is required", "status": 400}), 400
+        
+        email = sanitize_string(data["email"]).lower()
+        user = claim_resend(email)
+        
+        # Same answer whether the account exists or was sent one recently, to avoid leaking emails
+        if user:
+            token = issue_confirmation_token(user["_id"])
+            send_confirmation_email(email, token)
         
-        return jsonify({"message": "User successfully confirmed!", "status": 200}), 200
+        return json_response({
+            "message": "If the account exists and is not confirmed, a confirmation email was sent.",
+            "status": 200
+        }), 200
         
     except Exception as e:
-        return jsonify({"message": "Error confirming user", "status": 500}), 500
+        return json_response({"message": "Error resending confirmation", "status": 500}), 500
 
 
-@app.route("/api/login", methods=["POST"])
+@api.route("/api/login", methods=["POST"])
 def login():
     try:
         data = request.get_json()
         if not data:
-            return jsonify({"message": "No data provided", "status": 400}), 400
+            return json_response({"message": "No data provided", "status": 400}), 400
         
         email = data.get("email")
         password = data.get("password")
         
         if not email or not password:
-            return jsonify({"message": "Email and password are required", "status": 400}), 400
+            return json_response({"message": "Email and password are required", "status": 400}), 400
         
         # Sanitize email
         email = sanitize_string(email).lower()
@@ -227,18 +675,18 @@ def login():
         # Find user
         user = db.users.find_one({"email": email})
         if not user:
-            return jsonify({"message": "Invalid credentials", "status": 401}), 401
+            return json_response({"message": "Invalid credentials", "status": 401}), 401
         
         # Check if user is confirmed
         if not user.get("confirmed", False):
-            return jsonify({
+            return json_response({
                 "message": "Please confirm your email before logging in",
                 "status": 401
             }), 401
         
         # Verify password
-        if not check_password_hash(user["password"], password):
-            return jsonify({"message": "Invalid credentials", "status": 401}), 401
+        if not password_hasher.verify(user["password"], password):
+            return json_response({"message": "Invalid credentials", "status": 401}), 401
         
         # Create JWT token
         token_payload = {
@@ -252,21 +700,28 @@ def login():
         
         token = jwt.encode(
             token_payload,
-            app.config["SECRET_KEY"],
+            current_app.config["SECRET_KEY"],
             algorithm="HS256"
         )
         
-        # Update last login
-        db.users.update_one(
-            {"_id": user["_id"]},
-            {"$set": {"last_login": datetime.datetime.utcnow()}}
-        )
+        # Upgrade hashes made with older parameters right away
+        if password_hasher.needs_rehash(user["password"]):
+            try:
+                db.users.update_one(
+                    {"_id": user["_id"]},
+                    {"$set": {"password": password_hasher.hash(password)}}
+                )
+            except HashingBusy:
+                pass  # Upgraded on a later login
+        
+        # last_login is bookkeeping only, written in batches
+        user_writes.set(user["_id"], {"last_login": datetime.datetime.utcnow()})
         
-        return jsonify({
+        return json_response({
             "message": "User successfully logged in!",
             "token": token,
             "user": {
-                "id": str(user["_id"]),
+                "id": user["_id"],
                 "name": user["name"],
                 "email": user["email"],
                 "admin": user.get("admin", False)
@@ -274,25 +729,28 @@ def login():
             "status": 200
         }), 200
         
+    except HashingBusy:
+        return json_response({
+            "message": "Server busy, please retry shortly",
+            "status": 503
+        }), 503, {"Retry-After": "1"}
     except Exception as e:
-        return jsonify({"message": "Error during login", "status": 500}), 500
+        return json_response({"message": "Error during login", "status": 500}), 500
 
 
-@app.route("/api/profile", methods=["GET"])
+@api.route("/api/profile", methods=["GET"])
 @token_required
 def profile():
     try:
-        # User information is already available from token_required decorator
-        user_id = request.user_id
-        
-        user = db.users.find_one({"_id": user_id})
+        # User document is already loaded by the token_required decorator
+        user = request.user_doc
         if not user:
-            return jsonify({"message": "User not found", "status": 404}), 404
+            return json_response({"message": "User not found", "status": 404}), 404
         
-        return jsonify({
+        return json_response({
             "message": "User profile retrieved successfully",
             "user": {
-                "id": str(user["_id"]),
+                "id": user["_id"],
                 "name": user["name"],
                 "email": user["email"],
                 "cpf": user["cpf"],
@@ -306,10 +764,10 @@ def profile():
         }), 200
         
     except Exception as e:
-        return jsonify({"message": "Error retrieving profile", "status": 500}), 500
+        return json_response({"message": "Error retrieving profile", "status": 500}), 500
 
 
-@app.route("/api/profile/edit", methods=["PUT"])
+@api.route("/api/profile/edit", methods=["PUT"])
 @token_required
 def update_profile():
     try:
@@ -317,7 +775,7 @@ def update_profile():
         data = request.get_json()
         
         if not data:
-            return jsonify({"message": "No data provided", "status": 400}), 400
+            return json_response({"message": "No data provided", "status": 400}), 400
         
         # Prepare validation data
         validation_data = {
@@ -327,42 +785,15 @@ def update_profile():
         }
         
         # Basic validation
-        errors = []
-        
-        if not validation_data["name"]:
-            errors.append("Name is required")
-        elif len(validation_data["name"].strip()) < 2:
-            errors.append("Name must be at least 2 characters long")
-        
-        if not validation_data["email"]:
-            errors.append("Email is required")
-        elif not validate_email(validation_data["email"]):
-            errors.append("Invalid email format")
-        
-        if not validation_data["phone"]:
-            errors.append("Phone is required")
-        elif not validate_phone(validation_data["phone"]):
-            errors.append("Invalid phone number format")
-        
-        if errors:
-            return jsonify({
+        validation_result = validate_profile_data(validation_data)
+        if not validation_result["valid"]:
+            return json_response({
                 "message": "Validation errors",
-                "errors": errors,
+                "errors": validation_result["errors"],
                 "status": 400
             }), 400
         
-        # Check if email is already taken by another user
         email = sanitize_string(validation_data["email"]).lower()
-        existing_user = db.users.find_one({
-            "email": email,
-            "_id": {"$ne": user_id}
-        })
-        
-        if existing_user:
-            return jsonify({
-                "message": "Email already exists",
-                "status": 409
-            }), 409
         
         # Prepare update data
         update_data = {
@@ -372,19 +803,131 @@ def update_profile():
             "updated_at": datetime.datetime.utcnow()
         }
         
-        # Update user
-        result = db.users.update_one(
-            {"_id": user_id},
-            {"$set": update_data}
-        )
+        # Update user; the unique email index rejects emails taken by another user
+        try:
+            result = db.users.update_one(
+                {"_id": user_id},
+                {"$set": update_data}
+            )
+        except DuplicateKeyError as e:
+            if duplicate_key_fields(e) - {"email"}:
+                raise
+            return json_response({
+                "message": "Email already exists",
+                "status": 409
+            }), 409
         
+        invalidate_user(user_id)
+
         if result.matched_count == 0:
-            return jsonify({"message": "User not found", "status": 404}), 404
+            return json_response({"message": "User not found", "status": 404}), 404
         
-        return jsonify({
+        return json_response({
             "message": "Profile updated successfully!",
             "status": 200
         }), 200
         
     except Exception as e:
-        return jsonify({"message": "Error updating profile", "status": 500}), 500
+        return json_response({"message": "Error updating profile", "status": 500}), 500
+
+
+def parse_reservation_id(reservation_id):
+    return ObjectId(reservation_id) if ObjectId.is_valid(reservation_id) else None
+
+
+def reservation_closed_response(e):
+    return json_response({
+        "message": f"Reservation is {e.status}",
+        "reservation_status": e.status,
+        "status": 410
+    }), 410
+
+
+@api.route("/api/reservations", methods=["POST"])
+@token_required
+def reserve_stock():
+    try:
+        data = request.get_json()
+        if not data:
+            return json_response({"message": "No data provided", "status": 400}), 400
+
+        validation_result = validate_reservation_data(data, current_app.config["INVENTORY_MAX_ITEMS"])
+        if not validation_result["valid"]:
+            return json_response({
+                "message": "Validation errors",
+                "errors": validation_result["errors"],
+                "status": 400
+            }), 400
+
+        reservation = inventory.reserve(request.user_id, data["items"])
+        return json_response({
+            "message": "Stock reserved",
+            "reservation": serialize_reservation(reservation),
+            "status": 201
+        }), 201
+
+    except OutOfStock as e:
+        return json_response({
+            "message": "Not enough stock",
+            "unavailable": e.unavailable,
+            "status": 409
+        }), 409
+    except Exception as e:
+        return json_response({"message": "Error reserving stock", "status": 500}), 500
+
+
+@api.route("/api/reservations/<reservation_id>", methods=["GET"])
+@token_required
+def get_reservation(reservation_id):
+    try:
+        reservation_id = parse_reservation_id(reservation_id)
+        if reservation_id is None:
+            return json_response({"message": "Reservation not found", "status": 404}), 404
+        reservation = inventory.get(reservation_id, request.user_id)
+        return json_response({"reservation": serialize_reservation(reservation), "status": 200}), 200
+    except ReservationNotFound:
+        return json_response({"message": "Reservation not found", "status": 404}), 404
+    except Exception as e:
+        return json_response({"message": "Error retrieving reservation", "status": 500}), 500
+
+
+@api.route("/api/reservations/<reservation_id>/checkout", methods=["POST"])
+@token_required
+def checkout_reservation(reservation_id):
+    try:
+        reservation_id = parse_reservation_id(reservation_id)
+        if reservation_id is None:
+            return json_response({"message": "Reservation not found", "status": 404}), 404
+        reservation = inventory.checkout(reservation_id, request.user_id)
+        return json_response({
+            "message": "Checkout completed",
+            "reservation": serialize_reservation(reservation),
+            "status": 200
+        }), 200
+    except ReservationNotFound:
+        return json_response({"message": "Reservation not found", "status": 404}), 404
+    except ReservationClosed as e:
+        return reservation_closed_response(e)
+    except Exception as e:
+        return json_response({"message": "Error during checkout", "status": 500}), 500
+
+
+@api.route("/api/reservations/<reservation_id>/cancel", methods=["POST"])
+@token_required
+def cancel_reservation(reservation_id):
+    try:
+        reservation_id = parse_reservation_id(reservation_id)
+        if reservation_id is None:
+            return json_response({"message": "Reservation not found", "status": 404}), 404
+        reservation = inventory.cancel(reservation_id, request.user_id)
+        return json_response({
+            "message": "Reservation cancelled",
+            "reservation": serialize_reservation(reservation),
+            "status": 200
+        }), 200
+    except ReservationNotFound:
+        return json_response({"message": "Reservation not found", "status": 404}), 404
+    except ReservationClosed as e:
+        return reservation_closed_response(e)
+    except Exception as e:
+        return json_response({"message": "Error cancelling reservation", "status": 500}), 500
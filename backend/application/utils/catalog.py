@@ -0,0 +1,86 @@
+"""
+Shared state for catalog reads: response caches, version and write invalidation
+"""
+import threading
+import time
+from pymongo import ReturnDocument
+from flask import current_app
+from application.extensions import current_extensions, db, extension
+from application.utils.cache import TTLCache
+
+
+class CatalogCache:
+    """Catalog response caches of one app and the catalog version they belong to"""
+
+    def __init__(self, app):
+        max_bytes = app.config["CATALOG_CACHE_MAX_BYTES"]
+        ttl = app.config["CATALOG_CACHE_TTL"]
+        # Serialized listing pages keyed by the normalized query
+        self.listing_cache = TTLCache(max_entries=4096, ttl=ttl, max_bytes=max_bytes)
+        # Hot search queries are served from memory for a short while
+        self.search_cache = TTLCache(max_entries=512, ttl=30, max_bytes=max_bytes // 4)
+        # Facet counts per filter selection
+        self.facet_cache = TTLCache(max_entries=1024, ttl=ttl, max_bytes=max_bytes // 8)
+        # Catalog version shared by every worker through Mongo, re-read at most once per
+        # CATALOG_VERSION_TTL seconds so most requests never leave the process
+        self.version = None
+        self.checked_at = 0.0
+        self.lock = threading.Lock()
+
+    def caches(self):
+        return (self.listing_cache, self.search_cache, self.facet_cache)
+
+    def apply_version(self, value):
+        """Record the catalog version, dropping local caches if it moved"""
+        if self.version is not None and value != self.version:
+            for cache in self.caches():
+                cache.invalidate()
+        self.version = value
+        self.checked_at = time.monotonic()
+
+
+listing_cache = extension("catalog.listing_cache")
+search_cache = extension("catalog.search_cache")
+facet_cache = extension("catalog.facet_cache")
+
+
+def catalog_version():
+    """
+    Current catalog version.
+
+    Also keeps the local caches coherent with writes made by other workers:
+    they are dropped as soon as a newer version is observed.
+    """
+    catalog = current_extensions().catalog
+    with catalog.lock:
+        if (
+            catalog.version is None
+            or time.monotonic() - catalog.checked_at > current_app.config["CATALOG_VERSION_TTL"]
+        ):
+            meta = db.catalog_meta.find_one({"_id": "products"})
+            catalog.apply_version(meta["version"] if meta else 0)
+        return catalog.version
+
+
+def invalidate_catalog():
+    """Bump the catalog version and drop cached responses; call after any committed product write"""
+    catalog = current_extensions().catalog
+    meta = db.catalog_meta.find_one_and_update(
+        {"_id": "products"},
+        {"$inc": {"version": 1}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+    )
+    with catalog.lock:
+        catalog.apply_version(meta["version"])
+    for cache in catalog.caches():
+        cache.invalidate()
+
+
+def catalog_cache_stats():
+    """Hit/miss/eviction counters for every catalog cache"""
+    return {
+        "listing": listing_cache.stats(),
+        "search": search_cache.stats(),
+        "facets": facet_cache.stats(),
+    }
@@ -0,0 +1,118 @@
+"""
+Email confirmation token lifecycle.
+
+Tokens live in the confirmation_tokens collection, keyed by their SHA-256 hash
+and removed by a TTL index on expires_at, so the users collection never holds
+them. A token is derived from the user id and a random nonce with an HMAC keyed
+by SECRET_KEY: only the nonce is stored, yet the live token of a user can be
+rebuilt to resend it. Unconfirmed users carry unconfirmed_expires_at, covered
+by a TTL index, and are purged once the grace period ends. confirmation_sent_at
+limits resends to one per CONFIRMATION_RESEND_INTERVAL_MINUTES.
+"""
+import datetime
+import hashlib
+import hmac
+import secrets
+from typing import Optional
+
+from bson import ObjectId
+from flask import current_app
+from pymongo import ReturnDocument
+
+from application import db
+
+
+def hash_token(token: str) -> str:
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def _derive_token(user_id: ObjectId, nonce: str) -> str:
+    return hmac.new(
+        current_app.config["SECRET_KEY"].encode(),
+        f"{user_id}:{nonce}".encode(),
+        hashlib.sha256,
+    ).hexdigest()
+
+
+def unconfirmed_expiry(created_at: datetime.datetime) -> datetime.datetime:
+    """When an account created at created_at is purged if still unconfirmed"""
+    return created_at + datetime.timedelta(hours=current_app.config["UNCONFIRMED_ACCOUNT_TTL_HOURS"])
+
+
+def issue_confirmation_token(user_id: ObjectId) -> str:
+    """Return the user's live confirmation token, creating one if none is live"""
+    now = datetime.datetime.utcnow()
+    live = db.confirmation_tokens.find_one({"user_id": user_id, "expires_at": {"$gt": now}})
+    if live and live.get("nonce"):
+        return _derive_token(user_id, live["nonce"])
+
+    nonce = secrets.token_hex(16)
+    token = _derive_token(user_id, nonce)
+    db.confirmation_tokens.delete_many({"user_id": user_id})
+    db.confirmation_tokens.insert_one({
+        "_id": hash_token(token),
+        "user_id": user_id,
+        "nonce": nonce,
+        "created_at": now,
+        "expires_at": now + datetime.timedelta(hours=current_app.config["CONFIRMATION_TOKEN_TTL_HOURS"]),
+    })
+    return token
+
+
+def claim_resend(email: str) -> Optional[dict]:
+    """
+    Record a confirmation resend to an unconfirmed user and return the user, or
+    None if there is none or one was sent too recently. The account is kept at
+    least as long as the token being sent, so it cannot be purged before use.
+    """
+    now = datetime.datetime.utcnow()
+    config = current_app.config
+    resend_after = now - datetime.timedelta(minutes=config["CONFIRMATION_RESEND_INTERVAL_MINUTES"])
+    return db.users.find_one_and_update(
+        {
+            "email": email,
+            "confirmed": {"$ne": True},
+            "$or": [
+                {"confirmation_sent_at": {"$exists": False}},
+                {"confirmation_sent_at": {"$lte": resend_after}},
+            ],
+        },
+        {
+            "$set": {"confirmation_sent_at": now},
+            "$max": {"unconfirmed_expires_at": now + datetime.timedelta(hours=config["CONFIRMATION_TOKEN_TTL_HOURS"])},
+        },
+        {"_id": 1},
+    )
+
+
+def consume_confirmation_token(token: str) -> Optional[dict]:
+    """
+    Delete a live token and return its document, or None if it does not exist.
+
+    A token past expires_at but not yet removed by the TTL monitor is returned
+    with "expired": True and left in place.
+    """
+    token_hash = hash_token(token)
+    record = db.confirmation_tokens.find_one_and_delete({
+        "_id": token_hash,
+        "expires_at": {"$gt": datetime.datetime.utcnow()},
+    })
+    if record:
+        return record
+
+    record = db.confirmation_tokens.find_one({"_id": token_hash})
+    if record:
+        record["expired"] = True
+    return record
+
+
+def confirm_user(user_id: ObjectId) -> Optional[dict]:
+    """Mark the user confirmed and exempt from purging; returns the user as it was before"""
+    return db.users.find_one_and_update(
+        {"_id": user_id},
+        {
+            "$set": {"confirmed": True, "updated_at": datetime.datetime.utcnow()},
+            "$unset": {"unconfirmed_expires_at": ""},
+        },
+        return_document=ReturnDocument.BEFORE,
+    )
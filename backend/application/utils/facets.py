@@ -0,0 +1,163 @@
+"""
+Catalog facet counts (categories, price buckets, on-sale) for the storefront sidebar.
+
+Counts over the whole catalog are materialized in the product_facets collection,
+one document per (facet, value), and kept current with $inc as products are
+written. Counts for a filtered selection come from a $facet aggregation and are
+cached until the catalog version changes.
+"""
+import bisect
+from typing import Any, Dict, Iterable, List
+
+from pymongo import UpdateOne
+
+from application import db
+from application.utils.catalog import facet_cache
+from application.utils.product_query import build_product_filter
+
+# Lower bounds of the price buckets; the last bucket is open-ended
+PRICE_BOUNDARIES = [0, 25, 50, 100, 250, 500, 1000]
+
+TOTAL_KEY = {"facet": "total", "value": "all"}
+
+
+def _price_bucket(price: Any) -> Any:
+    """Lower bound of the bucket holding price, matching $bucket's grouping"""
+    try:
+        price = float(price)
+    except (TypeError, ValueError):
+        return "other"
+    if price < PRICE_BOUNDARIES[0]:
+        return "other"
+    return PRICE_BOUNDARIES[bisect.bisect_right(PRICE_BOUNDARIES, price) - 1]
+
+
+def facet_pipeline(query: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Single-pass aggregation counting every facet for the matching products"""
+    return [
+        {"$match": query},
+        {"$facet": {
+            "category": [{"$group": {"_id": "$category", "count": {"$sum": 1}}}],
+            "price": [{"$bucket": {
+                "groupBy": "$price",
+                "boundaries": PRICE_BOUNDARIES + [float("inf")],
+                "default": "other",
+                "output": {"count": {"$sum": 1}},
+            }}],
+            "on_sale": [{"$group": {"_id": "$on_sale", "count": {"$sum": 1}}}],
+            "total": [{"$count": "count"}],
+        }},
+    ]
+
+
+def _format(counts: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """Shape (facet, value, count) rows into the API response"""
+    facets = {"categories": [], "price_buckets": [], "on_sale": [], "total": 0}
+    for row in counts:
+        facet, value, count = row["facet"], row["value"], row["count"]
+        if count <= 0:
+            continue
+        if facet == "category":
+            facets["categories"].append({"value": value, "count": count})
+        elif facet == "price":
+            if value == "other":
+                continue
+            index = PRICE_BOUNDARIES.index(value)
+            upper = PRICE_BOUNDARIES[index + 1] if index + 1 < len(PRICE_BOUNDARIES) else None
+            facets["price_buckets"].append({"min": value, "max": upper, "count": count})
+        elif facet == "on_sale":
+            facets["on_sale"].append({"value": value, "count": count})
+        elif facet == "total":
+            facets["total"] = count
+
+    facets["categories"].sort(key=lambda item: (-item["count"], str(item["value"])))
+    facets["price_buckets"].sort(key=lambda item: item["min"])
+    facets["on_sale"].sort(key=lambda item: bool(item["value"]))
+    return facets
+
+
+def compute_facets(query: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Run the $facet aggregation and flatten it into (facet, value, count) rows"""
+    result = next(db.products.aggregate(facet_pipeline(query)), {})
+    rows = []
+    for facet in ("category", "price", "on_sale"):
+        for group in result.get(facet, []):
+            rows.append({"facet": facet, "value": group["_id"], "count": group["count"]})
+    total = result.get("total") or [{"count": 0}]
+    rows.append({**TOTAL_KEY, "count": total[0]["count"]})
+    return rows
+
+
+def rebuild_facet_summary() -> List[Dict[str, Any]]:
+    """
+    Recompute the materialized whole-catalog counts from scratch.
+
+    Increments recorded while the aggregation runs are overwritten, so only
+    run it with product writes stopped; see ensure_facet_summary().
+    """
+    rows = compute_facets({})
+    keys = [{"facet": row["facet"], "value": row["value"]} for row in rows]
+    db.product_facets.bulk_write([
+        UpdateOne({"_id": key}, {"$set": {"count": row["count"]}}, upsert=True)
+        for key, row in zip(keys, rows)
+    ])
+    db.product_facets.delete_many({"_id": {"$nin": keys}})
+    return rows
+
+
+def ensure_facet_summary() -> bool:
+    """Build the materialized counts if they are missing; True when built"""
+    if db.product_facets.find_one({"_id": TOTAL_KEY}, {"_id": 1}) is not None:
+        return False
+    rebuild_facet_summary()
+    return True
+
+
+def record_products(documents: Iterable[Dict[str, Any]], sign: int = 1) -> None:
+    """
+    Incrementally apply written products to the materialized counts.
+
+    Call with the stored documents after inserts (sign=-1 for deletions);
+    increments for the whole batch are merged into one bulk_write.
+    """
+    increments: Dict[tuple, int] = {}
+    for document in documents:
+        for facet, value in (
+            ("category", document.get("category")),
+            ("price", _price_bucket(document.get("price"))),
+            ("on_sale", document.get("on_sale")),
+            (TOTAL_KEY["facet"], TOTAL_KEY["value"]),
+        ):
+            increments[(facet, value)] = increments.get((facet, value), 0) + sign
+
+    if increments:
+        db.product_facets.bulk_write([
+            UpdateOne({"_id": {"facet": facet, "value": value}}, {"$inc": {"count": count}}, upsert=True)
+            for (facet, value), count in increments.items()
+        ], ordered=False)
+
+
+def read_facet_summary() -> List[Dict[str, Any]]:
+    """Whole-catalog counts from the summary collection, rebuilt if missing"""
+    rows = [
+        {"facet": doc["_id"]["facet"], "value": doc["_id"]["value"], "count": doc["count"]}
+        for doc in db.product_facets.find()
+    ]
+    if not any(row["facet"] == TOTAL_KEY["facet"] for row in rows):
+        rows = rebuild_facet_summary()
+    return rows
+
+
+def get_facets(args) -> Dict[str, Any]:
+    """
+    Facet counts for the listing filters in args.
+
+    Raises ValueError for malformed filter values, like the listing does.
+    """
+    query = build_product_filter(args)
+    cache_key = repr(sorted(query.items()))
+    facets = facet_cache.get(cache_key)
+    if facets is None:
+        facets = _format(compute_facets(query) if query else read_facet_summary())
+        facet_cache.set(cache_key, facets)
+    return facets
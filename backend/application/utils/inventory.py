@@ -0,0 +1,319 @@
+"""
+Stock reservations and checkout without read-modify-write on products.
+
+Stock is taken with one conditional update per product,
+{"_id": id, "quantity": {"$gte": n}} with {"$inc": {"quantity": -n}}: the
+check and the decrement are a single atomic write, so concurrent buyers can
+never take more than is left. The same update pushes a hold
+{reservation_id, quantity} onto the product. Releasing a reservation pulls the
+hold and gives the stock back, committing it only pulls the hold; both filter
+on the hold being present, so each hold is settled exactly once however often
+a step is retried.
+
+Holds live on the product because the hold and the stock it took must change
+in the same single-document write; kept in reservations, a crash between the
+two writes would lose or double-count stock. The cost is that writes to a
+product grow with its open holds. That number is bounded by the units left
+(every hold takes at least one) and by the reservations opened within one
+INVENTORY_RESERVATION_TTL, since checkout, cancellation and expiry pull them:
+a hold is about 50 bytes of BSON, so even 10,000 open holds stay well under a
+megabyte, and matching a hold is an in-memory scan next to the document write.
+
+Every item of a cart is reserved in one unordered bulk_write. When a product
+is short, the holds that were taken are released again (compensation) before
+the buyer gets the answer. Reservations last INVENTORY_RESERVATION_TTL
+seconds: checkout, cancellation and expiry all move them out of "held" with a
+conditional update, so exactly one of them wins. A sweeper thread in each
+process releases expired reservations and finishes any left half-settled by a
+crash; expired, cancelled and failed reservations are then purged by a TTL
+index. Committed reservations are kept as the record of the checkout.
+
+None of this needs a transaction, so it works on a standalone server too, and
+a hot product is only locked for one document write per buyer. Stock changes
+do not bump the catalog version: that would make every buyer write one global
+document and drop every cached listing during a sale. The default "card"
+fields leave quantity out, and listings asking for it are at most
+CATALOG_CACHE_TTL seconds stale.
+"""
+import atexit
+import datetime
+import logging
+import os
+import threading
+from typing import Any, Dict, Iterable, List, Optional
+
+from bson import ObjectId
+from pymongo import ReturnDocument, UpdateOne
+
+from application import db
+from application.extensions import extension
+
+HELD = "held"
+COMMITTED = "committed"
+CANCELLED = "cancelled"
+EXPIRED = "expired"
+FAILED = "failed"
+
+# Reservations moved out of "held" but still unsettled this long after are
+# assumed abandoned by a crashed process and settled by the sweeper
+STALE_AFTER = datetime.timedelta(seconds=60)
+
+
+class OutOfStock(Exception):
+    """Raised by Inventory.reserve() when a product cannot cover its quantity"""
+
+    def __init__(self, unavailable: List[Dict[str, Any]]):
+        super().__init__("Not enough stock")
+        self.unavailable = unavailable
+
+
+class ReservationNotFound(Exception):
+    """Raised when a reservation does not exist or belongs to another user"""
+
+
+class ReservationClosed(Exception):
+    """Raised when a reservation is no longer held (expired, cancelled...)"""
+
+    def __init__(self, status: str):
+        super().__init__(f"Reservation is {status}")
+        self.status = status
+
+
+def merge_items(items: Iterable[Dict[str, Any]]) -> Dict[ObjectId, int]:
+    """Quantity per product of validated cart items, repeated products added up"""
+    quantities: Dict[ObjectId, int] = {}
+    for item in items:
+        product_id = ObjectId(item["product_id"])
+        quantities[product_id] = quantities.get(product_id, 0) + int(item["quantity"])
+    return quantities
+
+
+def serialize_reservation(reservation: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "id": reservation["_id"],
+        "status": reservation["status"],
+        "items": reservation["items"],
+        "created_at": reservation["created_at"],
+        "expires_at": reservation["expires_at"],
+    }
+
+
+class Inventory:
+    """Reservation lifecycle on db.products and db.reservations"""
+
+    def __init__(self, reservation_ttl: float = 600, retention_hours: float = 24,
+                 sweep_interval: float = 5, sweep_batch: int = 100):
+        self.reservation_ttl = datetime.timedelta(seconds=reservation_ttl)
+        self.retention = datetime.timedelta(hours=retention_hours)
+        self.sweep_interval = sweep_interval
+        self.sweep_batch = sweep_batch
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._stopping = threading.Event()
+        self._stats = {
+            "reserved": 0, "out_of_stock": 0, "committed": 0,
+            "cancelled": 0, "expired": 0, "repaired": 0, "sweep_errors": 0,
+        }
+        self.logger = logging.getLogger(__name__)
+        self.app = None
+        atexit.register(self.stop)
+
+    def init_app(self, app) -> None:
+        self.app = app
+        self.reservation_ttl = datetime.timedelta(seconds=app.config["INVENTORY_RESERVATION_TTL"])
+        self.retention = datetime.timedelta(hours=app.config["INVENTORY_RETENTION_HOURS"])
+        self.sweep_interval = app.config["INVENTORY_SWEEP_INTERVAL"]
+        self.logger = app.logger
+
+    def _count(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            self._stats[name] += amount
+
+    def reserve(self, user_id: ObjectId, items: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Hold stock for every item or for none; raises OutOfStock listing the
+        products that could not cover their quantity.
+        """
+        self._ensure_sweeper()
+        quantities = merge_items(items)
+        now = datetime.datetime.utcnow()
+        reservation = {
+            "_id": ObjectId(),
+            "user_id": user_id,
+            "items": [{"product_id": product_id, "quantity": quantity} for product_id, quantity in quantities.items()],
+            "status": HELD,
+            "settled": False,
+            "created_at": now,
+            "updated_at": now,
+            "expires_at": now + self.reservation_ttl,
+        }
+        # Recorded first, so holds left by a crash below are released on expiry
+        db.reservations.insert_one(reservation)
+        reservation_id = reservation["_id"]
+
+        result = db.products.bulk_write([
+            UpdateOne(
+                {"_id": product_id, "quantity": {"$gte": quantity}, "holds.reservation_id": {"$ne": reservation_id}},
+                {
+                    "$inc": {"quantity": -quantity},
+                    "$push": {"holds": {"reservation_id": reservation_id, "quantity": quantity}},
+                },
+            )
+            for product_id, quantity in quantities.items()
+        ], ordered=False)
+        if result.matched_count == len(quantities):
+            self._count("reserved")
+            return reservation
+
+        # Products without our hold were short; the others are given back
+        products = db.products.find(
+            {"_id": {"$in": list(quantities)}},
+            {"quantity": 1, "holds": {"$elemMatch": {"reservation_id": reservation_id}}},
+        )
+        held, available = set(), {}
+        for product in products:
+            available[product["_id"]] = max(product.get("quantity", 0), 0)
+            if product.get("holds"):
+                held.add(product["_id"])
+        unavailable = [
+            {"product_id": product_id, "requested": quantity, "available": available.get(product_id, 0)}
+            for product_id, quantity in quantities.items()
+            if product_id not in held
+        ]
+        closed = self._transition({"_id": reservation_id}, FAILED)
+        if closed is not None:
+            self._settle(closed)
+        self._count("out_of_stock")
+        raise OutOfStock(unavailable)
+
+    def get(self, reservation_id: ObjectId, user_id: ObjectId) -> Dict[str, Any]:
+        reservation = db.reservations.find_one({"_id": reservation_id, "user_id": user_id})
+        if reservation is None:
+            raise ReservationNotFound()
+        return reservation
+
+    def checkout(self, reservation_id: ObjectId, user_id: ObjectId) -> Dict[str, Any]:
+        """
+        Turn held stock into a sale. Checking out a committed reservation again
+        returns it unchanged, so clients can retry safely.
+        """
+        self._ensure_sweeper()
+        now = datetime.datetime.utcnow()
+        reservation = self._transition(
+            {"_id": reservation_id, "user_id": user_id, "expires_at": {"$gt": now}}, COMMITTED
+        )
+        if reservation is None:
+            reservation = self.get(reservation_id, user_id)
+            if reservation["status"] == COMMITTED:
+                return reservation
+            # Held past its expiry, waiting for the sweeper
+            raise ReservationClosed(EXPIRED if reservation["status"] == HELD else reservation["status"])
+        self._settle(reservation)
+        self._count("committed")
+        return reservation
+
+    def cancel(self, reservation_id: ObjectId, user_id: ObjectId) -> Dict[str, Any]:
+        """Give the stock of a held reservation back"""
+        self._ensure_sweeper()
+        reservation = self._transition({"_id": reservation_id, "user_id": user_id}, CANCELLED)
+        if reservation is None:
+            reservation = self.get(reservation_id, user_id)
+            if reservation["status"] == CANCELLED:
+                return reservation
+            raise ReservationClosed(reservation["status"])
+        self._settle(reservation)
+        self._count("cancelled")
+        return reservation
+
+    def _transition(self, query: Dict[str, Any], status: str) -> Optional[Dict[str, Any]]:
+        """Move a held reservation to status; None when it was not held anymore"""
+        now = datetime.datetime.utcnow()
+        fields: Dict[str, Any] = {"status": status, "updated_at": now}
+        if status != COMMITTED:
+            fields["purge_at"] = now + self.retention
+        return db.reservations.find_one_and_update(
+            {**query, "status": HELD},
+            {"$set": fields},
+            sort=[("expires_at", 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    def _settle(self, reservation: Dict[str, Any]) -> None:
+        """Pull the holds of a closed reservation, giving stock back unless it was committed"""
+        reservation_id = reservation["_id"]
+        requests = []
+        for item in reservation["items"]:
+            update: Dict[str, Any] = {"$pull": {"holds": {"reservation_id": reservation_id}}}
+            if reservation["status"] != COMMITTED:
+                update["$inc"] = {"quantity": item["quantity"]}
+            requests.append(UpdateOne({"_id": item["product_id"], "holds.reservation_id": reservation_id}, update))
+        db.products.bulk_write(requests, ordered=False)
+        db.reservations.update_one({"_id": reservation_id}, {"$set": {"settled": True}})
+
+    def sweep(self) -> Dict[str, int]:
+        """Release expired reservations and settle abandoned ones, a batch of each"""
+        now = datetime.datetime.utcnow()
+        expired = 0
+        while expired < self.sweep_batch:
+            reservation = self._transition({"expires_at": {"$lte": now}}, EXPIRED)
+            if reservation is None:
+                break
+            self._settle(reservation)
+            expired += 1
+
+        repaired = 0
+        stale = db.reservations.find(
+            {"settled": False, "updated_at": {"$lte": now - STALE_AFTER}, "status": {"$ne": HELD}}
+        ).limit(self.sweep_batch)
+        for reservation in stale:
+            self._settle(reservation)
+            repaired += 1
+
+        self._count("expired", expired)
+        self._count("repaired", repaired)
+        return {"expired": expired, "repaired": repaired}
+
+    def _ensure_sweeper(self) -> None:
+        """
+        Start the sweeper of this process on its first reservation request, so
+        creating an app starts no thread; recreated after a fork.
+        """
+        if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name="inventory-sweeper", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 10) -> None:
+        """Ask the sweeper to exit after its current sweep"""
+        self._stopping.set()
+        if self._thread is not None and self._pid == os.getpid():
+            self._thread.join(timeout)
+        self._thread = None
+
+    def close(self) -> None:
+        """Stop the sweeper for good; it is not stopped again at exit"""
+        atexit.unregister(self.stop)
+        self.stop()
+
+    def _run(self) -> None:
+        while not self._stopping.wait(self.sweep_interval):
+            try:
+                with self.app.app_context():
+                    self.sweep()
+            except Exception as e:
+                self.logger.error(f"Inventory sweep failed: {e}")
+                self._count("sweep_errors")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self._stats)
+
+
+# Inventory of the current app, see Extensions
+inventory = extension("inventory")
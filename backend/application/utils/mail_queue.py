@@ -0,0 +1,192 @@
+"""
+Durable outbound email queue.
+
+Messages are stored in the email_outbox collection by the request that creates
+them and delivered by a pool of worker threads, each keeping its SMTP connection
+open across messages. Failed deliveries are retried with exponential backoff
+and dead-lettered (status "dead") after MAIL_QUEUE_MAX_ATTEMPTS.
+
+Workers start lazily in every process that enqueues mail, or in a dedicated
+process with ``python mail_worker.py``. For local testing point MAIL_SERVER and
+MAIL_PORT at an SMTP stand-in such as ``python -m aiosmtpd -n -l localhost:8025``.
+"""
+import atexit
+import datetime
+import threading
+from typing import Any, Dict, Optional
+
+from bson import ObjectId
+from flask_mail import Mail, Message
+from pymongo import ReturnDocument
+
+from application import db
+from application.extensions import extension
+
+PENDING = "pending"
+SENDING = "sending"
+SENT = "sent"
+DEAD = "dead"
+
+
+class MailQueue:
+    """Mongo-backed outbox delivered by a pool of SMTP worker threads"""
+
+    def __init__(self):
+        self.app = None
+        self.mail = None
+        self._threads = []
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+        atexit.register(self.stop)
+
+    def init_app(self, flask_app) -> None:
+        """Bind to flask_app; no SMTP connection is made until a worker sends mail"""
+        self.app = flask_app
+        self.mail = Mail(flask_app)
+
+    @property
+    def config(self):
+        return self.app.config
+
+    def enqueue(self, recipient: str, subject: str, body: str) -> ObjectId:
+        """Store a message for delivery and return its id; never touches SMTP"""
+        now = datetime.datetime.utcnow()
+        result = db.email_outbox.insert_one({
+            "recipient": recipient,
+            "subject": subject,
+            "body": body,
+            "status": PENDING,
+            "attempts": 0,
+            "next_attempt_at": now,
+            "last_error": None,
+            "created_at": now,
+            "updated_at": now,
+        })
+        if self.config["MAIL_QUEUE_EMBEDDED"]:
+            self.start()
+        self._wakeup.set()
+        return result.inserted_id
+
+    def status(self, message_id: ObjectId) -> Optional[Dict[str, Any]]:
+        """Delivery status of a message, without its content"""
+        return db.email_outbox.find_one(
+            {"_id": message_id},
+            {"status": 1, "attempts": 1, "created_at": 1, "sent_at": 1, "next_attempt_at": 1}
+        )
+
+    def start(self, workers: Optional[int] = None) -> None:
+        """Start the worker threads of this process if they are not running"""
+        with self._lock:
+            self._threads = [thread for thread in self._threads if thread.is_alive()]
+            if self._threads:
+                return
+            self._stopping.clear()
+            for i in range(workers or self.config["MAIL_QUEUE_WORKERS"]):
+                thread = threading.Thread(target=self._run, name=f"mail-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self, timeout: float = 10) -> None:
+        """Ask workers to finish their current message and exit"""
+        self._stopping.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def close(self) -> None:
+        """Stop the workers for good; the queue is not stopped again at exit"""
+        atexit.unregister(self.stop)
+        self.stop()
+
+    def _claim(self) -> Optional[Dict[str, Any]]:
+        """
+        Lease the next due message.
+
+        Leased messages are moved to "sending" with next_attempt_at pushed to
+        the end of the lease, so messages held by a crashed worker are picked
+        up again once it expires.
+        """
+        now = datetime.datetime.utcnow()
+        return db.email_outbox.find_one_and_update(
+            {"status": {"$in": [PENDING, SENDING]}, "next_attempt_at": {"$lte": now}},
+            {
+                "$set": {
+                    "status": SENDING,
+                    "next_attempt_at": now + datetime.timedelta(seconds=self.config["MAIL_QUEUE_LEASE"]),
+                    "updated_at": now,
+                },
+                "$inc": {"attempts": 1},
+            },
+            sort=[("next_attempt_at", 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    def _mark_sent(self, message: Dict[str, Any]) -> None:
+        now = datetime.datetime.utcnow()
+        db.email_outbox.update_one(
+            {"_id": message["_id"]},
+            {"$set": {"status": SENT, "sent_at": now, "updated_at": now, "last_error": None}}
+        )
+
+    def _mark_failed(self, message: Dict[str, Any], error: Exception) -> None:
+        now = datetime.datetime.utcnow()
+        update = {"last_error": str(error), "updated_at": now}
+        if message["attempts"] >= self.config["MAIL_QUEUE_MAX_ATTEMPTS"]:
+            update["status"] = DEAD
+            self.app.logger.error(f"Email {message['_id']} dead-lettered: {error}")
+        else:
+            delay = min(
+                self.config["MAIL_QUEUE_BACKOFF"] * 2 ** (message["attempts"] - 1),
+                self.config["MAIL_QUEUE_MAX_BACKOFF"],
+            )
+            update["status"] = PENDING
+            update["next_attempt_at"] = now + datetime.timedelta(seconds=delay)
+        db.email_outbox.update_one({"_id": message["_id"]}, {"$set": update})
+
+    def _run(self) -> None:
+        """Worker loop: keep one SMTP connection open while there is mail to send"""
+        with self.app.app_context():
+            while not self._stopping.is_set():
+                try:
+                    message = self._claim()
+                except Exception as e:
+                    self.app.logger.error(f"Email queue unavailable: {e}")
+                    message = None
+
+                if message is None:
+                    self._wakeup.wait(self.config["MAIL_QUEUE_POLL_INTERVAL"])
+                    self._wakeup.clear()
+                    continue
+
+                self._deliver_batch(message)
+
+    def _deliver_batch(self, message: Dict[str, Any]) -> None:
+        """Send the claimed message and every further due one on a single connection"""
+        try:
+            with self.mail.connect() as connection:
+                while message is not None and not self._stopping.is_set():
+                    try:
+                        connection.send(Message(
+                            message["subject"],
+                            sender=self.config["MAIL_USERNAME"],
+                            recipients=[message["recipient"]],
+                            body=message["body"],
+                        ))
+                    except Exception as e:
+                        # The connection may be broken; retry the rest on a new one
+                        self._mark_failed(message, e)
+                        message = None
+                        return
+                    self._mark_sent(message)
+                    message = None  # delivered, must not be marked failed below
+                    message = self._claim()
+        except Exception as e:
+            # Connecting to (or leaving) the SMTP server failed
+            if message is not None:
+                self._mark_failed(message, e)
+
+
+# MailQueue of the current app, see Extensions
+mail_queue = extension("mail_queue")
@@ -0,0 +1,301 @@
+"""
+Request and MongoDB command metrics in Prometheus text format.
+
+Flask request hooks count requests per route, method and status and time them;
+a pymongo CommandListener times every command per collection and command name.
+Each process keeps its own counters in memory and every METRICS_FLUSH_INTERVAL
+seconds (and at exit) writes a snapshot to METRICS_DIR. A scrape of
+/api/metrics, served by whichever worker gets it, adds up the snapshots of all
+workers; snapshots left by exited workers are folded into an archive so totals
+never go backwards. Only gunicorn.conf.py sets METRICS_DIR, so setup_db.py,
+mail_worker.py or a benchmark never add their counts to the web server's;
+without it a process writes nothing and reports only its own counters.
+"""
+import atexit
+import fcntl
+import json
+import os
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from flask import Flask, g, request
+from pymongo import monitoring
+
+from application.extensions import register_at_fork
+
+# Upper bounds of the latency buckets, in seconds
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+HELP = {
+    "http_requests_total": "HTTP requests by route, method and status",
+    "http_request_duration_seconds": "HTTP request latency by route and method",
+    "mongodb_commands_total": "MongoDB commands by collection, command and outcome",
+    "mongodb_command_duration_seconds": "MongoDB command latency by collection and command",
+}
+
+ARCHIVE = "archived.json"
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class MetricsRegistry:
+    """Counters and histograms of the current process, aggregated across processes on scrape"""
+
+    def __init__(self, directory: Optional[str] = None, flush_interval: float = 10):
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._counters: Dict[Tuple[str, Labels], float] = {}
+        # name, labels -> [bucket counts..., sum, count]
+        self._histograms: Dict[Tuple[str, Labels], List[float]] = {}
+        self._lock = threading.Lock()
+        self._writer: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+        register_at_fork(self._forget)
+        atexit.register(self.write_snapshot)
+
+    def init_app(self, app: Flask) -> None:
+        """Take settings from app.config and time its requests when METRICS_ENABLED"""
+        self.directory = app.config["METRICS_DIR"]
+        self.flush_interval = app.config["METRICS_FLUSH_INTERVAL"]
+        if app.config["METRICS_ENABLED"]:
+            install(app, self)
+
+    def _forget(self) -> None:
+        # Counts made by the parent are the parent's to report
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._writer = None
+
+    def inc(self, name: str, labels: Labels, amount: float = 1) -> None:
+        key = (name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+        if self._writer is None:
+            self._start_writer()
+
+    def observe(self, name: str, labels: Labels, value: float) -> None:
+        key = (name, labels)
+        bucket = len(LATENCY_BUCKETS)
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if value <= bound:
+                bucket = i
+                break
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [0] * (len(LATENCY_BUCKETS) + 3)
+            histogram[bucket] += 1
+            histogram[-2] += value
+            histogram[-1] += 1
+        if self._writer is None:
+            self._start_writer()
+
+    def _start_writer(self) -> None:
+        with self._lock:
+            if self._writer is not None:
+                return
+            self._writer = threading.Thread(target=self._run, name="metrics-writer", daemon=True)
+            self._writer.start()
+
+    def close(self) -> None:
+        """Stop the snapshot writer and write a last snapshot"""
+        atexit.unregister(self.write_snapshot)
+        self._stopping.set()
+        if self._writer is not None:
+            self._writer.join()
+        try:
+            self.write_snapshot()
+        except OSError:
+            pass
+
+    def _run(self) -> None:
+        while not self._stopping.wait(self.flush_interval):
+            try:
+                self.write_snapshot()
+            except OSError:
+                pass
+
+    def snapshot(self) -> Dict[str, list]:
+        with self._lock:
+            return {
+                "counters": [[name, list(labels), value] for (name, labels), value in self._counters.items()],
+                "histograms": [[name, list(labels), list(values)] for (name, labels), values in self._histograms.items()],
+            }
+
+    def _path(self, pid: int) -> str:
+        return os.path.join(self.directory, f"metrics-{pid}.json")
+
+    def write_snapshot(self) -> None:
+        snapshot = self.snapshot()
+        if self.directory is None or (not snapshot["counters"] and not snapshot["histograms"]):
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(os.getpid())
+        with open(f"{path}.tmp", "w") as file:
+            json.dump(snapshot, file)
+        os.replace(f"{path}.tmp", path)
+
+    def _archive_exited(self) -> None:
+        """Fold snapshots of processes that no longer exist into the archive"""
+        os.makedirs(self.directory, exist_ok=True)
+        exited = []
+        for filename in os.listdir(self.directory):
+            if not (filename.startswith("metrics-") and filename.endswith(".json")):
+                continue
+            pid = int(filename[len("metrics-"):-len(".json")])
+            try:
+                os.kill(pid, 0)
+            except ProcessLookupError:
+                exited.append(os.path.join(self.directory, filename))
+            except PermissionError:
+                pass
+        if not exited:
+            return
+
+        archive_path = os.path.join(self.directory, ARCHIVE)
+        with open(os.path.join(self.directory, "archive.lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            totals = _load(archive_path) or {"counters": [], "histograms": []}
+            merged = _merge([totals] + [_load(path) for path in exited])
+            with open(f"{archive_path}.tmp", "w") as file:
+                json.dump(_dump_merged(merged), file)
+            os.replace(f"{archive_path}.tmp", archive_path)
+            for path in exited:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+
+    def collect(self) -> Tuple[Dict, Dict]:
+        """Counters and histograms summed over every process, live and exited"""
+        if self.directory is None:
+            return _merge([self.snapshot()])
+        self._archive_exited()
+        own = self._path(os.getpid())
+        snapshots = [self.snapshot()]
+        for filename in os.listdir(self.directory):
+            path = os.path.join(self.directory, filename)
+            if path != own and (filename == ARCHIVE or (filename.startswith("metrics-") and filename.endswith(".json"))):
+                snapshots.append(_load(path))
+        return _merge(snapshots)
+
+    def render(self) -> str:
+        counters, histograms = self.collect()
+        lines = []
+        for name in sorted({name for name, _ in counters}):
+            _header(lines, name, "counter")
+            for (metric, labels), value in sorted(counters.items()):
+                if metric == name:
+                    lines.append(f"{name}{_format_labels(labels)} {_number(value)}")
+        for name in sorted({name for name, _ in histograms}):
+            _header(lines, name, "histogram")
+            for (metric, labels), values in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS + (float("inf"),), values):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f"{name}_bucket{_format_labels(labels + (('le', le),))} {_number(cumulative)}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {values[-2]!r}")
+                lines.append(f"{name}_count{_format_labels(labels)} {_number(values[-1])}")
+        return "\n".join(lines) + "\n"
+
+
+def _load(path: str) -> Optional[dict]:
+    try:
+        with open(path) as file:
+            return json.load(file)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def _merge(snapshots: Iterable[Optional[dict]]) -> Tuple[Dict, Dict]:
+    counters: Dict[Tuple[str, Labels], float] = {}
+    histograms: Dict[Tuple[str, Labels], List[float]] = {}
+    for snapshot in snapshots:
+        if not snapshot:
+            continue
+        for name, labels, value in snapshot["counters"]:
+            key = (name, tuple(tuple(label) for label in labels))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, values in snapshot["histograms"]:
+            key = (name, tuple(tuple(label) for label in labels))
+            total = histograms.get(key)
+            histograms[key] = values[:] if total is None else [a + b for a, b in zip(total, values)]
+    return counters, histograms
+
+
+def _dump_merged(merged: Tuple[Dict, Dict]) -> dict:
+    counters, histograms = merged
+    return {
+        "counters": [[name, list(labels), value] for (name, labels), value in counters.items()],
+        "histograms": [[name, list(labels), values] for (name, labels), values in histograms.items()],
+    }
+
+
+def _header(lines: List[str], name: str, kind: str) -> None:
+    lines.append(f"# HELP {name} {HELP.get(name, name)}")
+    lines.append(f"# TYPE {name} {kind}")
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(str(value))}"' for key, value in labels) + "}"
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(value)
+
+
+class CommandMetrics(monitoring.CommandListener):
+    """Times MongoDB commands per collection and command name"""
+
+    def __init__(self, registry: MetricsRegistry):
+        self.registry = registry
+        self._collections: Dict[Tuple[int, object], str] = {}
+
+    def started(self, event):
+        collection = event.command.get(event.command_name)
+        if event.command_name == "getMore":
+            collection = event.command.get("collection")
+        self._collections[(event.request_id, event.connection_id)] = (
+            collection if isinstance(collection, str) else ""
+        )
+
+    def _record(self, event, outcome):
+        collection = self._collections.pop((event.request_id, event.connection_id), "")
+        labels = (("collection", collection), ("command", event.command_name))
+        self.registry.inc("mongodb_commands_total", labels + (("outcome", outcome),))
+        self.registry.observe("mongodb_command_duration_seconds", labels, event.duration_micros / 1e6)
+
+    def succeeded(self, event):
+        self._record(event, "success")
+
+    def failed(self, event):
+        self._record(event, "failure")
+
+
+def install(flask_app: Flask, registry: MetricsRegistry) -> None:
+    """Time every request of flask_app through request hooks"""
+
+    @flask_app.before_request
+    def start_timer():
+        g.metrics_started = time.perf_counter()
+
+    @flask_app.after_request
+    def record_request(response):
+        started = g.pop("metrics_started", None)
+        if started is not None:
+            route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+            labels = (("route", route), ("method", request.method))
+            registry.observe("http_request_duration_seconds", labels, time.perf_counter() - started)
+            registry.inc("http_requests_total", labels + (("status", str(response.status_code)),))
+        return response
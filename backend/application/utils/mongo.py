@@ -0,0 +1,233 @@
+"""
+Per-process MongoDB client with connection pool instrumentation.
+
+MongoClient is not fork-safe, so the client is created on first use in each
+process and discarded in forked children: gunicorn or uwsgi workers forked
+from a preloading master each open their own pool. Every client gets a
+PoolMonitor recording checkout wait times and how close each pool comes to
+maxPoolSize, to size worker counts against the server's connection limit
+(workers x MONGO_MAX_POOL_SIZE connections per mongod at most).
+
+Every app gets its own MongoConnection (see application.extensions); settings
+and command listeners are given to init_app() and apply to clients created
+afterwards.
+"""
+import os
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+from pymongo import MongoClient, monitoring
+from pymongo.database import Database
+
+from application.extensions import register_at_fork
+
+# Upper bounds of the checkout wait buckets, in seconds
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+
+class PoolMonitor(monitoring.ConnectionPoolListener):
+    """Connection pool counters of the current process, per server address"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._pools: Dict[str, Dict[str, Any]] = {}
+
+    def reset(self) -> None:
+        """Start over in a forked child; the parent's lock may have been held at fork"""
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._pools = {}
+
+    def _pool(self, address) -> Dict[str, Any]:
+        key = "%s:%s" % address
+        pool = self._pools.get(key)
+        if pool is None:
+            pool = self._pools[key] = {
+                "open": 0,
+                "checked_out": 0,
+                "peak_checked_out": 0,
+                "checkouts": 0,
+                "checkout_failures": {},
+                "wait_total_s": 0.0,
+                "wait_max_s": 0.0,
+                "wait_buckets": [0] * (len(WAIT_BUCKETS) + 1),
+                "cleared": 0,
+            }
+        return pool
+
+    def _waited(self, event) -> float:
+        # Recent PyMongo versions report the wait; otherwise time it ourselves
+        duration = getattr(event, "duration", None)
+        if duration is not None:
+            return duration
+        started = getattr(self._local, "started", None)
+        return time.perf_counter() - started if started is not None else 0.0
+
+    def pool_created(self, event):
+        with self._lock:
+            self._pool(event.address)
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self._pool(event.address)["cleared"] += 1
+
+    def pool_closed(self, event):
+        with self._lock:
+            self._pools.pop("%s:%s" % event.address, None)
+
+    def connection_created(self, event):
+        with self._lock:
+            self._pool(event.address)["open"] += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        with self._lock:
+            pool = self._pool(event.address)
+            pool["open"] = max(pool["open"] - 1, 0)
+
+    def connection_check_out_started(self, event):
+        self._local.started = time.perf_counter()
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            failures = self._pool(event.address)["checkout_failures"]
+            failures[event.reason] = failures.get(event.reason, 0) + 1
+
+    def connection_checked_out(self, event):
+        waited = self._waited(event)
+        bucket = len(WAIT_BUCKETS)
+        for i, bound in enumerate(WAIT_BUCKETS):
+            if waited <= bound:
+                bucket = i
+                break
+        with self._lock:
+            pool = self._pool(event.address)
+            pool["checkouts"] += 1
+            pool["checked_out"] += 1
+            pool["peak_checked_out"] = max(pool["peak_checked_out"], pool["checked_out"])
+            pool["wait_total_s"] += waited
+            pool["wait_max_s"] = max(pool["wait_max_s"], waited)
+            pool["wait_buckets"][bucket] += 1
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            pool = self._pool(event.address)
+            pool["checked_out"] = max(pool["checked_out"] - 1, 0)
+
+    def stats(self, max_pool_size: int) -> Dict[str, Any]:
+        with self._lock:
+            pools = {}
+            for address, pool in self._pools.items():
+                pools[address] = {
+                    **pool,
+                    "checkout_failures": dict(pool["checkout_failures"]),
+                    "wait_buckets": dict(zip(
+                        [str(bound) for bound in WAIT_BUCKETS] + ["+Inf"], pool["wait_buckets"]
+                    )),
+                    "wait_avg_s": pool["wait_total_s"] / pool["checkouts"] if pool["checkouts"] else 0.0,
+                    "saturation": pool["checked_out"] / max_pool_size if max_pool_size else None,
+                    "peak_saturation": pool["peak_checked_out"] / max_pool_size if max_pool_size else None,
+                }
+            return pools
+
+
+class MongoConnection:
+    """Lazily created MongoClient of the current process, configured by init_app()"""
+
+    def __init__(self):
+        self.uri: Optional[str] = None
+        self.database_name: Optional[str] = None
+        self.options: Dict[str, Any] = {}
+        self.pool_monitor = PoolMonitor()
+        self._listeners: List[Any] = [self.pool_monitor]
+        self._client: Optional[MongoClient] = None
+        self._database: Optional[Database] = None
+        self._lock = threading.Lock()
+        register_at_fork(self._forget)
+
+    def init_app(self, app, listeners: Iterable[Any] = ()) -> None:
+        """Take settings from app.config; no connection is made until first use"""
+        config = app.config
+        options = {
+            "maxPoolSize": config["MONGO_MAX_POOL_SIZE"],
+            "minPoolSize": config["MONGO_MIN_POOL_SIZE"],
+            "waitQueueTimeoutMS": config["MONGO_WAIT_QUEUE_TIMEOUT_MS"],
+            "serverSelectionTimeoutMS": config["MONGO_SERVER_SELECTION_TIMEOUT_MS"],
+            "connect": False,
+        }
+        if config["MONGO_COMPRESSORS"]:
+            options["compressors"] = config["MONGO_COMPRESSORS"]
+
+        with self._lock:
+            if self._client is not None:
+                self._client.close()
+            self._client = None
+            self._database = None
+            self.uri = config["MONGO_URI"]
+            self.database_name = config["MONGO_DATABASE"]
+            self.options = options
+            self._listeners = [self.pool_monitor, *listeners]
+
+    def close(self) -> None:
+        """Close the client of this process; a later query opens a new one"""
+        with self._lock:
+            if self._client is not None:
+                self._client.close()
+            self._client = None
+            self._database = None
+
+    def _forget(self) -> None:
+        # The parent's client and its sockets belong to the parent; never close them here
+        self._client = None
+        self._database = None
+        self._lock = threading.Lock()
+        self.pool_monitor.reset()
+
+    @property
+    def client(self) -> MongoClient:
+        client = self._client
+        if client is None:
+            with self._lock:
+                if self.database_name is None:
+                    raise RuntimeError("MongoDB is not configured; call create_app() first")
+                if self._client is None:
+                    self._client = MongoClient(
+                        self.uri, event_listeners=list(self._listeners), **self.options
+                    )
+                client = self._client
+        return client
+
+    def database(self) -> Database:
+        database = self._database
+        if database is None:
+            database = self._database = self.client[self.database_name]
+        return database
+
+    def pool_stats(self) -> Dict[str, Any]:
+        max_pool_size = self.options.get("maxPoolSize", 100)
+        return {
+            "pid": os.getpid(),
+            "max_pool_size": max_pool_size,
+            "min_pool_size": self.options.get("minPoolSize", 0),
+            "pools": self.pool_monitor.stats(max_pool_size),
+        }
+
+
+class DatabaseProxy:
+    """Stands in for the Database of the current process, wherever db was imported"""
+
+    def __init__(self, connection: MongoConnection):
+        self._connection = connection
+
+    def __getattr__(self, name):
+        return getattr(self._connection.database(), name)
+
+    def __getitem__(self, name):
+        return self._connection.database()[name]
@@ -0,0 +1,80 @@
+"""
+Keyset (cursor) pagination helpers for MongoDB listings
+"""
+import base64
+import datetime
+from typing import Any, Dict, List, Tuple
+
+from bson import ObjectId, json_util
+
+SortSpec = List[Tuple[str, int]]
+
+# Types a sort key value can have; anything else (operator documents, regexes,
+# arrays...) would be injected into the query by keyset_filter
+CURSOR_VALUE_TYPES = (ObjectId, int, float, str, datetime.datetime, type(None))
+
+
+def encode_cursor(document: Dict[str, Any], sort: SortSpec) -> str:
+    """Build an opaque cursor pointing just after the given document"""
+    payload = {
+        "s": [field for field, _ in sort],
+        "v": [document.get(field) for field, _ in sort],
+    }
+    raw = json_util.dumps(payload).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(token: str, sort: SortSpec) -> List[Any]:
+    """Decode a cursor into the sort key values it points at"""
+    padding = "=" * (-len(token) % 4)
+    try:
+        payload = json_util.loads(base64.urlsafe_b64decode(token + padding))
+        fields, values = payload["s"], payload["v"]
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+    # A cursor is only meaningful for the ordering it was issued for
+    if fields != [field for field, _ in sort] or len(values) != len(sort):
+        raise ValueError("Invalid cursor")
+    if not all(isinstance(value, CURSOR_VALUE_TYPES) for value in values):
+        raise ValueError("Invalid cursor")
+
+    return values
+
+
+def keyset_filter(sort: SortSpec, values: List[Any]) -> Dict[str, Any]:
+    """
+    Translate cursor values into a range filter on the sort key.
+
+    For a sort on (a, _id) this yields a >= va AND (a > va OR (a == va AND _id > vid)),
+    so the leading bound can be served straight from the index.
+    """
+    clauses = []
+    for i, (field, direction) in enumerate(sort):
+        clause = {prev: value for (prev, _), value in zip(sort[:i], values[:i])}
+        clause[field] = {"$gt" if direction == 1 else "$lt": values[i]}
+        clauses.append(clause)
+
+    if len(clauses) == 1:
+        return clauses[0]
+
+    first_field, first_direction = sort[0]
+    return {
+        first_field: {"$gte" if first_direction == 1 else "$lte": values[0]},
+        "$or": clauses,
+    }
+
+
+def paginate(cursor, sort: SortSpec, size: int):
+    """
+    Fetch one page from a pymongo cursor already filtered with keyset_filter.
+
+    Returns the documents of the page and the cursor for the next one (None on the
+    last page). One extra document is read to know whether another page exists.
+    """
+    documents = list(cursor.sort(sort).limit(size + 1))
+    next_cursor = None
+    if len(documents) > size:
+        documents = documents[:size]
+        next_cursor = encode_cursor(documents[-1], sort)
+    return documents, next_cursor
@@ -0,0 +1,120 @@
+"""
+Password hashing service.
+
+Hashing and verification are deliberately slow, so they run in a bounded
+process pool instead of on the request thread. At most PASSWORD_HASH_WORKERS
+hashes run at once with PASSWORD_HASH_QUEUE_LIMIT more waiting; beyond that
+callers are rejected immediately with HashingBusy rather than piling up.
+Setting PASSWORD_HASH_WORKERS=0 hashes inline. A hash taking longer than
+PASSWORD_HASH_TIMEOUT also raises HashingBusy; its slot stays taken until the
+job really ends, so slow jobs cannot pile up behind the limit.
+
+The algorithm and cost come from PASSWORD_HASH_METHOD in werkzeug notation,
+e.g. "scrypt:32768:8:1" or "pbkdf2:sha256:600000"; hashes made with other
+parameters are reported by needs_rehash() so they can be upgraded at login.
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from typing import Optional
+
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+
+from application.extensions import extension
+
+
+class HashingBusy(Exception):
+    """Raised when the hashing pool and its queue are full"""
+    pass
+
+
+def canonical_method(method: str) -> str:
+    """
+    Method prefix werkzeug writes in hashes made with method, its defaults
+    filled in: "scrypt" is stored as "scrypt:32768:8:1".
+    """
+    name, *args = method.split(":")
+    if name == "scrypt":
+        n, r, p = map(int, args) if args else (2 ** 15, 8, 1)
+        return f"scrypt:{n}:{r}:{p}"
+    if name == "pbkdf2" and len(args) <= 2:
+        hash_name = args[0] if args else "sha256"
+        iterations = int(args[1]) if len(args) == 2 else DEFAULT_PBKDF2_ITERATIONS
+        return f"pbkdf2:{hash_name}:{iterations}"
+    raise ValueError(f"Invalid hash method '{method}'")
+
+
+class PasswordHasher:
+    """Bounded process pool running werkzeug password hashing"""
+
+    def __init__(self, method: str, workers: int, queue_limit: int, timeout: float):
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+        self.configure(method, workers, queue_limit, timeout)
+
+    def configure(self, method: str, workers: int, queue_limit: int, timeout: float) -> None:
+        self.shutdown()
+        self.method = method
+        self._prefix = canonical_method(method)
+        self.workers = workers
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(workers + queue_limit) if workers else None
+
+    def _pool(self) -> ProcessPoolExecutor:
+        """
+        Process pool of the current process.
+
+        Created on first use and recreated after a fork, so gunicorn workers
+        never share the pool of a preloading master.
+        """
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                # Never fork a multi-threaded worker: children start from a clean process
+                start_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context(start_method)
+                )
+                self._pid = os.getpid()
+            return self._executor
+
+    def _run(self, func, *args):
+        if not self.workers:
+            return func(*args)
+
+        slots = self._slots
+        if not slots.acquire(blocking=False):
+            raise HashingBusy("Password hashing capacity exhausted")
+        try:
+            future = self._pool().submit(func, *args)
+        except BaseException:
+            slots.release()
+            raise
+        # Released when the job ends, even if the caller stopped waiting for it
+        future.add_done_callback(lambda _: slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            future.cancel()
+            raise HashingBusy("Password hashing timed out")
+
+    def hash(self, password: str) -> str:
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, pwhash: str, password: str) -> bool:
+        return self._run(check_password_hash, pwhash, password)
+
+    def needs_rehash(self, pwhash: str) -> bool:
+        """Whether pwhash was made with a different algorithm or cost than configured"""
+        return pwhash.split("$", 1)[0] != self._prefix
+
+    def shutdown(self) -> None:
+        with self._lock:
+            if self._executor is not None and self._pid == os.getpid():
+                self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+# PasswordHasher of the current app, see Extensions
+password_hasher = extension("password_hasher")
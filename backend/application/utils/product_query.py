@@ -0,0 +1,283 @@
+"""
+Translation of product listing parameters into index-backed MongoDB queries
+"""
+from typing import Any, Dict, List, Mapping, Optional
+
+from application.utils.pagination import SortSpec, keyset_filter
+
+# Public sort names accepted in ?sort=, a leading "-" reverses the order
+SORT_FIELDS = {
+    "price": "price",
+    "sale_price": "sale_price",
+    "rating": "rating",
+    "created_at": "created_at",
+}
+SORT_ALIASES = {"newest": "-created_at"}
+
+# Indexes able to serve each sort key, keyed by the equality filter leading the
+# index (None for the plain sort index). Every key ends with _id so pages can be
+# cut with a keyset on (sort field, _id) without an in-memory sort.
+# The products listing indexes in migrations.INDEXES are derived from it.
+SORT_INDEXES = {
+    "_id": {
+        None: [("_id", 1)],
+        "category": [("category", 1), ("_id", 1)],
+        "on_sale": [("on_sale", 1), ("_id", 1)],
+    },
+    "price": {
+        None: [("price", 1), ("_id", 1)],
+        "category": [("category", 1), ("price", 1), ("_id", 1)],
+    },
+    "sale_price": {
+        None: [("sale_price", 1), ("_id", 1)],
+        "on_sale": [("on_sale", 1), ("sale_price", 1), ("_id", 1)],
+    },
+    "rating": {
+        None: [("rating", 1), ("_id", 1)],
+        "category": [("category", 1), ("rating", 1), ("_id", 1)],
+    },
+    "created_at": {
+        None: [("created_at", 1), ("_id", 1)],
+        "category": [("category", 1), ("created_at", 1), ("_id", 1)],
+    },
+}
+
+# Equality filters in the order they are preferred as index prefix
+EQUALITY_FILTERS = ["category", "on_sale"]
+
+# Range filters on a sort field; the index of that sort bounds them
+RANGE_FILTERS = ["price", "rating"]
+
+# Listing parameters setting each filtered field, for error messages
+FILTER_PARAMS = {
+    "category": "category",
+    "on_sale": "on_sale",
+    "price": "min_price/max_price",
+    "rating": "min_rating",
+}
+
+# Fields clients may request through ?fields=
+PRODUCT_FIELDS = [
+    "title",
+    "price",
+    "sale_price",
+    "on_sale",
+    "description",
+    "image",
+    "category",
+    "quantity",
+    "rating",
+    "reviews",
+    "created_at",
+    "updated_at",
+]
+
+# Named field sets usable in ?fields= next to plain field names
+FIELD_PRESETS = {
+    "card": ["title", "price", "sale_price", "on_sale", "image", "category", "rating", "reviews"],
+    "full": PRODUCT_FIELDS,
+}
+DEFAULT_FIELDS = "card"
+
+# Fields changed by reservations, which do not bump the catalog version
+STOCK_FIELDS = ["quantity"]
+
+# Text search results are ranked by relevance, ties broken by _id
+SEARCH_SORT = [("score", -1), ("_id", -1)]
+MAX_SEARCH_LENGTH = 100
+
+SUPPORTED_SORTS = sorted(SORT_FIELDS) + ["-" + name for name in sorted(SORT_FIELDS)] + sorted(SORT_ALIASES)
+SUPPORTED_FILTERS = ["category", "on_sale", "min_price", "max_price", "min_rating"]
+
+
+def parse_fields(value: Optional[str]) -> List[str]:
+    """Resolve a ?fields= value into the list of product fields to return"""
+    fields: List[str] = []
+    for name in (value or DEFAULT_FIELDS).split(","):
+        name = name.strip()
+        if not name:
+            continue
+        if name in FIELD_PRESETS:
+            requested = FIELD_PRESETS[name]
+        elif name in PRODUCT_FIELDS:
+            requested = [name]
+        else:
+            raise ValueError(f"Unknown field: {name}")
+        fields.extend(field for field in requested if field not in fields)
+
+    if not fields:
+        raise ValueError("At least one field is required")
+    return fields
+
+
+def shows_stock(args: Mapping[str, str]) -> bool:
+    """Whether a listing returns stock fields, so must not be cached by catalog version"""
+    try:
+        fields = parse_fields(args.get("fields"))
+    except ValueError:
+        return False
+    return any(field in STOCK_FIELDS for field in fields)
+
+
+def build_projection(fields: List[str], sort: SortSpec) -> Dict[str, int]:
+    """
+    Build the Mongo projection for the requested fields.
+
+    Sort keys are always included since the next page cursor is built from
+    them. Listing indexes end with _id, so when the requested fields and the
+    filters all belong to the hinted index Mongo answers from the index alone.
+    """
+    projection = {field: 1 for field in fields}
+    for field, _ in sort:
+        if field in PRODUCT_FIELDS:
+            projection[field] = 1
+    return projection
+
+
+def _parse_bool(value: str) -> bool:
+    lowered = value.strip().lower()
+    if lowered in ("true", "1", "yes"):
+        return True
+    if lowered in ("false", "0", "no"):
+        return False
+    raise ValueError("on_sale must be true or false")
+
+
+def _parse_float(name: str, value: str) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} must be a number")
+
+
+def parse_sort(value: Optional[str]) -> SortSpec:
+    """Resolve a ?sort= value into a sort specification ending with _id"""
+    if not value:
+        return [("_id", 1)]
+
+    value = SORT_ALIASES.get(value, value)
+    direction = -1 if value.startswith("-") else 1
+    field = SORT_FIELDS.get(value.lstrip("-"))
+    if not field:
+        raise ValueError(f"Unsupported sort, expected one of: {', '.join(SUPPORTED_SORTS)}")
+
+    return [(field, direction), ("_id", direction)]
+
+
+def build_product_filter(args) -> Dict[str, Any]:
+    """Build the MongoDB filter for the whitelisted listing filters"""
+    query: Dict[str, Any] = {}
+
+    category = args.get("category")
+    if category:
+        query["category"] = category.strip()
+
+    on_sale = args.get("on_sale")
+    if on_sale:
+        query["on_sale"] = _parse_bool(on_sale)
+
+    price_range = {}
+    if args.get("min_price"):
+        price_range["$gte"] = _parse_float("min_price", args.get("min_price"))
+    if args.get("max_price"):
+        price_range["$lte"] = _parse_float("max_price", args.get("max_price"))
+    if price_range:
+        if price_range.get("$gte", 0) > price_range.get("$lte", float("inf")):
+            raise ValueError("min_price cannot be greater than max_price")
+        query["price"] = price_range
+
+    if args.get("min_rating"):
+        min_rating = _parse_float("min_rating", args.get("min_rating"))
+        if not 0 <= min_rating <= 5:
+            raise ValueError("min_rating must be between 0 and 5")
+        query["rating"] = {"$gte": min_rating}
+
+    return query
+
+
+def default_sort(query: Dict[str, Any]) -> SortSpec:
+    """
+    Order of listings without ?sort=: by _id, or by the range filtered field
+    when no equality filter leads an _id index, so the range bounds the scan.
+    """
+    if not any(field in query for field in SORT_INDEXES["_id"] if field):
+        for field in RANGE_FILTERS:
+            if field in query:
+                return [(field, 1), ("_id", 1)]
+    return [("_id", 1)]
+
+
+def select_index(query: Dict[str, Any], sort: SortSpec) -> List:
+    """
+    Pick the index serving the sort, preferring one led by an equality filter.
+
+    The result is passed as a hint so the planner can never fall back to a
+    collection scan or an in-memory sort; remaining filters are applied to the
+    index scan results. A filtered listing must be bounded by the leading key:
+    an equality filter leading the index or a range on the sort field. Other
+    combinations would walk the whole index and raise ValueError instead.
+    """
+    sort_field = sort[0][0]
+    candidates = SORT_INDEXES[sort_field]
+    for field in EQUALITY_FILTERS:
+        if field in query and field in candidates:
+            return candidates[field]
+    if query and sort_field not in query:
+        bounding = [field for field in candidates if field]
+        if sort_field in RANGE_FILTERS:
+            bounding.append(sort_field)
+        message = "Unsupported filters for this sort, choose another sort"
+        if bounding:
+            message += f" or also filter by {' or '.join(FILTER_PARAMS[field] for field in bounding)}"
+        raise ValueError(message)
+    return candidates[None]
+
+
+def build_product_query(args) -> Dict[str, Any]:
+    """
+    Translate listing query parameters into a filter, sort, index hint and projection.
+
+    Raises ValueError for malformed values, unknown fields or unsupported sorts.
+    """
+    query = build_product_filter(args)
+    sort = parse_sort(args.get("sort")) if args.get("sort") else default_sort(query)
+    return {
+        "filter": query,
+        "sort": sort,
+        "hint": select_index(query, sort),
+        "projection": build_projection(parse_fields(args.get("fields")), sort),
+    }
+
+
+def merge_filters(*filters: Dict[str, Any]) -> Dict[str, Any]:
+    """AND together non-empty filters"""
+    filters = [f for f in filters if f]
+    if not filters:
+        return {}
+    if len(filters) == 1:
+        return filters[0]
+    return {"$and": filters}
+
+
+def build_search_pipeline(terms: str, args, size: int, after: Optional[List[Any]] = None) -> List[Dict[str, Any]]:
+    """
+    Build the aggregation ranking $text matches by textScore.
+
+    The score is materialized as a regular field so pages can be resumed with
+    the same keyset filter as the listing; ``after`` holds decoded cursor values.
+    """
+    match = build_product_filter(args)
+    match["$text"] = {"$search": terms}
+
+    pipeline = [
+        {"$match": match},
+        {"$addFields": {"score": {"$meta": "textScore"}}},
+        {"$sort": dict(SEARCH_SORT)},
+    ]
+    if after is not None:
+        pipeline.append({"$match": keyset_filter(SEARCH_SORT, after)})
+    pipeline.extend([
+        {"$limit": size + 1},
+        {"$project": {**build_projection(parse_fields(args.get("fields")), SEARCH_SORT), "score": 1}},
+    ])
+    return pipeline
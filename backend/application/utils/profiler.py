@@ -0,0 +1,293 @@
+"""
+Slow-query log built on pymongo command monitoring.
+
+Every command taking at least SLOW_QUERY_MS is logged and aggregated by its
+normalized shape: collection, command and the structure of its filter, sort and
+pipeline with every literal value replaced by "?". The first time a shape turns
+up, the command is explained (queryPlanner verbosity, so it is not executed) on
+a background thread, at most once every SLOW_QUERY_EXPLAIN_INTERVAL seconds,
+and shapes whose winning plan contains a COLLSCAN or an in-memory SORT are
+flagged. The report is per process.
+"""
+import datetime
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from typing import Any, Dict, Iterator, Optional
+
+from pymongo import monitoring
+
+from application.extensions import register_at_fork
+
+EXPLAINABLE = {"find", "aggregate", "count", "distinct", "update", "delete", "findAndModify"}
+FLAGGED_STAGES = {"COLLSCAN", "SORT"}
+
+# Parts of a command that describe its shape, per command name
+SHAPE_FIELDS = {
+    "find": ("filter", "sort", "projection", "hint", "skip", "limit"),
+    "aggregate": ("pipeline", "hint"),
+    "count": ("query", "hint", "skip", "limit"),
+    "distinct": ("key", "query"),
+    "findAndModify": ("query", "sort", "remove", "upsert"),
+}
+# Keys kept verbatim: they name fields and directions rather than carry data
+STRUCTURAL_KEYS = {"sort", "projection", "hint", "key", "$sort", "$project", "$group"}
+# Session and routing fields added by the driver, never sent back in explain
+DRIVER_FIELDS = {"lsid", "txnNumber", "autocommit", "startTransaction", "readConcern", "writeConcern"}
+
+
+def plan_stages(plan) -> Iterator[str]:
+    """Yield every stage name found in an explain plan tree"""
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            yield plan["stage"]
+        for value in plan.values():
+            yield from plan_stages(value)
+    elif isinstance(plan, list):
+        for item in plan:
+            yield from plan_stages(item)
+
+
+def index_scans(plan) -> Iterator[dict]:
+    """Yield every IXSCAN stage of an explain plan tree"""
+    if isinstance(plan, dict):
+        if plan.get("stage") == "IXSCAN":
+            yield plan
+        for value in plan.values():
+            yield from index_scans(value)
+    elif isinstance(plan, list):
+        for item in plan:
+            yield from index_scans(item)
+
+
+def winning_plans(explain) -> Iterator[dict]:
+    """Yield every winningPlan in an explain result, rejected plans excluded"""
+    if isinstance(explain, dict):
+        for key, value in explain.items():
+            if key == "winningPlan":
+                yield value
+            elif key != "rejectedPlans":
+                yield from winning_plans(value)
+    elif isinstance(explain, list):
+        for item in explain:
+            yield from winning_plans(item)
+
+
+def normalize(value: Any, structural: bool = False) -> Any:
+    """Replace literal values by "?", keeping keys, operators and structural parts"""
+    if isinstance(value, dict):
+        return {
+            key: normalize(item, structural or key in STRUCTURAL_KEYS)
+            for key, item in value.items()
+        }
+    if isinstance(value, (list, tuple)):
+        if structural or any(isinstance(item, dict) for item in value):
+            return [normalize(item, structural) for item in value]
+        return ["?"]
+    if structural and isinstance(value, (int, float, str, bool)):
+        return value
+    return "?"
+
+
+def command_shape(command_name: str, command: Dict[str, Any]) -> Dict[str, Any]:
+    if command_name in ("update", "delete"):
+        statements = command.get(f"{command_name}s") or [{}]
+        first = statements[0]
+        shape = {"q": normalize(first.get("q", {}))}
+        if "hint" in first:
+            shape["hint"] = normalize(first["hint"], True)
+        if "multi" in first or "limit" in first:
+            shape["multi"] = first.get("multi", first.get("limit") == 0)
+        return shape
+
+    shape = {}
+    for field in SHAPE_FIELDS.get(command_name, ()):
+        if field not in command:
+            continue
+        if field in ("skip", "limit"):
+            shape[field] = "?"
+        elif field in ("remove", "upsert"):
+            shape[field] = command[field]
+        else:
+            shape[field] = normalize(command[field], field in STRUCTURAL_KEYS)
+    return shape
+
+
+def explain_command(command: Dict[str, Any]) -> Dict[str, Any]:
+    """The command as it can be resent inside explain"""
+    return {
+        key: value for key, value in command.items()
+        if not key.startswith("$") and key not in DRIVER_FIELDS
+    }
+
+
+class SlowQueryLog(monitoring.CommandListener):
+    """Aggregates slow commands by shape and explains each new shape once"""
+
+    def __init__(self, connection, threshold_ms: float = 100, explain_interval: float = 10, max_shapes: int = 500):
+        self.connection = connection
+        self.logger = logging.getLogger(__name__)
+        self.threshold_us = threshold_ms * 1000
+        self.explain_interval = explain_interval
+        self.max_shapes = max_shapes
+        self._forget()
+        register_at_fork(self._forget)
+
+    @property
+    def enabled(self) -> bool:
+        return self.threshold_us > 0
+
+    def init_app(self, app) -> None:
+        """Take settings from app.config; SLOW_QUERY_MS=0 disables the log"""
+        self.logger = app.logger
+        self.threshold_us = app.config["SLOW_QUERY_MS"] * 1000
+        self.explain_interval = app.config["SLOW_QUERY_EXPLAIN_INTERVAL"]
+        self.max_shapes = app.config["SLOW_QUERY_MAX_SHAPES"]
+
+    def _forget(self) -> None:
+        self._lock = threading.Lock()
+        self._shapes: Dict[str, Dict[str, Any]] = {}
+        self._dropped = 0
+        self._explains: "queue.Queue" = queue.Queue(maxsize=100)
+        self._explainer: Optional[threading.Thread] = None
+        self._started: Dict[tuple, tuple] = {}
+
+    def started(self, event):
+        self._started[(event.request_id, event.connection_id)] = (event.database_name, event.command)
+
+    def succeeded(self, event):
+        self._finished(event, failed=False)
+
+    def failed(self, event):
+        self._finished(event, failed=True)
+
+    def _finished(self, event, failed: bool) -> None:
+        started = self._started.pop((event.request_id, event.connection_id), None)
+        if started is None or event.duration_micros < self.threshold_us:
+            return
+        database_name, command = started
+        self.record(database_name, event.command_name, command, event.duration_micros / 1000, failed)
+
+    def record(self, database_name: str, command_name: str, command: Dict[str, Any],
+               duration_ms: float, failed: bool = False) -> None:
+        collection = command.get(command_name)
+        collection = collection if isinstance(collection, str) else ""
+        shape = command_shape(command_name, command)
+        key = json.dumps([database_name, collection, command_name, shape], sort_keys=True, default=str)
+
+        self.logger.warning(
+            f"Slow {command_name} on {database_name}.{collection} took {duration_ms:.1f} ms: "
+            f"{json.dumps(shape, default=str)}"
+        )
+
+        explain = False
+        with self._lock:
+            entry = self._shapes.get(key)
+            if entry is None:
+                if len(self._shapes) >= self.max_shapes:
+                    self._dropped += 1
+                    return
+                entry = self._shapes[key] = {
+                    "database": database_name,
+                    "collection": collection,
+                    "command": command_name,
+                    "shape": shape,
+                    "count": 0,
+                    "failures": 0,
+                    "total_ms": 0.0,
+                    "max_ms": 0.0,
+                    "first_seen": datetime.datetime.utcnow(),
+                    "last_seen": None,
+                    "explain": None,
+                    "stages": None,
+                    "flags": [],
+                }
+            entry["count"] += 1
+            entry["failures"] += int(failed)
+            entry["total_ms"] += duration_ms
+            entry["max_ms"] = max(entry["max_ms"], duration_ms)
+            entry["last_seen"] = datetime.datetime.utcnow()
+            if command_name in EXPLAINABLE and entry["explain"] in (None, "skipped"):
+                entry["explain"] = "pending"
+                explain = True
+
+        if explain:
+            self._queue_explain(key, database_name, command)
+
+    def _queue_explain(self, key: str, database_name: str, command: Dict[str, Any]) -> None:
+        try:
+            self._explains.put_nowait((key, database_name, explain_command(command)))
+        except queue.Full:
+            with self._lock:
+                self._shapes[key]["explain"] = "skipped"
+            return
+        if self._explainer is None:
+            with self._lock:
+                if self._explainer is None:
+                    self._explainer = threading.Thread(target=self._run, name="slow-query-explain", daemon=True)
+                    self._explainer.start()
+
+    def close(self) -> None:
+        """Stop the explain thread once the queued explains are done"""
+        if self._explainer is not None:
+            self._explains.put(None)
+            self._explainer.join()
+            self._explainer = None
+
+    def _run(self) -> None:
+        while True:
+            item = self._explains.get()
+            if item is None:
+                return
+            key, database_name, command = item
+            started = time.monotonic()
+            self._explain(key, database_name, command)
+            # Rate limit: explains compete with the traffic that made queries slow
+            time.sleep(max(self.explain_interval - (time.monotonic() - started), 0))
+
+    def _explain(self, key: str, database_name: str, command: Dict[str, Any]) -> None:
+        try:
+            result = self.connection.client[database_name].command(
+                {"explain": command, "verbosity": "queryPlanner"}
+            )
+        except Exception as e:
+            with self._lock:
+                self._shapes[key]["explain"] = f"error: {e}"
+            return
+
+        stages = {stage for plan in winning_plans(result) for stage in plan_stages(plan)}
+        # A $sort left in the pipeline, not absorbed by the query layer, sorts in memory
+        if any("$sort" in stage for stage in result.get("stages", [])):
+            stages.add("SORT")
+        stages = sorted(stages)
+        flags = sorted(FLAGGED_STAGES.intersection(stages))
+        with self._lock:
+            entry = self._shapes[key]
+            entry["explain"] = "done"
+            entry["stages"] = stages
+            entry["flags"] = flags
+        if flags:
+            self.logger.error(
+                f"{' and '.join(flags)} in plan of {entry['command']} on "
+                f"{entry['database']}.{entry['collection']}: {json.dumps(entry['shape'], default=str)}"
+            )
+
+    def report(self) -> Dict[str, Any]:
+        """Slow shapes, flagged ones first, then by total time"""
+        with self._lock:
+            shapes = [
+                {**entry, "avg_ms": entry["total_ms"] / entry["count"]}
+                for entry in self._shapes.values()
+            ]
+            dropped = self._dropped
+        shapes.sort(key=lambda entry: (not entry["flags"], -entry["total_ms"]))
+        return {
+            "pid": os.getpid(),
+            "threshold_ms": self.threshold_us / 1000,
+            "shapes": shapes,
+            "flagged": sum(1 for entry in shapes if entry["flags"]),
+            "dropped_shapes": dropped,
+        }
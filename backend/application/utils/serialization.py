@@ -0,0 +1,85 @@
+"""
+JSON serialization shared by every route.
+
+BSON types are encoded as plain JSON: ObjectId as its hex string, datetimes as
+ISO 8601 (naive values, as returned by pymongo, are UTC) and decimals as numbers.
+orjson is used when installed, with an equivalent pure-Python fallback.
+"""
+import datetime
+import json
+from decimal import Decimal
+from typing import Any, Iterable, Iterator
+
+from bson import ObjectId
+from bson.decimal128 import Decimal128
+from flask import current_app
+
+try:
+    import orjson
+except ImportError:  # orjson is optional, the stdlib encoder produces the same output
+    orjson = None
+
+
+def _to_utc(value: datetime.datetime) -> datetime.datetime:
+    if value.tzinfo is None:
+        return value.replace(tzinfo=datetime.timezone.utc)
+    return value
+
+
+def _default(value: Any) -> Any:
+    """Encode the non-JSON types found in Mongo documents"""
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, Decimal128):
+        return float(value.to_decimal())
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, datetime.datetime):
+        return _to_utc(value).isoformat()
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def _dumps_orjson(value: Any) -> bytes:
+    return orjson.dumps(value, default=_default, option=orjson.OPT_NAIVE_UTC)
+
+
+def _dumps_stdlib(value: Any) -> bytes:
+    return json.dumps(
+        value,
+        default=_default,
+        ensure_ascii=False,
+        separators=(",", ":"),
+    ).encode()
+
+
+_backend = _dumps_orjson if orjson is not None else _dumps_stdlib
+
+
+def dumps(value: Any) -> bytes:
+    """Serialize a value, Mongo documents included, to JSON bytes"""
+    return _backend(value)
+
+
+def json_response(payload: Any):
+    """Build a JSON response; use like jsonify, e.g. ``return json_response({...}), 400``"""
+    return current_app.response_class(dumps(payload), mimetype="application/json")
+
+
+def iter_ndjson(documents: Iterable[Any], chunk_size: int = 64 * 1024) -> Iterator[bytes]:
+    """
+    Encode documents as newline-delimited JSON, yielding chunks of about chunk_size bytes.
+
+    Lines are grouped so a streamed response is not written one document at a
+    time, while memory stays bounded by the chunk size.
+    """
+    buffer = bytearray()
+    for document in documents:
+        buffer += dumps(document)
+        buffer += b"\n"
+        if len(buffer) >= chunk_size:
+            yield bytes(buffer)
+            buffer.clear()
+    if buffer:
+        yield bytes(buffer)
@@ -0,0 +1,35 @@
+"""
+Cache of authenticated user documents used by token_required
+"""
+from typing import Iterable
+
+from bson import ObjectId
+
+from application import db
+from application.extensions import extension
+
+# Fields never needed once the JWT has been verified
+USER_PROJECTION = {"password": 0}
+
+# TTLCache of the current app, see Extensions
+user_cache = extension("user_cache")
+
+
+def load_user(user_id: ObjectId):
+    """Return the user document, from cache when possible, or None if it does not exist"""
+    user = user_cache.get(user_id)
+    if user is None:
+        user = db.users.find_one({"_id": user_id}, USER_PROJECTION)
+        if user is not None:
+            user_cache.set(user_id, user)
+    return user
+
+
+def invalidate_user(user_id: ObjectId) -> None:
+    """Drop a cached user; call after any write to that user's document"""
+    user_cache.delete(user_id)
+
+
+def invalidate_users(user_ids: Iterable[ObjectId]) -> None:
+    for user_id in user_ids:
+        user_cache.delete(user_id)
@@ -1,12 +1,6 @@
 import re
-import uuid
 from flask import url_for
-from flask_mail import Message, Mail
-from application import app
-from dotenv import load_dotenv
-from os import environ
-
-load_dotenv()
+from application.utils.mail_queue import mail_queue
 
 
 def clean_cpf(cpf: str) -> str:
@@ -14,27 +8,24 @@ def clean_cpf(cpf: str) -> str:
     return re.sub(r"[^0-9]", "", cpf)
 
 
-def generate_confirmation_token():
+def duplicate_key_fields(error) -> set:
     """
-    Generate a token for confirm user email.
+    Fields of the unique index violated by a DuplicateKeyError, or by one
+    writeErrors entry of a BulkWriteError. Empty when the server did not report
+    the key pattern.
     """
-    token = str(uuid.uuid4())
-    return token
+    details = getattr(error, "details", error) or {}
+    return set(details.get("keyPattern") or {})
 
 
 def send_confirmation_email(email, token):
     """
-    Send a confirmation email to the user.
+    Queue a confirmation email to the user and return the queued message id.
+    Delivery happens in the background, see mail_queue.
     """
-    mail = Mail(app)
-
-    msg = Message(
+    confirmation_link = url_for("api.confirm_email", token=token, _external=True)
+    return mail_queue.enqueue(
+        email,
         "Confirm your email",
-        sender=environ.get("MAIL_USERNAME"),
-        recipients=[email],
+        f"Your confirmation link is {confirmation_link}",
     )
-    print(token)
-    confirmation_link = url_for("confirm_email", token=token, _external=True)
-    msg.body = f"Your confirmation link is {confirmation_link}"
-
-    mail.send(msg)
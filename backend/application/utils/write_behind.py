@@ -0,0 +1,189 @@
+"""
+Write-behind buffering for non-critical updates (last_login, view counters...).
+
+Updates are merged in memory per document, the latest value winning for $set
+fields and increments adding up for $inc fields, then written with a single
+unordered bulk_write every WRITE_BEHIND_INTERVAL_MS milliseconds or as soon as
+WRITE_BEHIND_MAX_ENTRIES documents are pending. Buffers are flushed at exit;
+anything still buffered when a process is killed is lost, so only use them for
+data that can afford it.
+
+Failed updates are buffered again only when they were certainly not applied:
+the ones listed in the writeErrors of a BulkWriteError, or a whole batch when
+no server could be selected. After any other error the outcome is unknown, so
+$set fields (idempotent) are retried and increments are dropped rather than
+counted twice.
+"""
+import atexit
+import logging
+import os
+import threading
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, ServerSelectionTimeoutError
+
+from application import db
+from application.extensions import extension
+
+
+class WriteBehindBuffer:
+    """
+    Per-process buffer of pending updates to one collection.
+
+    on_flush, when given, is called with the ids of the documents each flush
+    wrote, e.g. to drop them from a cache.
+    """
+
+    def __init__(self, collection_name: str, interval_ms: float, max_entries: int,
+                 on_flush: Optional[Callable[[Iterable[Hashable]], None]] = None):
+        self.collection_name = collection_name
+        self.on_flush = on_flush
+        self.app = None
+        self.interval = interval_ms / 1000
+        self.max_entries = max_entries
+        self._pending: Dict[Hashable, Dict[str, Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._stats = {"queued": 0, "flushed": 0, "flushes": 0, "errors": 0, "dropped": 0}
+        self.logger = logging.getLogger(__name__)
+        atexit.register(self.flush)
+
+    def init_app(self, app) -> None:
+        self.app = app
+        self.interval = app.config["WRITE_BEHIND_INTERVAL_MS"] / 1000
+        self.max_entries = app.config["WRITE_BEHIND_MAX_ENTRIES"]
+        self.logger = app.logger
+
+    def set(self, document_id: Hashable, fields: Dict[str, Any]) -> None:
+        """Buffer a $set, replacing values still pending for the same fields"""
+        self._queue(document_id, "$set", fields)
+
+    def inc(self, document_id: Hashable, fields: Dict[str, int]) -> None:
+        """Buffer an $inc, adding to increments still pending for the same fields"""
+        self._queue(document_id, "$inc", fields)
+
+    def _queue(self, document_id, operator, fields):
+        self._ensure_thread()
+        with self._lock:
+            update = self._pending.setdefault(document_id, {})
+            target = update.setdefault(operator, {})
+            if operator == "$inc":
+                for field, amount in fields.items():
+                    target[field] = target.get(field, 0) + amount
+            else:
+                target.update(fields)
+            self._stats["queued"] += 1
+            full = len(self._pending) >= self.max_entries
+        if full:
+            self._wakeup.set()
+
+    def _ensure_thread(self) -> None:
+        """Start the flusher of this process; recreated after a fork"""
+        if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                # Updates inherited from the parent belong to the parent
+                self._pending = {}
+            if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._stopping.clear()
+            self._thread = threading.Thread(
+                target=self._run,
+                name=f"write-behind-{self.collection_name}",
+                daemon=True,
+            )
+            self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def close(self) -> None:
+        """Stop the flusher and write what is pending instead of waiting for exit"""
+        atexit.unregister(self.flush)
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread is not None and self._pid == os.getpid():
+            self._thread.join()
+        self._thread = None
+        self.flush()
+
+    def flush(self) -> int:
+        """Write every pending update now; returns the number of documents written"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+
+        document_ids = list(pending)
+        requests: List[UpdateOne] = [
+            UpdateOne({"_id": document_id}, pending[document_id])
+            for document_id in document_ids
+        ]
+        # Flushes also run from the flusher thread and at exit
+        with self.app.app_context():
+            try:
+                db[self.collection_name].bulk_write(requests, ordered=False)
+                written = document_ids
+            except BulkWriteError as e:
+                # Unordered: every update not listed in writeErrors was applied
+                failed = {document_ids[error["index"]] for error in e.details.get("writeErrors", [])}
+                self.logger.error(f"Write-behind flush to {self.collection_name} failed for {len(failed)} document(s): {e}")
+                self._restore({document_id: pending[document_id] for document_id in failed})
+                written = [document_id for document_id in document_ids if document_id not in failed]
+                with self._lock:
+                    self._stats["errors"] += 1
+            except ServerSelectionTimeoutError as e:
+                # Nothing was sent
+                self.logger.error(f"Write-behind flush to {self.collection_name} failed: {e}")
+                self._restore(pending)
+                with self._lock:
+                    self._stats["errors"] += 1
+                return 0
+            except Exception as e:
+                self.logger.error(f"Write-behind flush to {self.collection_name} failed: {e}")
+                self._restore(pending, increments=False)
+                with self._lock:
+                    self._stats["errors"] += 1
+                    self._stats["dropped"] += sum(1 for update in pending.values() if "$inc" in update)
+                return 0
+
+            with self._lock:
+                self._stats["flushed"] += len(written)
+                self._stats["flushes"] += 1
+            if self.on_flush is not None and written:
+                self.on_flush(written)
+        return len(written)
+
+    def _restore(self, failed: Dict[Hashable, Dict[str, Dict[str, Any]]], increments: bool = True) -> None:
+        """Put back updates from a failed flush without overriding newer ones"""
+        with self._lock:
+            for document_id, update in failed.items():
+                if not increments and "$set" not in update:
+                    continue
+                current = self._pending.setdefault(document_id, {})
+                for field, value in update.get("$set", {}).items():
+                    current.setdefault("$set", {}).setdefault(field, value)
+                if not increments:
+                    continue
+                for field, amount in update.get("$inc", {}).items():
+                    increments = current.setdefault("$inc", {})
+                    increments[field] = increments.get(field, 0) + amount
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self._stats, "pending": len(self._pending)}
+
+
+# Login bookkeeping on users (last_login) of the current app, see Extensions;
+# create one per collection for other counters, e.g.
+# WriteBehindBuffer("products", ...).inc(product_id, {"views": 1}).
+user_writes = extension("user_writes")
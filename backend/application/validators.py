@@ -1,9 +1,38 @@
 """
 Data validation utilities for the e-commerce application
+
+Record validation is declared as schemas: an ordered list of steps, each either
+a required-field check or a rule run on a present field. Schemas are compiled
+once at import into a flat tuple of steps, and rules rely on precompiled
+patterns and set lookups, so validating a record is a single tight loop.
+Schema.validate_many() checks a whole list of records in one call.
 """
 import re
 from datetime import datetime
-from typing import Dict, Any, List
+from typing import Any, Callable, Dict, Iterable, List, Sequence, Tuple
+
+EMAIL_PATTERN = re.compile(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$')
+NON_DIGITS_PATTERN = re.compile(r'[^0-9]')
+UNSAFE_CHARS_PATTERN = re.compile(r'[<>"\']')
+UPPERCASE_PATTERN = re.compile(r'[A-Z]')
+LOWERCASE_PATTERN = re.compile(r'[a-z]')
+DIGIT_PATTERN = re.compile(r'\d')
+OBJECT_ID_PATTERN = re.compile(r'^[0-9a-fA-F]{24}$')
+
+# Brazilian area codes (DDD)
+PHONE_AREA_CODES = frozenset([
+    '11', '12', '13', '14', '15', '16', '17', '18', '19', '21', '22', '24', '27', '28',
+    '31', '32', '33', '34', '35', '37', '38', '41', '42', '43', '44', '45', '46', '47',
+    '48', '49', '51', '53', '54', '55', '61', '62', '63', '64', '65', '66', '67', '68',
+    '69', '71', '73', '74', '75', '77', '79', '81', '82', '83', '84', '85', '86', '87',
+    '88', '89', '91', '92', '93', '94', '95', '96', '97', '98', '99',
+])
+
+NO_ERRORS: Tuple[str, ...] = ()
+
+# A rule receives the field value (only when truthy) and the whole record and
+# returns the error messages for that field
+Rule = Callable[[Any, Dict[str, Any]], Sequence[str]]
 
 
 class ValidationError(Exception):
@@ -11,208 +40,306 @@ class ValidationError(Exception):
     pass
 
 
+class Schema:
+    """
+    Compiled record validator.
+
+    ``steps`` is an ordered list of ``("required", field)`` and
+    ``("rule", field, rule)`` entries; errors are reported in step order.
+    """
+
+    def __init__(self, steps: Iterable[tuple]):
+        compiled = []
+        for step in steps:
+            if step[0] == "required":
+                field = step[1]
+                compiled.append((field, None, f"{field.capitalize()} is required"))
+            elif step[0] == "rule":
+                compiled.append((step[1], step[2], None))
+            else:
+                raise ValueError(f"Unknown schema step: {step[0]}")
+        self._steps = tuple(compiled)
+
+    def validate(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        errors: List[str] = []
+        get = data.get
+        for field, rule, message in self._steps:
+            value = get(field)
+            if rule is None:
+                if not value:
+                    errors.append(message)
+            elif value:
+                found = rule(value, data)
+                if found:
+                    errors.extend(found)
+        return {"valid": not errors, "errors": errors}
+
+    def validate_many(self, records: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Validate every record, returning one result per record in order"""
+        validate = self.validate
+        return [validate(record) for record in records]
+
+
 def validate_email(email: str) -> bool:
     """Validate email format"""
     if not email or not isinstance(email, str):
         return False
-    
-    pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
-    return re.match(pattern, email) is not None
+
+    return EMAIL_PATTERN.match(email) is not None
 
 
 def validate_cpf(cpf: str) -> bool:
     """Validate Brazilian CPF format and checksum"""
     if not cpf or not isinstance(cpf, str):
         return False
-    
+
     # Remove non-numeric characters
-    cpf = re.sub(r'[^0-9]', '', cpf)
-    
+    cpf = NON_DIGITS_PATTERN.sub('', cpf)
+
     # Check length
     if len(cpf) != 11:
         return False
-    
+
     # Check for known invalid patterns
     if cpf == cpf[0] * 11:
         return False
-    
+
+    digits = [ord(c) - 48 for c in cpf]
+
     # Calculate first check digit
-    sum1 = sum(int(cpf[i]) * (10 - i) for i in range(9))
+    sum1 = sum(digits[i] * (10 - i) for i in range(9))
     digit1 = 11 - (sum1 % 11)
     if digit1 >= 10:
         digit1 = 0
-    
+
     # Calculate second check digit
-    sum2 = sum(int(cpf[i]) * (11 - i) for i in range(10))
+    sum2 = sum(digits[i] * (11 - i) for i in range(10))
     digit2 = 11 - (sum2 % 11)
     if digit2 >= 10:
         digit2 = 0
-    
-    return int(cpf[9]) == digit1 and int(cpf[10]) == digit2
+
+    return digits[9] == digit1 and digits[10] == digit2
 
 
 def validate_phone(phone: str) -> bool:
     """Validate Brazilian phone number format"""
     if not phone or not isinstance(phone, str):
         return False
-    
+
     # Remove non-numeric characters
-    phone = re.sub(r'[^0-9]', '', phone)
-    
+    phone = NON_DIGITS_PATTERN.sub('', phone)
+
     # Check for valid Brazilian phone formats (10 or 11 digits)
-    return len(phone) in [10, 11] and phone[0:2] in ['11', '12', '13', '14', '15', '16', '17', '18', '19', '21', '22', '24', '27', '28', '31', '32', '33', '34', '35', '37', '38', '41', '42', '43', '44', '45', '46', '47', '48', '49', '51', '53', '54', '55', '61', '62', '63', '64', '65', '66', '67', '68', '69', '71', '73', '74', '75', '77', '79', '81', '82', '83', '84', '85', '86', '87', '88', '89', '91', '92', '93', '94', '95', '96', '97', '98', '99']
+    return len(phone) in (10, 11) and phone[0:2] in PHONE_AREA_CODES
 
 
-def validate_password(password: str) -> Dict[str, Any]:
-    """Validate password strength"""
-    if not password or not isinstance(password, str):
-        return {"valid": False, "errors": ["Password is required"]}
-    
+def _password_errors(password: str) -> List[str]:
     errors = []
-    
+
     if len(password) < 8:
         errors.append("Password must be at least 8 characters long")
-    
-    if not re.search(r'[A-Z]', password):
+
+    if not UPPERCASE_PATTERN.search(password):
         errors.append("Password must contain at least one uppercase letter")
-    
-    if not re.search(r'[a-z]', password):
+
+    if not LOWERCASE_PATTERN.search(password):
         errors.append("Password must contain at least one lowercase letter")
-    
-    if not re.search(r'\d', password):
+
+    if not DIGIT_PATTERN.search(password):
         errors.append("Password must contain at least one number")
-    
+
+    return errors
+
+
+def validate_password(password: str) -> Dict[str, Any]:
+    """Validate password strength"""
+    if not password or not isinstance(password, str):
+        return {"valid": False, "errors": ["Password is required"]}
+
+    errors = _password_errors(password)
     return {"valid": len(errors) == 0, "errors": errors}
 
 
+def _check(predicate: Callable[[Any], bool], message: str) -> Rule:
+    """Rule reporting message when predicate rejects the value"""
+    errors = (message,)
+    return lambda value, data: NO_ERRORS if predicate(value) else errors
+
+
+def _length(minimum: int, too_short: str, maximum: int = None, too_long: str = None,
+            invalid: str = "Invalid text format") -> Rule:
+    """Rule bounding the stripped length of a string"""
+    def rule(value, data):
+        if not isinstance(value, str):
+            return (invalid,)
+        length = len(value.strip())
+        errors = []
+        if length < minimum:
+            errors.append(too_short)
+        if maximum is not None and length > maximum:
+            errors.append(too_long)
+        return errors
+    return rule
+
+
+def _number(convert: Callable[[Any], Any], invalid: str, *bounds: Tuple[Callable[[Any], bool], str]) -> Rule:
+    """Rule converting the value to a number and checking (predicate, message) bounds"""
+    def rule(value, data):
+        try:
+            number = convert(value)
+        except (ValueError, TypeError):
+            return (invalid,)
+        return [message for predicate, message in bounds if not predicate(number)]
+    return rule
+
+
+def _sale_price(value, data):
+    errors = []
+    try:
+        sale_price = float(value)
+        if sale_price <= 0:
+            errors.append("Sale price must be greater than 0")
+        if data.get('price') and sale_price >= float(data['price']):
+            errors.append("Sale price must be less than regular price")
+    except (ValueError, TypeError):
+        errors.append("Invalid sale price format")
+    return errors
+
+
+def _birth_date(value, data):
+    try:
+        birth_date = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except (ValueError, AttributeError):
+        return ("Invalid birth date format",)
+
+    age = datetime.now().year - birth_date.year
+    errors = []
+    if age < 13:
+        errors.append("User must be at least 13 years old")
+    if age > 120:
+        errors.append("Invalid birth date")
+    return errors
+
+
+USER_SCHEMA = Schema([
+    ("required", "name"),
+    ("required", "email"),
+    ("required", "password"),
+    ("required", "cpf"),
+    ("required", "birth_date"),
+    ("required", "phone"),
+    ("rule", "email", _check(validate_email, "Invalid email format")),
+    ("rule", "cpf", _check(validate_cpf, "Invalid CPF format")),
+    ("rule", "phone", _check(validate_phone, "Invalid phone number format")),
+    ("rule", "password", lambda value, data: validate_password(value)["errors"]),
+    ("rule", "name", _length(
+        2, "Name must be at least 2 characters long",
+        100, "Name must be less than 100 characters",
+    )),
+    ("rule", "birth_date", _birth_date),
+])
+
+PRODUCT_SCHEMA = Schema([
+    ("required", "title"),
+    ("required", "price"),
+    ("required", "description"),
+    ("required", "category"),
+    ("required", "quantity"),
+    ("rule", "price", _number(
+        float, "Invalid price format",
+        (lambda price: price > 0, "Price must be greater than 0"),
+    )),
+    ("rule", "sale_price", _sale_price),
+    ("rule", "quantity", _number(
+        int, "Invalid quantity format",
+        (lambda quantity: quantity >= 0, "Quantity cannot be negative"),
+    )),
+    ("rule", "rating", _number(
+        float, "Invalid rating format",
+        (lambda rating: 0 <= rating <= 5, "Rating must be between 0 and 5"),
+    )),
+    ("rule", "reviews", _number(
+        int, "Invalid reviews format",
+        (lambda reviews: reviews >= 0, "Reviews cannot be negative"),
+    )),
+    ("rule", "title", _length(
+        3, "Title must be at least 3 characters long",
+        200, "Title must be less than 200 characters",
+        "Invalid title format",
+    )),
+    ("rule", "description", _length(
+        10, "Description must be at least 10 characters long",
+        1000, "Description must be less than 1000 characters",
+        "Invalid description format",
+    )),
+    ("rule", "category", _check(lambda value: isinstance(value, str), "Invalid category format")),
+    ("rule", "image", _check(lambda value: isinstance(value, str), "Invalid image format")),
+])
+
+RESERVATION_ITEM_SCHEMA = Schema([
+    ("required", "product_id"),
+    ("rule", "product_id", _check(
+        lambda value: isinstance(value, str) and OBJECT_ID_PATTERN.match(value) is not None,
+        "Invalid product id",
+    )),
+    ("required", "quantity"),
+    ("rule", "quantity", _number(
+        int, "Invalid quantity format",
+        (lambda quantity: quantity >= 1, "Quantity must be at least 1"),
+    )),
+])
+
+PROFILE_SCHEMA = Schema([
+    ("required", "name"),
+    ("rule", "name", _length(2, "Name must be at least 2 characters long")),
+    ("required", "email"),
+    ("rule", "email", _check(validate_email, "Invalid email format")),
+    ("required", "phone"),
+    ("rule", "phone", _check(validate_phone, "Invalid phone number format")),
+])
+
+
 def validate_user_data(data: Dict[str, Any]) -> Dict[str, Any]:
     """Validate user registration data"""
-    errors = []
-    
-    # Required fields
-    required_fields = ['name', 'email', 'password', 'cpf', 'birth_date', 'phone']
-    for field in required_fields:
-        if not data.get(field):
-            errors.append(f"{field.capitalize()} is required")
-    
-    # Email validation
-    if data.get('email') and not validate_email(data['email']):
-        errors.append("Invalid email format")
-    
-    # CPF validation
-    if data.get('cpf') and not validate_cpf(data['cpf']):
-        errors.append("Invalid CPF format")
-    
-    # Phone validation
-    if data.get('phone') and not validate_phone(data['phone']):
-        errors.append("Invalid phone number format")
-    
-    # Password validation
-    if data.get('password'):
-        password_result = validate_password(data['password'])
-        if not password_result['valid']:
-            errors.extend(password_result['errors'])
-    
-    # Name validation
-    if data.get('name'):
-        name = data['name'].strip()
-        if len(name) < 2:
-            errors.append("Name must be at least 2 characters long")
-        if len(name) > 100:
-            errors.append("Name must be less than 100 characters")
-    
-    # Birth date validation
-    if data.get('birth_date'):
-        try:
-            birth_date = datetime.fromisoformat(data['birth_date'].replace('Z', '+00:00'))
-            today = datetime.now()
-            age = today.year - birth_date.year
-            if age < 13:
-                errors.append("User must be at least 13 years old")
-            if age > 120:
-                errors.append("Invalid birth date")
-        except (ValueError, AttributeError):
-            errors.append("Invalid birth date format")
-    
-    return {"valid": len(errors) == 0, "errors": errors}
+    return USER_SCHEMA.validate(data)
 
 
 def validate_product_data(data: Dict[str, Any]) -> Dict[str, Any]:
     """Validate product data"""
+    return PRODUCT_SCHEMA.validate(data)
+
+
+def validate_reservation_data(data: Dict[str, Any], max_items: int) -> Dict[str, Any]:
+    """Validate a cart: {"items": [{"product_id": ..., "quantity": ...}, ...]}"""
+    items = data.get("items")
+    if not isinstance(items, list) or not items:
+        return {"valid": False, "errors": ["Items are required"]}
+    if len(items) > max_items:
+        return {"valid": False, "errors": [f"At most {max_items} items can be reserved at once"]}
+
     errors = []
-    
-    # Required fields
-    required_fields = ['title', 'price', 'description', 'category', 'quantity']
-    for field in required_fields:
-        if not data.get(field):
-            errors.append(f"{field.capitalize()} is required")
-    
-    # Price validation
-    if data.get('price'):
-        try:
-            price = float(data['price'])
-            if price <= 0:
-                errors.append("Price must be greater than 0")
-        except (ValueError, TypeError):
-            errors.append("Invalid price format")
-    
-    # Sale price validation
-    if data.get('sale_price'):
-        try:
-            sale_price = float(data['sale_price'])
-            if sale_price <= 0:
-                errors.append("Sale price must be greater than 0")
-            if data.get('price') and sale_price >= float(data['price']):
-                errors.append("Sale price must be less than regular price")
-        except (ValueError, TypeError):
-            errors.append("Invalid sale price format")
-    
-    # Quantity validation
-    if data.get('quantity'):
-        try:
-            quantity = int(data['quantity'])
-            if quantity < 0:
-                errors.append("Quantity cannot be negative")
-        except (ValueError, TypeError):
-            errors.append("Invalid quantity format")
-    
-    # Rating validation
-    if data.get('rating'):
-        try:
-            rating = float(data['rating'])
-            if not 0 <= rating <= 5:
-                errors.append("Rating must be between 0 and 5")
-        except (ValueError, TypeError):
-            errors.append("Invalid rating format")
-    
-    # Title validation
-    if data.get('title'):
-        title = data['title'].strip()
-        if len(title) < 3:
-            errors.append("Title must be at least 3 characters long")
-        if len(title) > 200:
-            errors.append("Title must be less than 200 characters")
-    
-    # Description validation
-    if data.get('description'):
-        description = data['description'].strip()
-        if len(description) < 10:
-            errors.append("Description must be at least 10 characters long")
-        if len(description) > 1000:
-            errors.append("Description must be less than 1000 characters")
-    
-    return {"valid": len(errors) == 0, "errors": errors}
+    for row, item in enumerate(items):
+        if not isinstance(item, dict):
+            errors.append(f"Item {row}: invalid item")
+            continue
+        errors.extend(f"Item {row}: {error}" for error in RESERVATION_ITEM_SCHEMA.validate(item)["errors"])
+    return {"valid": not errors, "errors": errors}
+
+
+def validate_profile_data(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Validate profile update data"""
+    return PROFILE_SCHEMA.validate(data)
 
 
 def sanitize_string(value: str) -> str:
     """Sanitize string input"""
     if not isinstance(value, str):
         return str(value) if value is not None else ""
-    
+
     # Remove leading/trailing whitespace
     value = value.strip()
-    
+
     # Remove potentially dangerous characters
-    value = re.sub(r'[<>"\']', '', value)
-    
-    return value
\ No newline at end of file
+    value = UNSAFE_CHARS_PATTERN.sub('', value)
+
+    return value
@@ -0,0 +1,5 @@
+"""
+Benchmarks for the e-commerce backend.
+
+Run from the backend directory, e.g. ``python -m benchmarks.serialization``.
+"""
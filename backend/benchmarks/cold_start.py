@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Cold-start time from process spawn to the first served request
+
+Two measurements, each repeated --runs times in fresh processes:
+
+- in-process: a new interpreter imports the application, calls create_app()
+  and serves --path through the test client; each phase is timed.
+- gunicorn: a one-worker gunicorn is spawned from gunicorn.conf.py and polled
+  until it answers GET /api.
+
+    python -m benchmarks.cold_start --runs 10
+"""
+import argparse
+import json
+import signal
+import statistics
+import subprocess
+import sys
+import time
+
+from benchmarks.report import percentile
+from benchmarks.serving_capacity import BACKEND_DIR, start_server
+
+CHILD = """
+import json, time
+started = time.perf_counter()
+from application import create_app
+imported = time.perf_counter()
+app = create_app()
+created = time.perf_counter()
+status = app.test_client().get({path!r}).status_code
+served = time.perf_counter()
+print(json.dumps({{
+    "import_s": imported - started,
+    "create_app_s": created - imported,
+    "first_request_s": served - created,
+    "status": status,
+}}))
+"""
+
+
+def in_process(path):
+    spawned = time.perf_counter()
+    output = subprocess.run(
+        [sys.executable, "-c", CHILD.format(path=path)],
+        cwd=BACKEND_DIR, capture_output=True, text=True, check=True,
+    ).stdout
+    total = time.perf_counter() - spawned
+    phases = json.loads(output.strip().splitlines()[-1])
+    phases["spawn_to_served_s"] = total
+    return phases
+
+
+def gunicorn(port):
+    spawned = time.perf_counter()
+    server = start_server("sync", port, threads=1)
+    elapsed = time.perf_counter() - spawned
+    server.send_signal(signal.SIGTERM)
+    server.wait(30)
+    return {"spawn_to_served_s": elapsed}
+
+
+def summarize_runs(runs):
+    summary = {}
+    for key in runs[0]:
+        if key == "status":
+            continue
+        samples = [run[key] for run in runs]
+        summary[key] = {
+            "p50_ms": round(statistics.median(samples) * 1000, 1),
+            "p95_ms": round(percentile(samples, 95) * 1000, 1),
+        }
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--path", default="/api", help="first request served in process")
+    parser.add_argument("--port", type=int, default=5056)
+    parser.add_argument("--skip-gunicorn", action="store_true")
+    args = parser.parse_args()
+
+    results = {"in_process": summarize_runs([in_process(args.path) for _ in range(args.runs)])}
+    if not args.skip_gunicorn:
+        results["gunicorn"] = summarize_runs([gunicorn(args.port) for _ in range(args.runs)])
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
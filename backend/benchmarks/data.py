@@ -0,0 +1,67 @@
+"""
+Synthetic catalog and user records for benchmarks
+"""
+import random
+import datetime
+
+CATEGORIES = [
+    "electronics",
+    "books",
+    "home",
+    "toys",
+    "sports",
+    "fashion",
+    "beauty",
+    "grocery",
+]
+PHONE_AREA_CODES = ["11", "21", "31", "41", "51", "61", "71", "81", "91"]
+
+# Password of every seeded user, so scenarios can log in as any of them
+SEED_PASSWORD = "Benchmark123"
+
+
+def generate_cpf(rng=random):
+    """Random CPF with valid check digits, formatted as 000.000.000-00"""
+    while True:
+        digits = [rng.randint(0, 9) for _ in range(9)]
+        if len(set(digits)) > 1:
+            break
+    for length in (9, 10):
+        total = sum(d * (length + 1 - i) for i, d in enumerate(digits))
+        check = 11 - total % 11
+        digits.append(0 if check >= 10 else check)
+    cpf = "".join(map(str, digits))
+    return f"{cpf[:3]}.{cpf[3:6]}.{cpf[6:9]}-{cpf[9:]}"
+
+
+def make_product(i, rng=random):
+    """Product payload as accepted by POST /api/products"""
+    price = round(rng.lognormvariate(4, 1) + 1, 2)
+    on_sale = rng.random() < 0.3
+    product = {
+        "title": f"Product {i:07d}",
+        "price": price,
+        "on_sale": on_sale,
+        "description": f"Synthetic product {i} for load testing, in {rng.choice(CATEGORIES)} style.",
+        "image": f"https://picsum.photos/seed/{i}/300/300",
+        "category": rng.choice(CATEGORIES),
+        "quantity": rng.randint(1, 500),
+        "rating": round(rng.uniform(1, 5), 1),
+        "reviews": rng.randint(0, 2000),
+    }
+    if on_sale:
+        product["sale_price"] = round(price * rng.uniform(0.5, 0.95), 2)
+    return product
+
+
+def make_user(i, rng=random):
+    """User payload as accepted by POST /api/register"""
+    birth_year = datetime.date.today().year - rng.randint(18, 80)
+    return {
+        "name": f"Benchmark User {i}",
+        "email": f"user{i}@example.com",
+        "password": f"Bench{i}pass",
+        "cpf": generate_cpf(rng),
+        "birth_date": f"{birth_year}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+        "phone": f"({rng.choice(PHONE_AREA_CODES)}) 9{rng.randint(1000, 9999)}-{rng.randint(1000, 9999)}",
+    }
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Unique-index writes: concurrency check and latency saved by dropping the pre-check.
+
+1. Fires parallel registrations of the same user at POST /api/register and
+   checks that exactly one user is created (the rest get 409).
+2. Times find-then-insert against a direct insert relying on the unique index,
+   on a scratch collection that is dropped afterwards.
+
+Needs MONGO_URI pointing at a reachable server; records it creates are removed.
+"""
+import argparse
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from pymongo.errors import DuplicateKeyError
+
+from application import create_app, db
+from benchmarks.data import make_user
+
+app = create_app({"MAIL_QUEUE_EMBEDDED": False})
+
+
+def check_parallel_registrations(threads):
+    payload = make_user(int(time.time()))
+    client = app.test_client()
+
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        statuses = list(pool.map(
+            lambda _: client.post("/api/register", json=payload).status_code,
+            range(threads)
+        ))
+
+    created = db.users.count_documents({"email": payload["email"]})
+    db.users.delete_many({"email": payload["email"]})
+    db.email_outbox.delete_many({"recipient": payload["email"]})
+
+    print(f"{threads} parallel registrations: {statuses.count(201)} x 201, "
+          f"{statuses.count(409)} x 409, {created} user(s) stored")
+    assert created == 1 and statuses.count(201) == 1, "duplicate registration slipped through"
+
+
+def time_writes(count):
+    collection = db["bench_unique_writes"]
+    collection.drop()
+    collection.create_index("email", unique=True)
+
+    def find_then_insert(i):
+        email = f"pre{i}@example.com"
+        if collection.find_one({"email": email}) is None:
+            collection.insert_one({"email": email})
+
+    def insert_only(i):
+        try:
+            collection.insert_one({"email": f"direct{i}@example.com"})
+        except DuplicateKeyError:
+            pass
+
+    results = {}
+    for name, write in (("find_then_insert", find_then_insert), ("insert_only", insert_only)):
+        samples = []
+        for i in range(count):
+            started = time.perf_counter()
+            write(i)
+            samples.append(time.perf_counter() - started)
+        results[name] = statistics.median(samples) * 1000
+        print(f"{name:<18} p50 {results[name]:.3f} ms")
+
+    collection.drop()
+    saved = results["find_then_insert"] - results["insert_only"]
+    print(f"{'saved per write':<18} {saved:.3f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--threads", type=int, default=20)
+    parser.add_argument("--count", type=int, default=1000)
+    args = parser.parse_args()
+
+    with app.app_context():
+        check_parallel_registrations(args.threads)
+        time_writes(args.count)
+
+
+if __name__ == "__main__":
+    main()
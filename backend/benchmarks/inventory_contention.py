@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Concurrent buyers racing for the stock of one product through POST /api/reservations
+
+Every buyer tries to reserve --quantity units of a single product holding
+--stock units, all released at once, then checks out (or cancels, for the
+--cancel-ratio share). Reports reservation throughput and latency, and fails
+when the product was oversold: more units committed than stocked, a negative
+quantity, or stock and holds that do not add up once every buyer is done.
+
+Needs seeded users (python -m benchmarks.seed) to log in as:
+
+    python -m benchmarks.inventory_contention --buyers 1000 --stock 100
+    python -m benchmarks.inventory_contention --base-url http://localhost:5000 --output contention.json
+"""
+import argparse
+import datetime
+import json
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from application import create_app, db
+from benchmarks.report import make_report, summarize, write_report
+from benchmarks.scenarios import HTTPTransport, Scenarios, TestClientTransport
+
+
+def create_product(stock):
+    now = datetime.datetime.utcnow()
+    product = {
+        "title": f"Contention benchmark {int(time.time() * 1000)}",
+        "price": 100.0,
+        "sale_price": 50.0,
+        "on_sale": True,
+        "description": "Flash sale product used by the contention benchmark",
+        "image": "",
+        "category": "electronics",
+        "quantity": stock,
+        "rating": 0.0,
+        "reviews": 0,
+        "created_at": now,
+        "updated_at": now,
+    }
+    db.products.insert_one(product)
+    return product["_id"]
+
+
+def run_buyers(transport, tokens, product_id, args):
+    """One thread per buyer, all starting together; returns latencies and outcomes"""
+    rng = random.Random(args.seed)
+    plans = [
+        (i, tokens[i % len(tokens)], rng.random() < args.cancel_ratio)
+        for i in range(args.buyers)
+    ]
+    # The first wave of buyers is released at once
+    wave = min(args.buyers, args.concurrency)
+    start = threading.Barrier(wave)
+    latencies, outcomes = [], {"reserved": 0, "out_of_stock": 0, "committed": 0, "cancelled": 0, "errors": 0, "settle_errors": 0}
+    lock = threading.Lock()
+    body = {"items": [{"product_id": str(product_id), "quantity": args.quantity}]}
+
+    def buyer(plan):
+        i, token, cancel = plan
+        headers = {"Authorization": f"Bearer {token}"}
+        if i < wave:
+            start.wait()
+        started = time.perf_counter()
+        try:
+            status, data = transport.request("POST", "/api/reservations", body, headers)
+        except Exception:
+            status, data = None, None
+        elapsed = time.perf_counter() - started
+
+        outcome = "errors"
+        if status == 201:
+            outcome = "reserved"
+            reservation_id = json.loads(data)["reservation"]["id"]
+            action = "cancel" if cancel else "checkout"
+            status, _ = transport.request("POST", f"/api/reservations/{reservation_id}/{action}", None, headers)
+            settled = "cancelled" if cancel else "committed"
+            with lock:
+                outcomes[settled if status == 200 else "settle_errors"] += 1
+        elif status == 409:
+            outcome = "out_of_stock"
+        with lock:
+            outcomes[outcome] += 1
+            if outcome != "errors":
+                latencies.append(elapsed)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(buyer, plans))
+    return latencies, outcomes, time.perf_counter() - started
+
+
+def check_stock(product_id, stock, quantity, outcomes):
+    """Invariant violations once every buyer is done, as readable lines"""
+    product = db.products.find_one({"_id": product_id}, {"quantity": 1, "holds": 1})
+    holds = product.get("holds", [])
+    committed = sum(
+        item["quantity"]
+        for reservation in db.reservations.find({"items.product_id": product_id, "status": "committed"})
+        for item in reservation["items"]
+    )
+    problems = []
+    if product["quantity"] < 0:
+        problems.append(f"quantity went negative: {product['quantity']}")
+    if committed > stock:
+        problems.append(f"oversold: {committed} units committed out of {stock}")
+    if holds:
+        problems.append(f"{len(holds)} holds left on the product")
+    if product["quantity"] + committed + sum(hold["quantity"] for hold in holds) != stock:
+        problems.append(
+            f"stock does not add up: {product['quantity']} left + {committed} committed != {stock}"
+        )
+    if committed != outcomes["committed"] * quantity:
+        problems.append(f"{committed} units committed but buyers saw {outcomes['committed'] * quantity}")
+    return problems
+
+
+def cleanup(product_id):
+    db.reservations.delete_many({"items.product_id": product_id})
+    db.products.delete_one({"_id": product_id})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--buyers", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=1000, help="buyers in flight at once")
+    parser.add_argument("--stock", type=int, default=100)
+    parser.add_argument("--quantity", type=int, default=1, help="units each buyer reserves")
+    parser.add_argument("--cancel-ratio", type=float, default=0.1, help="share of buyers cancelling instead of checking out")
+    parser.add_argument("--base-url", help="benchmark a running server instead of the app in process")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="write the JSON report to this file")
+    parser.add_argument("--keep", action="store_true", help="keep the product and its reservations")
+    args = parser.parse_args()
+
+    # Every buyer of the in-process app shares its connection pool
+    app = create_app({"MONGO_MAX_POOL_SIZE": max(100, args.concurrency), "MAIL_QUEUE_EMBEDDED": False})
+    with app.app_context():
+        transport = HTTPTransport(args.base_url) if args.base_url else TestClientTransport(app)
+        tokens = Scenarios(transport, random.Random(args.seed)).tokens()
+        product_id = create_product(args.stock)
+        try:
+            latencies, outcomes, elapsed = run_buyers(transport, tokens, product_id, args)
+            result = summarize(latencies, outcomes["errors"], elapsed)
+            print(f"buyers       {args.buyers} for {args.stock} units, {args.quantity} each")
+            print(f"outcomes     {outcomes}")
+            print(f"reservations {result}")
+
+            problems = check_stock(product_id, args.stock, args.quantity, outcomes)
+            if args.output:
+                write_report(make_report(
+                    {"reserve": result},
+                    buyers=args.buyers,
+                    concurrency=args.concurrency,
+                    stock=args.stock,
+                    quantity=args.quantity,
+                    outcomes=outcomes,
+                    oversold=bool(problems),
+                    target=args.base_url or "in-process",
+                ), args.output)
+        finally:
+            if not args.keep:
+                cleanup(product_id)
+
+        for problem in problems:
+            print(f"FAIL {problem}")
+        if problems:
+            sys.exit(1)
+        print("No overselling: committed units never exceeded the stock")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Login throughput with and without the password hashing pool, next to catalog traffic.
+
+A thread pool stands in for a worker's request threads. It receives a burst of
+login verifications mixed with catalog requests (serializing a 50-product page).
+Inline hashing holds request threads for the whole hash, so catalog requests
+queue behind logins; with the bounded pool, excess logins are rejected at once
+and catalog latency stays flat.
+
+    python -m benchmarks.login_throughput --threads 8 --logins 200 --catalog 2000
+"""
+import argparse
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.security import generate_password_hash
+
+from application.config import load_config
+from application.utils.passwords import HashingBusy, PasswordHasher
+from application.utils.serialization import dumps
+from benchmarks.report import percentile
+from benchmarks.serialization import make_page
+
+PASSWORD = "Benchmark123"
+
+
+def run(hasher, threads, logins, catalog):
+    pwhash = generate_password_hash(PASSWORD, hasher.method)
+    page = make_page()
+    catalog_latency, login_latency = [], []
+    rejected = 0
+
+    def login():
+        nonlocal rejected
+        started = time.perf_counter()
+        try:
+            hasher.verify(pwhash, PASSWORD)
+            login_latency.append(time.perf_counter() - started)
+        except HashingBusy:
+            rejected += 1
+
+    def browse(submitted):
+        dumps(page)
+        catalog_latency.append(time.perf_counter() - submitted)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        ratio = max(catalog // max(logins, 1), 1)
+        for i in range(max(logins, catalog)):
+            if i < logins:
+                pool.submit(login)
+            for _ in range(ratio if i * ratio < catalog else 0):
+                pool.submit(browse, time.perf_counter())
+    elapsed = time.perf_counter() - started
+
+    return {
+        "elapsed_s": round(elapsed, 3),
+        "logins_per_s": round(len(login_latency) / elapsed, 1),
+        "logins_rejected": rejected,
+        "login_p50_ms": round(statistics.median(login_latency) * 1000, 2) if login_latency else None,
+        "catalog_p50_ms": round(percentile(catalog_latency, 50) * 1000, 2),
+        "catalog_p99_ms": round(percentile(catalog_latency, 99) * 1000, 2),
+    }
+
+
+def main():
+    config = load_config()
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--threads", type=int, default=8, help="request threads per worker")
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--catalog", type=int, default=2000)
+    parser.add_argument("--workers", type=int, default=config["PASSWORD_HASH_WORKERS"] or 2)
+    parser.add_argument("--queue-limit", type=int, default=config["PASSWORD_HASH_QUEUE_LIMIT"])
+    args = parser.parse_args()
+
+    method = config["PASSWORD_HASH_METHOD"]
+    modes = {
+        "inline": PasswordHasher(method, 0, 0, 60),
+        "pool": PasswordHasher(method, args.workers, args.queue_limit, 60),
+    }
+    print(f"{method}, {args.threads} request threads, {args.logins} logins, {args.catalog} catalog requests")
+    for name, hasher in modes.items():
+        print(f"{name:<8} {run(hasher, args.threads, args.logins, args.catalog)}")
+        hasher.shutdown()
+
+
+if __name__ == "__main__":
+    main()
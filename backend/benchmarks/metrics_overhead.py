@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Cost of the metrics instrumentation per request and per Mongo command
+
+Times the registry primitives, the CommandListener round trip and a request
+through a minimal Flask app with and without the request hooks; the difference
+is what every request pays for metrics.
+
+    python -m benchmarks.metrics_overhead --count 100000
+"""
+import argparse
+import tempfile
+import time
+from types import SimpleNamespace
+
+from flask import Flask
+
+from application.utils.metrics import CommandMetrics, MetricsRegistry, install
+
+
+def per_call_us(func, count):
+    started = time.perf_counter()
+    for _ in range(count):
+        func()
+    return (time.perf_counter() - started) / count * 1e6
+
+
+def make_app(registry=None):
+    flask_app = Flask(__name__)
+
+    @flask_app.route("/api/products/<product_id>")
+    def product(product_id):
+        return "{}"
+
+    if registry is not None:
+        install(flask_app, registry)
+    return flask_app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--count", type=int, default=100_000)
+    args = parser.parse_args()
+
+    registry = MetricsRegistry(tempfile.mkdtemp(prefix="metrics-bench-"), flush_interval=3600)
+    labels = (("route", "/api/products"), ("method", "GET"))
+    listener = CommandMetrics(registry)
+    started = SimpleNamespace(
+        command={"find": "products"}, command_name="find", request_id=1, connection_id=("localhost", 27017)
+    )
+    succeeded = SimpleNamespace(
+        command_name="find", request_id=1, connection_id=("localhost", 27017), duration_micros=850
+    )
+
+    def command():
+        listener.started(started)
+        listener.succeeded(succeeded)
+
+    print(f"counter inc          {per_call_us(lambda: registry.inc('bench_total', labels), args.count):8.2f} us")
+    print(f"histogram observe    {per_call_us(lambda: registry.observe('bench_seconds', labels, 0.012), args.count):8.2f} us")
+    print(f"mongo command        {per_call_us(command, args.count):8.2f} us")
+
+    requests = max(args.count // 10, 1)
+    plain = make_app().test_client()
+    instrumented = make_app(registry).test_client()
+    baseline = per_call_us(lambda: plain.get("/api/products/42"), requests)
+    with_metrics = per_call_us(lambda: instrumented.get("/api/products/42"), requests)
+    print(f"request, no metrics  {baseline:8.2f} us")
+    print(f"request, metrics     {with_metrics:8.2f} us  (+{with_metrics - baseline:.2f} us)")
+
+    started_render = time.perf_counter()
+    registry.render()
+    print(f"scrape               {(time.perf_counter() - started_render) * 1e3:8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
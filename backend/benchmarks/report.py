@@ -0,0 +1,78 @@
+"""
+Latency summaries, JSON reports and baseline comparison shared by the benchmarks
+"""
+import json
+import platform
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def summarize(latencies: List[float], errors: int, elapsed: float) -> Dict[str, Any]:
+    """Throughput and p50/p95/p99 in milliseconds of one scenario"""
+    return {
+        "requests": len(latencies) + errors,
+        "errors": errors,
+        "throughput_rps": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+    }
+
+
+def make_report(results: Dict[str, Dict[str, Any]], **meta) -> Dict[str, Any]:
+    return {
+        "meta": {
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            **meta,
+        },
+        "results": results,
+    }
+
+
+def write_report(report: Dict[str, Any], path: str) -> None:
+    with open(path, "w") as file:
+        json.dump(report, file, indent=2, sort_keys=True)
+        file.write("\n")
+
+
+def load_report(path: str) -> Dict[str, Any]:
+    with open(path) as file:
+        return json.load(file)
+
+
+def compare(report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """
+    Regressions of report against baseline, as readable lines.
+
+    A scenario regresses when its p95 or p99 grows, or its throughput drops, by
+    more than tolerance (0.1 = 10%), or when it has errors the baseline had not.
+    """
+    regressions = []
+    for scenario, current in report["results"].items():
+        previous: Optional[Dict[str, Any]] = baseline["results"].get(scenario)
+        if previous is None:
+            continue
+        for metric in ("p95_ms", "p99_ms"):
+            if previous[metric] and current[metric] > previous[metric] * (1 + tolerance):
+                regressions.append(
+                    f"{scenario}: {metric} {previous[metric]} -> {current[metric]} "
+                    f"(+{(current[metric] / previous[metric] - 1) * 100:.0f}%)"
+                )
+        if previous["throughput_rps"] and current["throughput_rps"] < previous["throughput_rps"] * (1 - tolerance):
+            regressions.append(
+                f"{scenario}: throughput_rps {previous['throughput_rps']} -> {current['throughput_rps']} "
+                f"({(current['throughput_rps'] / previous['throughput_rps'] - 1) * 100:.0f}%)"
+            )
+        if current["errors"] and not previous["errors"]:
+            regressions.append(f"{scenario}: {current['errors']} errors, baseline had none")
+    return regressions
@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+Endpoint scenarios with throughput and p50/p95/p99 reports, compared against a baseline
+
+Scenarios run against the real Flask app, in process through its test client or
+over HTTP with --base-url, on a database seeded with python -m benchmarks.seed:
+
+- listing: first pages of the catalog across categories and sort orders
+- deep_offset: pages 100 to 500 through the legacy ?page= parameter
+- deep_cursor: the same depths walked with ?cursor=
+- register: new users through POST /api/register (removed afterwards)
+- login: seeded users through POST /api/login
+- profile: GET /api/profile with the token of a seeded user
+
+    python -m benchmarks.scenarios --output report.json
+    python -m benchmarks.scenarios --baseline report.json --tolerance 0.15
+
+Exits with status 1 when a scenario regressed against the baseline.
+"""
+import argparse
+import http.client
+import json
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from application import create_app, db
+from benchmarks.data import CATEGORIES, SEED_PASSWORD, make_user
+from benchmarks.report import compare, load_report, make_report, summarize, write_report
+
+SORTS = ["newest", "price", "-price", "rating"]
+
+
+class TestClientTransport:
+    """Requests served in process by the Flask test client, one per thread"""
+
+    def __init__(self, app):
+        self.app = app
+        self._local = threading.local()
+
+    def request(self, method, path, body=None, headers=None):
+        client = getattr(self._local, "client", None)
+        if client is None:
+            client = self._local.client = self.app.test_client(use_cookies=False)
+        response = client.open(path, method=method, json=body, headers=headers or {})
+        return response.status_code, response.get_data()
+
+
+class HTTPTransport:
+    """Requests sent to a running server, one keep-alive connection per thread"""
+
+    def __init__(self, base_url):
+        parts = urlsplit(base_url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self._local = threading.local()
+
+    def request(self, method, path, body=None, headers=None):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = self._local.connection = http.client.HTTPConnection(self.host, self.port, timeout=30)
+        headers = dict(headers or {})
+        payload = None
+        if body is not None:
+            payload = json.dumps(body)
+            headers["Content-Type"] = "application/json"
+        try:
+            connection.request(method, path, body=payload, headers=headers)
+            response = connection.getresponse()
+            return response.status, response.read()
+        except (OSError, http.client.HTTPException):
+            connection.close()
+            self._local.connection = None
+            raise
+
+
+class Scenarios:
+    """Builds the request of each scenario; state shared by a whole run"""
+
+    def __init__(self, transport, rng):
+        self.transport = transport
+        self.rng = rng
+        self.run_id = f"{int(time.time())}{rng.randint(0, 999):03d}"
+        self._local = threading.local()
+        self._emails = None
+        self._tokens = None
+
+    def emails(self):
+        if self._emails is None:
+            self._emails = [
+                user["email"] for user in db.users.find({"seeded": True}, {"email": 1}).limit(1000)
+            ]
+            if not self._emails:
+                raise RuntimeError("No seeded users; run python -m benchmarks.seed first")
+        return self._emails
+
+    def tokens(self):
+        if self._tokens is None:
+            self._tokens = []
+            for email in self.emails()[:50]:
+                status, body = self.transport.request(
+                    "POST", "/api/login", {"email": email, "password": SEED_PASSWORD}
+                )
+                if status == 200:
+                    self._tokens.append(json.loads(body)["token"])
+            if not self._tokens:
+                raise RuntimeError("Could not log in as any seeded user")
+        return self._tokens
+
+    def listing(self, i):
+        category = self.rng.choice(CATEGORIES + [None])
+        path = f"/api/products?size=20&sort={self.rng.choice(SORTS)}&page={self.rng.randint(1, 5)}"
+        if category:
+            path += f"&category={category}"
+        return "GET", path, None, None
+
+    def deep_offset(self, i):
+        return "GET", f"/api/products?size=20&sort=price&page={self.rng.randint(100, 500)}", None, None
+
+    def deep_cursor(self, i):
+        # Each thread walks its own chain of pages
+        cursor = getattr(self._local, "cursor", None)
+        return "GET", f"/api/products?size=20&sort=price&cursor={cursor or ''}", None, None
+
+    def deep_cursor_done(self, body):
+        self._local.cursor = json.loads(body).get("next_cursor")
+
+    def register(self, i):
+        user = make_user(i, self.rng)
+        user["email"] = f"bench-{self.run_id}-{i}@example.com"
+        return "POST", "/api/register", user, None
+
+    def register_cleanup(self):
+        pattern = {"$regex": f"^bench-{self.run_id}-"}
+        users = [user["_id"] for user in db.users.find({"email": pattern}, {"_id": 1})]
+        db.users.delete_many({"_id": {"$in": users}})
+        db.confirmation_tokens.delete_many({"user_id": {"$in": users}})
+        db.email_outbox.delete_many({"recipient": pattern})
+
+    def login(self, i):
+        email = self.rng.choice(self.emails())
+        return "POST", "/api/login", {"email": email, "password": SEED_PASSWORD}, None
+
+    def profile(self, i):
+        token = self.rng.choice(self.tokens())
+        return "GET", "/api/profile", None, {"Authorization": f"Bearer {token}"}
+
+
+SCENARIOS = ["listing", "deep_offset", "deep_cursor", "register", "login", "profile"]
+
+
+def run_scenario(scenarios, name, requests, concurrency):
+    make_request = getattr(scenarios, name)
+    on_success = getattr(scenarios, f"{name}_done", None)
+    # Warm up caches and lazily loaded state before timing
+    for i in range(min(concurrency, requests)):
+        method, path, body, headers = make_request(-1 - i)
+        status, data = scenarios.transport.request(method, path, body, headers)
+        if on_success is not None and status < 400:
+            on_success(data)
+
+    latencies, errors = [], []
+
+    def one(i):
+        method, path, body, headers = make_request(i)
+        started = time.perf_counter()
+        try:
+            status, data = scenarios.transport.request(method, path, body, headers)
+        except Exception as e:
+            errors.append(type(e).__name__)
+            return
+        elapsed = time.perf_counter() - started
+        if status >= 400:
+            errors.append(status)
+            return
+        latencies.append(elapsed)
+        if on_success is not None:
+            on_success(data)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(requests)))
+    result = summarize(latencies, len(errors), time.perf_counter() - started)
+
+    cleanup = getattr(scenarios, f"{name}_cleanup", None)
+    if cleanup is not None:
+        cleanup()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="comma-separated scenario names")
+    parser.add_argument("--requests", type=int, default=500, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--base-url", help="benchmark a running server instead of the app in process")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="write the JSON report to this file")
+    parser.add_argument("--baseline", help="JSON report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed regression, 0.1 = 10%%")
+    args = parser.parse_args()
+
+    names = [name for name in args.scenarios.split(",") if name]
+    unknown = set(names) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    # Confirmation emails of the register scenario stay queued instead of being sent
+    app = create_app({"MAIL_QUEUE_EMBEDDED": False})
+    transport = HTTPTransport(args.base_url) if args.base_url else TestClientTransport(app)
+    scenarios = Scenarios(transport, random.Random(args.seed))
+
+    results = {}
+    with app.app_context():
+        for name in names:
+            results[name] = run_scenario(scenarios, name, args.requests, args.concurrency)
+            print(f"{name:<12} {results[name]}")
+
+    report = make_report(
+        results,
+        requests=args.requests,
+        concurrency=args.concurrency,
+        target=args.base_url or "in-process",
+        seed=args.seed,
+    )
+    if args.output:
+        write_report(report, args.output)
+
+    if args.baseline:
+        regressions = compare(report, load_report(args.baseline), args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regression beyond {args.tolerance:.0%} against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Bulk-seed synthetic products and confirmed users for benchmarks
+
+Products are stored exactly as POST /api/products would store them, with
+creation dates spread over the last year; users are confirmed and share
+SEED_PASSWORD. Seeded documents carry "seeded": True and are removed with
+--clear. Needs MONGO_URI pointing at a server you can write to.
+
+    python -m benchmarks.seed --products 100000 --users 5000
+"""
+import argparse
+import datetime
+import random
+import time
+
+from pymongo.errors import BulkWriteError
+
+from application import create_app, db
+from application.routes import prepare_product
+from application.utils.catalog import invalidate_catalog
+from application.utils.facets import rebuild_facet_summary, record_products
+from application.utils.passwords import password_hasher
+from application.utils.utils import clean_cpf
+from benchmarks.data import SEED_PASSWORD, make_product, make_user
+
+
+def _insert(collection, documents):
+    """insert_many ignoring documents already seeded; returns the inserted ones"""
+    try:
+        collection.insert_many(documents, ordered=False)
+        return documents
+    except BulkWriteError as e:
+        failed = {error["index"] for error in e.details.get("writeErrors", [])}
+        return [document for i, document in enumerate(documents) if i not in failed]
+
+
+def seed_products(count, rng, batch_size):
+    now = datetime.datetime.utcnow()
+    inserted = 0
+    for start in range(0, count, batch_size):
+        batch = []
+        for i in range(start, min(start + batch_size, count)):
+            document = prepare_product(make_product(i, rng))
+            document["created_at"] = document["updated_at"] = now - datetime.timedelta(
+                seconds=rng.randint(0, 365 * 24 * 3600)
+            )
+            document["seeded"] = True
+            batch.append(document)
+        documents = _insert(db.products, batch)
+        record_products(documents)
+        inserted += len(documents)
+    invalidate_catalog()
+    return inserted
+
+
+def seed_users(count, rng, batch_size):
+    # One hash for everyone: hashing is deliberately slow and the users only
+    # need a known password
+    pwhash = password_hasher.hash(SEED_PASSWORD)
+    now = datetime.datetime.utcnow()
+    inserted = 0
+    for start in range(0, count, batch_size):
+        batch = []
+        for i in range(start, min(start + batch_size, count)):
+            user = make_user(i, rng)
+            batch.append({
+                "name": user["name"],
+                "email": user["email"],
+                "password": pwhash,
+                "cpf": clean_cpf(user["cpf"]),
+                "birth_date": user["birth_date"],
+                "phone": user["phone"],
+                "admin": False,
+                "confirmed": True,
+                "created_at": now,
+                "updated_at": now,
+                "seeded": True,
+            })
+        inserted += len(_insert(db.users, batch))
+    return inserted
+
+
+def clear_seeded():
+    products = db.products.delete_many({"seeded": True}).deleted_count
+    users = db.users.delete_many({"seeded": True}).deleted_count
+    rebuild_facet_summary()
+    invalidate_catalog()
+    return products, users
+
+
+def main():
+    app = create_app()
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--products", type=int, default=10_000)
+    parser.add_argument("--users", type=int, default=1_000)
+    parser.add_argument("--batch-size", type=int, default=app.config["BULK_BATCH_SIZE"])
+    parser.add_argument("--seed", type=int, default=42, help="random seed, for reproducible data")
+    parser.add_argument("--clear", action="store_true", help="remove seeded documents and exit")
+    args = parser.parse_args()
+
+    with app.app_context():
+        if args.clear:
+            products, users = clear_seeded()
+            print(f"Removed {products} seeded products and {users} seeded users")
+            return
+
+        rng = random.Random(args.seed)
+        started = time.perf_counter()
+        products = seed_products(args.products, rng, args.batch_size)
+        users = seed_users(args.users, rng, args.batch_size)
+    print(f"Seeded {products} products and {users} users in {time.perf_counter() - started:.1f} s "
+          f"(password {SEED_PASSWORD!r})")
+
+
+if __name__ == "__main__":
+    main()
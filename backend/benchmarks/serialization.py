@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Compare the shared JSON serializer with bson.json_util.dumps on a 50-product page
+"""
+import datetime
+import random
+import timeit
+
+from bson import ObjectId, json_util
+
+from application.utils import serialization
+
+PAGE_SIZE = 50
+ROUNDS = 2000
+
+
+def make_page(size=PAGE_SIZE):
+    """Build a listing page shaped like the documents stored in db.products"""
+    now = datetime.datetime.utcnow()
+    page = []
+    for i in range(size):
+        price = round(random.uniform(5, 500), 2)
+        page.append({
+            "_id": ObjectId(),
+            "title": f"Product {i}",
+            "price": price,
+            "sale_price": round(price * 0.9, 2),
+            "on_sale": i % 3 == 0,
+            "description": "Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * 4,
+            "image": f"https://cdn.example.com/products/{i}.jpg",
+            "category": random.choice(["electronics", "books", "home", "toys"]),
+            "quantity": random.randint(0, 100),
+            "rating": round(random.uniform(0, 5), 1),
+            "reviews": random.randint(0, 1000),
+            "created_at": now,
+            "updated_at": now,
+        })
+    return page
+
+
+def bench(name, func, page):
+    seconds = min(timeit.repeat(lambda: func(page), number=ROUNDS, repeat=5)) / ROUNDS
+    print(f"{name:<28} {seconds * 1e6:10.1f} µs/page")
+    return seconds
+
+
+def main():
+    page = make_page()
+    print(f"Serializing a {PAGE_SIZE}-product page ({ROUNDS} rounds, best of 5)")
+    print("-" * 50)
+
+    baseline = bench("bson.json_util.dumps", json_util.dumps, page)
+    results = {"stdlib fallback": bench("serialization (stdlib)", serialization._dumps_stdlib, page)}
+    if serialization.orjson is not None:
+        results["orjson"] = bench("serialization (orjson)", serialization._dumps_orjson, page)
+
+    print("-" * 50)
+    for name, seconds in results.items():
+        print(f"{name:<28} {baseline / seconds:10.1f}x faster than json_util")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Concurrent-connection capacity of a single worker in sync and async serving modes.
+
+For each SERVER_MODE a gunicorn with one worker is started from gunicorn.conf.py,
+then hammered by --concurrency clients each issuing requests back to back on
+their own connection. A sync worker serves at most GUNICORN_THREADS requests
+at a time, so latency grows with the number of clients; an async worker keeps
+every client in flight while it waits on Mongo. Run against a database that
+holds products; "{n}" in --path is replaced by a random number on each request
+so responses are not served from the catalog cache.
+
+    python -m benchmarks.serving_capacity --concurrency 200 --duration 15
+"""
+import argparse
+import http.client
+import os
+import random
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+from benchmarks.report import percentile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def start_server(mode, port, threads):
+    env = {
+        **os.environ,
+        "SERVER_MODE": mode,
+        "GUNICORN_BIND": f"127.0.0.1:{port}",
+        "GUNICORN_WORKERS": "1",
+        "GUNICORN_THREADS": str(threads),
+        "GUNICORN_PRELOAD": "false",
+    }
+    process = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "run:app"],
+        cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            connection.request("GET", "/api")
+            connection.getresponse().read()
+            return process
+        except OSError:
+            time.sleep(0.2)
+    process.kill()
+    raise RuntimeError(f"gunicorn ({mode}) did not start on port {port}")
+
+
+def load(port, path, concurrency, duration):
+    latencies, errors = [], []
+    in_flight = peak = 0
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def client():
+        nonlocal in_flight, peak
+        connection = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            with lock:
+                in_flight += 1
+                peak = max(peak, in_flight)
+            try:
+                connection.request("GET", path.replace("{n}", f"{random.uniform(0, 100):.2f}"))
+                response = connection.getresponse()
+                response.read()
+                if response.status >= 500:
+                    errors.append(response.status)
+                else:
+                    latencies.append(time.perf_counter() - started)
+            except Exception as e:
+                errors.append(type(e).__name__)
+                connection.close()
+                connection = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+            finally:
+                with lock:
+                    in_flight -= 1
+        connection.close()
+
+    clients = [threading.Thread(target=client, daemon=True) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in clients:
+        thread.start()
+    for thread in clients:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    return {
+        "requests_per_s": round(len(latencies) / elapsed, 1),
+        "errors": len(errors),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        "peak_in_flight": peak,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--modes", default="sync,async", help="comma-separated SERVER_MODE values")
+    parser.add_argument("--path", default="/api/products?size=20&sort=price&min_price={n}")
+    parser.add_argument("--concurrency", type=int, default=200, help="concurrent client connections")
+    parser.add_argument("--duration", type=float, default=15, help="seconds of load per mode")
+    parser.add_argument("--threads", type=int, default=2, help="GUNICORN_THREADS of the sync worker")
+    parser.add_argument("--port", type=int, default=5055)
+    args = parser.parse_args()
+
+    print(f"GET {args.path}, 1 worker, {args.concurrency} connections, {args.duration:g}s per mode")
+    for mode in args.modes.split(","):
+        server = start_server(mode, args.port, args.threads)
+        try:
+            print(f"{mode:<6} {load(args.port, args.path, args.concurrency, args.duration)}")
+        finally:
+            server.send_signal(signal.SIGTERM)
+            server.wait(30)
+
+
+if __name__ == "__main__":
+    main()
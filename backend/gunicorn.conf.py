@@ -0,0 +1,47 @@
+"""
+Gunicorn settings.
+
+SERVER_MODE selects how a worker waits on Mongo and SMTP:
+
+- ``sync`` (default): gunicorn's sync workers, one request at a time each,
+  a single worker unless GUNICORN_WORKERS says otherwise, as before this file
+  existed. GUNICORN_THREADS above 1 makes gunicorn switch to threaded
+  (gthread) workers; size workers x threads against MONGO_MAX_POOL_SIZE.
+- ``async``: gevent workers. PyMongo, smtplib and the standard library are
+  monkey-patched so every wait on a socket yields to other requests, and a
+  single worker holds up to GUNICORN_WORKER_CONNECTIONS requests at once. The
+  application code is the same in both modes.
+
+    gunicorn -c gunicorn.conf.py run:app
+"""
+import os
+import shutil
+import tempfile
+from os import environ
+
+# Snapshot directory shared by the web workers only; read by create_app(), so
+# it has to be set before the application is loaded
+metrics_dir = environ.setdefault("METRICS_DIR", os.path.join(tempfile.gettempdir(), "e-commerce-metrics"))
+
+SERVER_MODES = {"sync": "sync", "async": "gevent"}
+
+server_mode = environ.get("SERVER_MODE", "sync").lower()
+if server_mode not in SERVER_MODES:
+    raise ValueError(f"SERVER_MODE must be one of {', '.join(SERVER_MODES)}, got {server_mode!r}")
+
+bind = environ.get("GUNICORN_BIND", "0.0.0.0:5000")
+workers = int(environ.get("GUNICORN_WORKERS", 1))
+worker_class = SERVER_MODES[server_mode]
+threads = int(environ.get("GUNICORN_THREADS", 1))
+worker_connections = int(environ.get("GUNICORN_WORKER_CONNECTIONS", 1000))
+timeout = int(environ.get("GUNICORN_TIMEOUT", 30))
+graceful_timeout = int(environ.get("GUNICORN_GRACEFUL_TIMEOUT", 30))
+
+# gevent has to patch the standard library before the application imports
+# pymongo, so the app is loaded in each worker rather than in the master
+preload_app = server_mode == "sync" and environ.get("GUNICORN_PRELOAD", "false").lower() == "true"
+
+
+def on_starting(server):
+    # Metrics snapshots of a previous run would be added to this one's
+    shutil.rmtree(metrics_dir, ignore_errors=True)
@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+"""
+Dedicated email delivery worker.
+Run it next to the web workers when MAIL_QUEUE_EMBEDDED=false, so queued
+messages are delivered outside of the processes serving requests.
+"""
+
+import sys
+import os
+import signal
+import threading
+
+# Add the current directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from application import create_app
+from application.utils.mail_queue import mail_queue
+
+
+def main():
+    """Run the delivery workers until interrupted"""
+    stopped = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stopped.set())
+    signal.signal(signal.SIGINT, lambda *_: stopped.set())
+
+    app = create_app()
+    with app.app_context():
+        print("📨 Email delivery worker started")
+        mail_queue.start()
+        stopped.wait()
+        mail_queue.stop()
+    print("📭 Email delivery worker stopped")
+
+
+if __name__ == "__main__":
+    main()
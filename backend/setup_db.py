@@ -1,39 +1,121 @@
 #!/usr/bin/env python3
 """
 Database setup script for e-commerce application
-Run this script after setting up your environment to initialize database indexes
+Run this script at every deploy: it builds missing indexes, applies pending
+migrations and drops retired indexes, and does nothing when up to date.
+
+    python setup_db.py --dry-run        # show the index plan only
+    python setup_db.py --report-unused  # also list indexes no query uses
 """
 
+import argparse
 import sys
 import os
 
 # Add the current directory to Python path
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from application.db_init import create_indexes, check_database_connection
-from application import app
+from application.db_init import check_database_connection, verify_query_plans
+from application.migrations import (
+    apply_index_plan,
+    drop_retired_indexes,
+    index_usage,
+    migration_lock,
+    plan_indexes,
+    reveal_indexes,
+    run_migrations,
+)
+from application.utils.facets import ensure_facet_summary, rebuild_facet_summary
+from application import create_app
+
+
+def print_plan(plan):
+    changes = False
+    for collection, entry in plan.items():
+        for spec in entry["create"]:
+            print(f"  + {collection}: {dict(spec['key'])}")
+        for spec in entry["modify"]:
+            print(f"  ~ {collection}: TTL of {dict(spec['key'])} -> {spec['expireAfterSeconds']} s")
+        for name in entry["reveal"]:
+            print(f"  ~ {collection}.{name}: hidden -> visible")
+        for conflict in entry["conflicts"]:
+            print(f"  ! {collection}.{conflict['name']} differs from its declaration; rebuild with --allow-rebuild")
+        for name in entry["retire"]:
+            print(f"  - {collection}.{name} (retired)")
+        for name in entry["undeclared"]:
+            print(f"  ? {collection}.{name} is not declared")
+        changes = changes or any(entry[key] for key in ("create", "modify", "reveal", "retire"))
+    if not changes:
+        print("  Indexes are up to date")
+
 
 def main():
     """Main setup function"""
+    parser = argparse.ArgumentParser(description="Initialize and migrate the database")
+    parser.add_argument("--dry-run", action="store_true", help="print the index plan without changing anything")
+    parser.add_argument("--keep-hidden", action="store_true", help="build new indexes hidden and stop before revealing them")
+    parser.add_argument("--allow-rebuild", action="store_true", help="drop and rebuild indexes that differ from their declaration")
+    parser.add_argument("--report-unused", action="store_true", help="list indexes with no recorded use")
+    parser.add_argument("--rebuild-facets", action="store_true",
+                        help="recompute product facet counts; stop product writes first")
+    args = parser.parse_args()
+
     print("🚀 Starting e-commerce database setup...")
     print("=" * 50)
-    
+
+    app = create_app()
     with app.app_context():
         # Check database connection
         print("📡 Checking database connection...")
         if not check_database_connection():
             print("❌ Database setup failed - connection issue")
             sys.exit(1)
-        
-        # Create indexes
-        print("📊 Creating database indexes...")
+
+        print("📋 Index plan:")
+        plan = plan_indexes()
+        print_plan(plan)
+        if args.dry_run:
+            return
+
         try:
-            create_indexes()
-            print("✅ Database indexes created successfully!")
-        except Exception as e:
-            print(f"❌ Error creating indexes: {str(e)}")
+            with migration_lock():
+                # New indexes are built hidden so query plans only change on reveal
+                print("📊 Building database indexes...")
+                hidden = apply_index_plan(plan, allow_rebuild=args.allow_rebuild)
+                if args.keep_hidden:
+                    print(f"⏸  Left hidden: {', '.join(hidden) or 'none'}")
+                    return
+                reveal_indexes(hidden)
+
+                print("🔑 Applying data migrations...")
+                run_migrations()
+
+                # Counts are kept current by every product write; rebuilding them
+                # on a live database would drop increments made meanwhile
+                if args.rebuild_facets:
+                    print("🧮 Rebuilding product facet counts...")
+                    rebuild_facet_summary()
+                elif ensure_facet_summary():
+                    print("🧮 Built product facet counts")
+
+                # Retired indexes stay until every listing query is index-backed
+                print("🔎 Checking product listing query plans...")
+                if verify_query_plans():
+                    print("❌ Some product listing queries are not index-backed; retired indexes kept")
+                    sys.exit(1)
+                drop_retired_indexes(plan)
+        except RuntimeError as e:
+            print(f"❌ {e}")
             sys.exit(1)
-    
+
+        if args.report_unused:
+            print("📉 Unused indexes:")
+            unused = [row for row in index_usage() if row["unused"]]
+            for row in unused:
+                print(f"  {row['collection']}.{row['name']}: no use since {row['since']:%Y-%m-%d}")
+            if not unused:
+                print("  None")
+
     print("=" * 50)
     print("🎉 Database setup completed successfully!")
     print("")
@@ -43,4 +125,4 @@ def main():
     print("3. Check that all validations are working")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
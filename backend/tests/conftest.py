@@ -0,0 +1,48 @@
+"""
+Fixtures for tests that need MongoDB.
+
+They run against MONGO_URI (localhost by default) in the MONGO_TEST_DATABASE
+database, dropped before and after each test, and are skipped when no server
+answers.
+"""
+import os
+
+import pytest
+from pymongo.errors import PyMongoError
+
+from application import create_app, db
+from application.extensions import EXTENSION
+
+TEST_DATABASE = os.environ.get("MONGO_TEST_DATABASE", "e-commerce-test")
+
+
+@pytest.fixture
+def app():
+    app = create_app({
+        "SECRET_KEY": "test-secret",
+        "MONGO_DATABASE": TEST_DATABASE,
+        "MONGO_SERVER_SELECTION_TIMEOUT_MS": 2000,
+        "MAIL_QUEUE_EMBEDDED": False,
+        # Cheap inline hashing; the pool is exercised by the benchmarks
+        "PASSWORD_HASH_METHOD": "pbkdf2:sha256:1000",
+        "PASSWORD_HASH_WORKERS": 0,
+        "METRICS_ENABLED": False,
+        "SLOW_QUERY_MS": 0,
+    })
+    try:
+        with app.app_context():
+            try:
+                db.command("ping")
+            except PyMongoError:
+                pytest.skip("MongoDB is not reachable")
+            db.client.drop_database(TEST_DATABASE)
+            yield app
+            db.client.drop_database(TEST_DATABASE)
+    finally:
+        # Stops its threads and closes its client so the app can be collected
+        app.extensions[EXTENSION].close()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
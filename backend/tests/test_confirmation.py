@@ -0,0 +1,33 @@
+import datetime
+
+from application import db
+
+USER = {
+    "name": "Maria Silva",
+    "email": "maria@example.com",
+    "password": "Password123",
+    "cpf": "529.982.247-25",
+    "birth_date": "1990-05-17",
+    "phone": "11987654321",
+}
+
+
+def test_resend_is_throttled_and_outlives_the_token(client):
+    assert client.post("/api/register", json=USER).status_code == 201
+
+    # Just sent at registration
+    assert client.post("/api/confirm/resend", json={"email": USER["email"]}).status_code == 200
+    assert db.email_outbox.count_documents({"recipient": USER["email"]}) == 1
+
+    now = datetime.datetime.utcnow()
+    db.users.update_one({"email": USER["email"]}, {"$set": {
+        "confirmation_sent_at": now - datetime.timedelta(minutes=10),
+        "unconfirmed_expires_at": now + datetime.timedelta(hours=1),
+    }})
+    assert client.post("/api/confirm/resend", json={"email": USER["email"]}).status_code == 200
+    assert client.post("/api/confirm/resend", json={"email": USER["email"]}).status_code == 200
+    assert db.email_outbox.count_documents({"recipient": USER["email"]}) == 2
+
+    user = db.users.find_one({"email": USER["email"]})
+    token = db.confirmation_tokens.find_one({"user_id": user["_id"]})
+    assert user["unconfirmed_expires_at"] >= token["expires_at"]
@@ -0,0 +1,102 @@
+import datetime
+
+import jwt
+import pytest
+from bson import ObjectId
+
+from application import db
+from application.utils.inventory import CANCELLED, EXPIRED, FAILED, OutOfStock, inventory
+
+
+def insert_product(quantity):
+    return db.products.insert_one({"title": "Limited edition", "price": 10.0, "quantity": quantity}).inserted_id
+
+
+def stock(product_id):
+    product = db.products.find_one({"_id": product_id})
+    return product["quantity"], product.get("holds", [])
+
+
+def items(*pairs):
+    return [{"product_id": str(product_id), "quantity": quantity} for product_id, quantity in pairs]
+
+
+def expire(reservation_id):
+    past = datetime.datetime.utcnow() - datetime.timedelta(seconds=1)
+    db.reservations.update_one({"_id": reservation_id}, {"$set": {"expires_at": past}})
+
+
+def test_short_product_releases_the_other_holds(app):
+    plenty, scarce = insert_product(5), insert_product(1)
+    user_id = ObjectId()
+
+    with pytest.raises(OutOfStock) as raised:
+        inventory.reserve(user_id, items((plenty, 2), (scarce, 3)))
+
+    assert raised.value.unavailable == [{"product_id": scarce, "requested": 3, "available": 1}]
+    assert stock(plenty) == (5, [])
+    assert stock(scarce) == (1, [])
+    reservation = db.reservations.find_one({"user_id": user_id})
+    assert reservation["status"] == FAILED
+    assert reservation["settled"] is True
+
+
+def test_cancel_gives_stock_back_once(app):
+    product_id = insert_product(5)
+    user_id = ObjectId()
+    reservation = inventory.reserve(user_id, items((product_id, 2)))
+    quantity, holds = stock(product_id)
+    assert quantity == 3
+    assert holds == [{"reservation_id": reservation["_id"], "quantity": 2}]
+
+    assert inventory.cancel(reservation["_id"], user_id)["status"] == CANCELLED
+    assert inventory.cancel(reservation["_id"], user_id)["status"] == CANCELLED
+    assert stock(product_id) == (5, [])
+
+
+def test_sweep_releases_expired_reservations(app):
+    product_id = insert_product(5)
+    reservation = inventory.reserve(ObjectId(), items((product_id, 4)))
+    expire(reservation["_id"])
+
+    assert inventory.sweep() == {"expired": 1, "repaired": 0}
+    assert stock(product_id) == (5, [])
+    assert db.reservations.find_one({"_id": reservation["_id"]})["status"] == EXPIRED
+
+
+def test_checkout_after_expiry_is_gone(app, client):
+    product_id = insert_product(5)
+    user_id = db.users.insert_one({"name": "Buyer", "email": "buyer@example.com", "confirmed": True}).inserted_id
+    token = jwt.encode(
+        {"user_id": str(user_id), "exp": datetime.datetime.utcnow() + datetime.timedelta(hours=1)},
+        app.config["SECRET_KEY"],
+        algorithm="HS256",
+    )
+    headers = {"Authorization": f"Bearer {token}"}
+
+    response = client.post("/api/reservations", json={"items": items((product_id, 1))}, headers=headers)
+    assert response.status_code == 201
+    reservation_id = response.get_json()["reservation"]["id"]
+    expire(ObjectId(reservation_id))
+
+    response = client.post(f"/api/reservations/{reservation_id}/checkout", headers=headers)
+    assert response.status_code == 410
+    assert response.get_json()["reservation_status"] == EXPIRED
+    assert stock(product_id) == (4, [{"reservation_id": ObjectId(reservation_id), "quantity": 1}])
+
+
+def test_sweep_settles_half_settled_reservations(app):
+    product_id = insert_product(5)
+    reservation = inventory.reserve(ObjectId(), items((product_id, 2)))
+    # A process died after cancelling the reservation but before pulling its hold
+    crashed_at = datetime.datetime.utcnow() - datetime.timedelta(minutes=5)
+    db.reservations.update_one(
+        {"_id": reservation["_id"]},
+        {"$set": {"status": CANCELLED, "updated_at": crashed_at}},
+    )
+
+    assert inventory.sweep() == {"expired": 0, "repaired": 1}
+    assert stock(product_id) == (5, [])
+    assert db.reservations.find_one({"_id": reservation["_id"]})["settled"] is True
+    assert inventory.sweep() == {"expired": 0, "repaired": 0}
+    assert stock(product_id) == (5, [])
@@ -0,0 +1,10 @@
+import pytest
+from werkzeug.security import generate_password_hash
+
+from application.utils.passwords import canonical_method
+
+
+@pytest.mark.parametrize("method", ["scrypt", "scrypt:16384:8:1", "pbkdf2", "pbkdf2:sha512", "pbkdf2:sha256:1000"])
+def test_canonical_method_matches_the_stored_prefix(method):
+    # Guards against werkzeug changing its defaults
+    assert canonical_method(method) == generate_password_hash("x", method).split("$", 1)[0]
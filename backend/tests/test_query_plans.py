@@ -0,0 +1,73 @@
+import random
+
+from application import db
+from application.db_init import unbounded_scan, verify_query_plans
+from application.migrations import apply_index_plan, plan_indexes
+from application.routes import prepare_product
+from application.utils.product_query import build_product_query
+from application.utils.profiler import index_scans
+
+CATEGORIES = ["electronics", "books", "home", "toys"]
+
+
+def insert_products(count=200, seed=1):
+    rng = random.Random(seed)
+    products = []
+    for i in range(count):
+        price = round(rng.uniform(5, 500), 2)
+        on_sale = rng.random() < 0.3
+        products.append(prepare_product({
+            "title": f"Product {i}",
+            "price": price,
+            "sale_price": round(price * 0.8, 2) if on_sale else price,
+            "on_sale": on_sale,
+            "description": f"Description of product {i}",
+            "category": rng.choice(CATEGORIES),
+            "quantity": rng.randint(0, 50),
+            "rating": round(rng.uniform(0, 5), 1),
+        }))
+    db.products.insert_many(products)
+
+
+def test_listing_queries_are_index_backed(app):
+    insert_products()
+    apply_index_plan(plan_indexes(), hidden=False)
+
+    assert verify_query_plans() == []
+
+
+def test_range_filter_bounds_the_index_scan(app):
+    insert_products()
+    apply_index_plan(plan_indexes(), hidden=False)
+
+    plan = build_product_query({"min_price": "10", "max_price": "20"})
+    explain = (
+        db.products.find(plan["filter"], plan["projection"])
+        .sort(plan["sort"])
+        .hint(plan["hint"])
+        .explain()
+    )
+    scans = list(index_scans(explain["queryPlanner"]["winningPlan"]))
+    assert scans
+    for scan in scans:
+        assert not unbounded_scan(scan)
+        assert scan["indexBounds"]["price"] == ["[10.0, 20.0]"]
+
+
+def test_unbounded_filter_and_sort_is_rejected(client):
+    response = client.get("/api/products?on_sale=true&sort=price")
+    assert response.status_code == 400
+    assert "min_price/max_price" in response.get_json()["error"]
+
+
+def test_listing_without_indexes_falls_back_to_unhinted_query(client):
+    insert_products(count=30)
+
+    response = client.get("/api/products?sort=price&category=books&size=5")
+    assert response.status_code == 200
+    prices = [product["price"] for product in response.get_json()]
+    assert prices == sorted(prices)
+
+    response = client.get("/api/products?sort=price&cursor=")
+    assert response.status_code == 200
+    assert response.get_json()["next_cursor"]
@@ -0,0 +1,35 @@
+import threading
+
+from application import db
+from application.migrations import apply_index_plan, plan_indexes
+
+USER = {
+    "name": "Maria Silva",
+    "email": "maria@example.com",
+    "password": "Password123",
+    "cpf": "529.982.247-25",
+    "birth_date": "1990-05-17",
+    "phone": "11987654321",
+}
+
+
+def test_concurrent_duplicate_registrations_insert_one_user(app):
+    apply_index_plan(plan_indexes(), hidden=False)
+    attempts = 20
+    start = threading.Barrier(attempts)
+    statuses = []
+
+    def register():
+        client = app.test_client()
+        start.wait()
+        statuses.append(client.post("/api/register", json=USER).status_code)
+
+    threads = [threading.Thread(target=register) for _ in range(attempts)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(statuses) == [201] + [409] * (attempts - 1)
+    assert db.users.count_documents({"email": USER["email"]}) == 1
+
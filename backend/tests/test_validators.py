@@ -0,0 +1,114 @@
+"""
+Error messages and their order are part of the API: clients display them as
+they are. These cases were checked against the hand-written validators the
+schemas replaced.
+"""
+import pytest
+
+from application.validators import PRODUCT_SCHEMA, PROFILE_SCHEMA, USER_SCHEMA
+
+USER = {
+    "name": "Maria Silva",
+    "email": "maria@example.com",
+    "password": "Password123",
+    "cpf": "529.982.247-25",
+    "birth_date": "1990-05-17",
+    "phone": "11987654321",
+}
+
+PRODUCT = {
+    "title": "Desk lamp",
+    "price": "49.90",
+    "description": "Adjustable LED desk lamp",
+    "category": "home",
+    "quantity": "10",
+}
+
+PROFILE = {"name": "Maria", "email": "maria@example.com", "phone": "11987654321"}
+
+
+@pytest.mark.parametrize("data, errors", [
+    (USER, []),
+    ({}, [
+        "Name is required",
+        "Email is required",
+        "Password is required",
+        "Cpf is required",
+        "Birth_date is required",
+        "Phone is required",
+    ]),
+    ({**USER, "email": "not-an-email", "cpf": "111.111.111-11", "phone": "00123",
+      "password": "short", "name": "M", "birth_date": "2020-01-01"}, [
+        "Invalid email format",
+        "Invalid CPF format",
+        "Invalid phone number format",
+        "Password must be at least 8 characters long",
+        "Password must contain at least one uppercase letter",
+        "Password must contain at least one number",
+        "Name must be at least 2 characters long",
+        "User must be at least 13 years old",
+    ]),
+    ({**USER, "birth_date": "17/05/1990", "name": "x" * 101, "password": "alllowercase"}, [
+        "Password must contain at least one uppercase letter",
+        "Password must contain at least one number",
+        "Name must be less than 100 characters",
+        "Invalid birth date format",
+    ]),
+    ({**USER, "name": "", "birth_date": "1800-01-01"}, ["Name is required", "Invalid birth date"]),
+])
+def test_user_errors(data, errors):
+    assert USER_SCHEMA.validate(data) == {"valid": not errors, "errors": errors}
+
+
+@pytest.mark.parametrize("data, errors", [
+    (PRODUCT, []),
+    ({}, [
+        "Title is required",
+        "Price is required",
+        "Description is required",
+        "Category is required",
+        "Quantity is required",
+    ]),
+    ({**PRODUCT, "price": "abc", "quantity": "-1", "title": "ab", "description": "short"}, [
+        "Invalid price format",
+        "Quantity cannot be negative",
+        "Title must be at least 3 characters long",
+        "Description must be at least 10 characters long",
+    ]),
+    ({**PRODUCT, "price": "-5", "sale_price": "10", "rating": "7"}, [
+        "Price must be greater than 0",
+        "Sale price must be less than regular price",
+        "Rating must be between 0 and 5",
+    ]),
+    ({**PRODUCT, "sale_price": "60", "quantity": "x", "rating": "bad"}, [
+        "Sale price must be less than regular price",
+        "Invalid quantity format",
+        "Invalid rating format",
+    ]),
+    ({**PRODUCT, "title": "t" * 201, "description": "d" * 1001, "sale_price": "free"}, [
+        "Invalid sale price format",
+        "Title must be less than 200 characters",
+        "Description must be less than 1000 characters",
+    ]),
+])
+def test_product_errors(data, errors):
+    assert PRODUCT_SCHEMA.validate(data) == {"valid": not errors, "errors": errors}
+
+
+@pytest.mark.parametrize("data, errors", [
+    (PROFILE, []),
+    ({}, ["Name is required", "Email is required", "Phone is required"]),
+    ({"name": "A", "email": "bad", "phone": "123"}, [
+        "Name must be at least 2 characters long",
+        "Invalid email format",
+        "Invalid phone number format",
+    ]),
+    ({**PROFILE, "name": " "}, ["Name must be at least 2 characters long"]),
+])
+def test_profile_errors(data, errors):
+    assert PROFILE_SCHEMA.validate(data) == {"valid": not errors, "errors": errors}
+
+
+def test_validate_many_matches_validate():
+    records = [PRODUCT, {}, {**PRODUCT, "price": "abc"}]
+    assert PRODUCT_SCHEMA.validate_many(records) == [PRODUCT_SCHEMA.validate(record) for record in records]
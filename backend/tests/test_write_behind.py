@@ -0,0 +1,19 @@
+from application import db
+from application.utils.write_behind import WriteBehindBuffer
+
+
+def test_partial_failure_requeues_only_failed_updates(app):
+    good = db.counters.insert_one({"views": 1}).inserted_id
+    bad = db.counters.insert_one({"views": "many"}).inserted_id
+    buffer = WriteBehindBuffer("counters", interval_ms=60000, max_entries=100)
+    buffer.app = app
+
+    buffer.inc(good, {"views": 1})
+    buffer.inc(bad, {"views": 1})
+    assert buffer.flush() == 1
+    assert buffer.stats()["pending"] == 1
+
+    # The failed increment is retried, the applied one is not counted twice
+    assert buffer.flush() == 0
+    assert db.counters.find_one({"_id": good})["views"] == 2
+    assert db.counters.find_one({"_id": bad})["views"] == "many"
@@ -25,7 +25,7 @@ function Grid() {
     useEffect(() => {
         const fetchItems = async () => {
             try {
-                const response = await fetch(`${API_CONFIG.BASE_URL}/products?page=${currentPage}`);
+                const response = await fetch(`${API_CONFIG.BASE_URL}/products?page=${currentPage}&fields=card,description`);
                 const data = await response.json();
                 dispatch(updateItems(data));
             } catch (error) {
@@ -63,7 +63,7 @@ function Grid() {
         <div className="container mx-auto">
             <div className="grid grid-cols-1 sm:grid-cols-2 lg:grid-cols-3 xl:grid-cols-4 gap-4 py-4">
                 {currentItems.map((item) => (
-                    <div key={item._id.$oid} className="bg-white rounded-lg shadow-lg overflow-hidden flex flex-col">
+                    <div key={item._id} className="bg-white rounded-lg shadow-lg overflow-hidden flex flex-col">
                         <div
                             onClick={() => openItemModal(item)}
                             className="flex-grow p-4 flex flex-col justify-between hover:bg-gray-100 cursor-pointer"
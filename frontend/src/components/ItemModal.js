@@ -3,7 +3,7 @@ import { toast } from 'react-toastify';
 
 const handleAddToCart = (item) => {
     const cartItem = {
-        id: item._id.$oid,
+        id: item._id,
         title: item.title,
         price: item.on_sale ? item.sale_price.toFixed(2) : item.price.toFixed(2),
     };
@@ -87,12 +87,12 @@ function ItemModal({ isOpen, onClose, item }) {
                                 <button
                                     onClick={() => handleAddToCart(item)}
                                     type="button"
-                                    className={`w-full inline-flex justify-center rounded-md border border-transparent shadow-sm px-4 py-2 ${cartItems.some((cartItem) => cartItem.id === item._id.$oid)
+                                    className={`w-full inline-flex justify-center rounded-md border border-transparent shadow-sm px-4 py-2 ${cartItems.some((cartItem) => cartItem.id === item._id)
                                         ? 'bg-red-600 text-white hover:bg-red-700'
                                         : 'bg-green-600 text-white hover:bg-green-700'
                                         } text-base font-medium focus:outline-none sm:ml-3 sm:w-auto sm:text-sm`}
                                 >
-                                    {cartItems.some((cartItem) => cartItem.id === item._id.$oid) ? 'Remove' : 'Add'}
+                                    {cartItems.some((cartItem) => cartItem.id === item._id) ? 'Remove' : 'Add'}
                                 </button>
                                 <button
                                     onClick={onClose}